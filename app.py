@@ -5,9 +5,12 @@
 <>
 """
 # Standard library
+import contextlib
 import datetime as dt
+import time
 # Third party
 import pandas as pd
+import plotly.graph_objects as go
 import streamlit as st
 # Local imports
 import backend
@@ -27,9 +30,12 @@ def connect_strava(code: str) -> None:
     None.
 
     """
-    with st.status(label="Downloading data...",
-                   expanded=True,
-                   state="running") as status:
+    status_box = st.container()
+    # the figures drawn while the pages are still arriving
+    preview = st.empty()
+    with status_box, st.status(label="Downloading data...",
+                               expanded=True,
+                               state="running") as status:
         error_message = st.empty()
         # check if a sufficient scope was provided
         status.write("Checking scope")
@@ -45,6 +51,7 @@ def connect_strava(code: str) -> None:
         st.session_state["access_token"]: str = results[0]
         st.session_state["refresh_token"]: str = results[1]
         st.session_state["athlete_name"]: str = results[2]
+        st.session_state["athlete_id"]: int = results[4]
         # check if an access token was returned
         status.write("Checking if token was returned")
         if st.session_state.get("access_token") is None:
@@ -55,10 +62,35 @@ def connect_strava(code: str) -> None:
                           state="error")
             return
         # RETREIVING AND PARSING THE DATA
-        status.write("Retrieving and parsing data")
-        data = backend.thread_get_and_parse(
-            st.session_state.get("access_token")
-                                            )
+        if (wait := backend.LIMITER.expected_wait()) > 0:
+            status.write(f"Waiting about {wait:.0f} seconds for the Strava "
+                         "rate limit")
+        stored, _ = backend.load_snapshot(results[4], backend.STRAVA_COLS)
+        if stored is not None and not stored.empty:
+            # show the stored activities and sync the new ones meanwhile
+            status.write("Loading stored data and syncing new activities")
+            backend.start_sync(st.session_state.get("access_token"),
+                               results[4],
+                               results[3])
+            st.session_state["syncing"]: bool = True
+            data = stored
+        else:
+            status.write("Retrieving and parsing data")
+            try:
+                data = stream_activities(st.session_state.get("access_token"),
+                                         results[3],
+                                         preview,
+                                         results[4])
+            except backend.FetchError as error:
+                data = error.partial
+                if data is None or data.empty:
+                    error_message = st.error(backend.ERROR_MESSAGE2)
+                    status.update(label="Retrieval failed",
+                                  expanded=True,
+                                  state="error")
+                    return
+                # show what was retrieved, the next sync resumes the rest
+                st.session_state["incomplete"]: bool = True
         # FINALIZE THE PROCESS
         # signal that data has been loaded
         st.session_state["loaded"]: bool = True
@@ -69,6 +101,140 @@ def connect_strava(code: str) -> None:
     return
 
 
+def stream_activities(token: str,
+                      creation: str,
+                      preview: st.delta_generator.DeltaGenerator,
+                      athlete_id: int = None) -> pd.DataFrame:
+    """
+    Retrieve the activities with FETCH_STRATEGY and FETCH_ENGINE, with pages
+    on threads page by page, most recent first, and redraw the figures with
+    the activities retrieved so far at most once every STREAM_INTERVAL
+    seconds. The retrieval is cancelled when the session reruns, stops or
+    disconnects. The activities are stored as a snapshot, a partial one when
+    the retrieval did not complete so the next sync resumes it. A session of
+    the same athlete in another tab joins the retrieval in progress instead
+    of starting another one, and leaves storing it to the session running
+    it.
+
+    Parameters
+    ----------
+    token : str
+        Strava access token.
+    creation : str
+        The Strava profile creation date.
+    preview : st.delta_generator.DeltaGenerator
+        The placeholder for the figures.
+    athlete_id : int, optional
+        The id of the athlete to store the activities. The default is None
+        which does not store them.
+
+    Raises
+    ------
+    FetchError
+        When the retrieval fails, with the activities retrieved before as
+        partial.
+
+    Returns
+    -------
+    data : pd.DataFrame
+        Table of all the retrieved activities.
+
+    """
+    frames: list[pd.DataFrame] = []
+    drawn: float = -backend.STREAM_INTERVAL
+    complete: bool = False
+    flight: dict = {}
+    with backend.session_cancel() as cancel,\
+            contextlib.closing(backend.shared_pages(
+                athlete_id,
+                lambda: backend.iter_activities(token, creation, cancel),
+                cancel,
+                flight
+                                                    )) as pages:
+        try:
+            for frame in pages:
+                frames.append(frame)
+                if time.monotonic() - drawn < backend.STREAM_INTERVAL:
+                    continue
+                data = backend.combine_pages(frames)
+                with preview.container():
+                    show_figures(backend.thread_create_figures(
+                        data.reindex(columns=backend.STRAVA_COLS),
+                        creation,
+                        cancel,
+                        st.session_state.get("heatmap", False),
+                        athlete_id
+                                                               ))
+                drawn = time.monotonic()
+            complete = not cancel.is_set()
+        except backend.FetchError as error:
+            # keep the activities retrieved before the failure
+            error.partial = backend.combine_pages(frames)
+            raise
+        finally:
+            # also runs when a rerun or stop interrupts the script, only the
+            # session running the retrieval stores it
+            if flight.get("leader") and (complete or frames):
+                backend.replace_snapshot(athlete_id,
+                                         backend.combine_pages(frames),
+                                         partial=not complete)
+    data = backend.combine_pages(frames)
+    return data
+
+
+def show_figures(figures: list[go.Figure]) -> None:
+    """
+    Show the figures in the top and middle row of the main page.
+
+    Parameters
+    ----------
+    figures : list[go.Figure]
+        The figures created by thread_create_figures.
+
+    Returns
+    -------
+    None.
+
+    """
+    # TOP ROW
+    with st.container():
+        st.plotly_chart(figure_or_data=figures[0],
+                        use_container_width=True,
+                        config=backend.CONFIG)
+    # MIDDLE ROW
+    with st.container():
+        cols = st.columns(spec=[6, 6],
+                          gap="small")
+        cols[0].plotly_chart(figure_or_data=figures[1],
+                             use_container_width=True,
+                             config=backend.CONFIG)
+        subcols = cols[0].columns(spec=[3, 3], gap="small")
+        subcols[0].plotly_chart(figure_or_data=figures[3],
+                                use_container_width=True,
+                                config=backend.CONFIG)
+        subcols[1].plotly_chart(figure_or_data=figures[4],
+                                use_container_width=True,
+                                config=backend.CONFIG)
+        cols[1].plotly_chart(figure_or_data=figures[2],
+                             use_container_width=True,
+                             config=backend.CONFIG2)
+
+
+@st.fragment(run_every=backend.STREAM_INTERVAL)
+def watch_sync() -> None:
+    """
+    Rerun the page once the background sync finished, so its activities are
+    shown without waiting for the next interaction.
+
+    Returns
+    -------
+    None.
+
+    """
+    if backend.sync_done(st.session_state.get("athlete_id")):
+        st.rerun()
+
+
 def wrap_up(data, creation=None) -> None:
     """
 
@@ -110,14 +276,36 @@ def main() -> None:
     params: dict = st.query_params.to_dict()
     code = params.get("code")
     st.session_state["scope"] = params.get("scope")
+    # the choice to look up the countries survives the redirect of Strava
+    if "lookup" not in st.session_state:
+        st.session_state["lookup"]: bool = params.get("state") == "lookup"
     if code and not st.session_state.get("loaded", False):
         connect_strava(code)
+    # pick up the result of the background sync once it is done
+    if st.session_state.get("syncing"):
+        done, synced, error = backend.sync_result(
+            st.session_state.get("athlete_id"))
+        if done:
+            st.session_state["syncing"]: bool = False
+        if error is not None:
+            st.session_state["sync_failed"]: bool = True
+        if synced is not None:
+            st.session_state["dataframe"]: pd.DataFrame = synced
     welcome_text = "Welcome"\
         if not (n := st.session_state.get('athlete_name'))\
         else f"Welcome, {n}"
     df = st.session_state.get("dataframe",
                               pd.DataFrame(columns=backend.STRAVA_COLS)
                               ).loc[:, backend.STRAVA_COLS]
+    pending: int = 0
+    if st.session_state.get("lookup") and not df.empty:
+        # prefer the countries looked up on Nominatim over the offline ones
+        countries, pending = backend.lookup_countries(df["lat"], df["lon"])
+        df = backend.apply_schema(df.assign(
+            country=df["country"].astype(object).mask(
+                pd.notna(countries),
+                pd.Series(countries, index=df.index)
+                                                      )))
     creation = st.session_state.get("creation",
                                     "" if df.empty
                                     else dt.datetime.strftime(
@@ -125,7 +313,14 @@ def main() -> None:
                                         backend.DT_FORMAT
                                                               )
                                     )
-    figures = backend.thread_create_figures(df, creation)
+    with backend.session_cancel() as cancel:
+        figures = backend.thread_create_figures(
+            df,
+            creation,
+            cancel,
+            st.session_state.get("heatmap", False),
+            st.session_state.get("athlete_id")
+                                                )
     with st.spinner("Making visualizations..."):
         # SIDEBAR
         with st.sidebar:
@@ -136,12 +331,18 @@ def main() -> None:
                         unsafe_allow_html=True
                         )
             st.header("Menu")
+            st.toggle(label="Look up countries",
+                      key="lookup",
+                      help=backend.LOOKUP_HELP)
+            st.toggle(label="Route heatmap",
+                      key="heatmap",
+                      help=backend.HEATMAP_HELP)
             if not st.session_state.get("loaded"):
-                st.toggle(label="Look up countries",
-                          value=False)
+                link = backend.authorization_link.strip() +\
+                    ("&state=lookup" if st.session_state.get("lookup") else "")
                 image_connect = backend.load_image(backend.PATH_CONNECT)
                 st.markdown(f"""
-            <a href="{backend.authorization_link}">
+            <a href="{link}">
             <img src='data:image/png;base64,{image_connect}' width='100%'>
             </a>
                     """,
@@ -149,35 +350,28 @@ def main() -> None:
                             )
             else:
                 st.error("connected")
+                if st.session_state.get("syncing"):
+                    st.caption("Syncing new activities...")
+                    watch_sync()
+                if st.session_state.get("incomplete"):
+                    st.warning(backend.ERROR_MESSAGE3)
+                if st.session_state.get("sync_failed"):
+                    st.warning(backend.ERROR_MESSAGE4)
+                if pending:
+                    st.caption(f"Looking up {pending} locations...")
+                if st.button("Delete my stored data"):
+                    backend.delete_snapshot(st.session_state.get("athlete_id"))
+                    st.session_state["syncing"]: bool = False
+                    st.caption("Your stored data was deleted, the activities "
+                               "stay shown until you leave the page.")
             st.divider()
             st.markdown(backend.EXPLANATION)
             if st.button("Show with demo data"):
                 wrap_up(backend.parse(backend.load_test_data()))
 
         # MAIN PAGE
-        # TOP ROW
-        with st.container():
-            st.markdown(f"## {backend.TITLE}: {welcome_text}")
-            st.plotly_chart(figure_or_data=figures[0],
-                            use_container_width=True,
-                            config=backend.CONFIG)
-        # MIDDLE ROW
-        with st.container():
-            cols = st.columns(spec=[6, 6],
-                              gap="small")
-            cols[0].plotly_chart(figure_or_data=figures[1],
-                                 use_container_width=True,
-                                 config=backend.CONFIG)
-            subcols = cols[0].columns(spec=[3, 3], gap="small")
-            subcols[0].plotly_chart(figure_or_data=figures[3],
-                                    use_container_width=True,
-                                    config=backend.CONFIG)
-            subcols[1].plotly_chart(figure_or_data=figures[4],
-                                    use_container_width=True,
-                                    config=backend.CONFIG)
-            cols[1].plotly_chart(figure_or_data=figures[2],
-                                 use_container_width=True,
-                                 config=backend.CONFIG2)
+        st.markdown(f"## {backend.TITLE}: {welcome_text}")
+        show_figures(figures)
         # BOTTOM ROW
         data = df.loc[:, backend.DISPLAY_COLS]
         data["id"] = data["id"].apply(
@@ -193,7 +387,9 @@ def main() -> None:
                                         st.column_config.LinkColumn(
                                             label="view on Strava",
                                             help=backend.HELP_TEXT
-                                                                    )
+                                                                    ),
+                                        "date":
+                                        st.column_config.DateColumn()
                                         }
                          )
         st.caption(backend.CAPTION)
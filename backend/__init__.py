@@ -1,6 +1,9 @@
 from backend.utils import (
+    get_client,
     get_request,
     hr2ang,
+    HTTPClient,
+    json_loads,
     load_category_mapper,
     load_country_code_mapper,
     load_geojson,
@@ -21,6 +24,9 @@ from backend.resources import (
     COLOR_MAP,
     CONFIG,
     CONFIG2,
+    DENSITY_CELL,
+    DENSITY_CHUNK,
+    DENSITY_RADIUS,
     DISCRETE_COLOR,
     DISCRETE_COLOR_R,
     DISPLAY_COLS,
@@ -28,17 +34,49 @@ from backend.resources import (
     EXPLANATION,
     ERROR_MESSAGE1,
     ERROR_MESSAGE2,
+    ERROR_MESSAGE3,
+    ERROR_MESSAGE4,
+    FETCH_ENGINE,
+    FETCH_STRATEGY,
+    FETCH_WORKERS,
+    HEATMAP_HELP,
     HELP_TEXT,
+    HOVER_DATE,
+    HOVER_TIME,
+    LOOKUP_HELP,
     LEFT_RIGHT_MARGIN,
+    LOD_MAX_ZOOM,
+    LOD_PIXELS,
+    MAP_POINTS,
+    MAP_ZOOM,
+    NOMINATIM_CELL,
+    NOMINATIM_INTERVAL,
     NOMINATIM_LINK,
+    NOMINATIM_USER_AGENT,
+    PAGE_WINDOW,
+    PARSE_PROCESSES,
+    PARSE_WORKERS,
     PATH_CODES,
     PATH_CONNECT,
+    PATH_GEOCODE,
     PATH_GEOJSON,
     PATH_LOGO,
     PATH_MAPPER,
+    PATH_ROUTES,
+    PATH_STORE,
+    PER_PAGE,
+    RATE_LIMITS,
+    RECONCILE_DAYS,
+    SNAPSHOT_COMPRESSION,
+    STORE_RETENTION_DAYS,
     STRAVA_CLIENT_ID,
     STRAVA_CLIENT_SECRET,
+    ROUTE_CACHE,
+    ROUTE_SEGMENTS,
+    ROUTE_STORE_POINTS,
     STRAVA_COLS,
+    STRAVA_DTYPES,
+    STREAM_INTERVAL,
     TEMPLATE,
     TITLE,
     TOKEN_LINK,
@@ -46,8 +84,66 @@ from backend.resources import (
     TOP_ROW_HEIGHT
     )
 
+from backend.async_fetch import (
+    AIOHTTP_AVAILABLE,
+    async_get_and_parse,
+    async_get_request
+    )
+
+from backend.ratelimit import (
+    LIMITER,
+    RateLimiter
+    )
+
+from backend.geocode import (
+    CountryIndex,
+    get_country_index,
+    locate_countries
+    )
+
+from backend.nominatim import (
+    cell_keys,
+    GeocodeCache,
+    get_worker,
+    lookup_countries,
+    NominatimWorker,
+    purge_lookups
+    )
+
+from backend.processpool import (
+    get_process_pool,
+    parse_shared
+    )
+
+from backend.routes import (
+    decode_polylines,
+    route_keys,
+    route_latlon,
+    RouteCache,
+    ROUTES,
+    RouteStore,
+    split_routes
+    )
+
+from backend.density import (
+    DENSITY,
+    grid_keys,
+    rasterize_routes,
+    RouteDensity
+    )
+
+from backend.simplify import (
+    LEVELS,
+    mercator,
+    route_significance,
+    RouteLevels,
+    zoom_tolerance
+    )
+
 from backend.strava import (
+    apply_schema,
     get_access,
+    nomatim_lookup,
     parse,
     refresh_access
     )
@@ -61,10 +157,42 @@ from backend.plotly_charts import (
     )
 
 from backend.threadpools import (
+    combine_pages,
+    dispatch_pages,
+    fetch_activities,
+    FetchError,
     get_activities_page,
+    get_activities_window,
+    get_page,
+    iter_activities,
+    iter_get_and_parse,
     parse_page,
+    session_cancel,
+    Stage,
     thread_create_figures,
-    thread_get_and_parse
+    thread_get_and_parse,
+    thread_get_and_parse_windows
+    )
+
+from backend.singleflight import (
+    Flight,
+    FLIGHTS,
+    shared_pages,
+    SingleFlight
+    )
+
+from backend.store import (
+    delete_snapshot,
+    load_snapshot,
+    purge_snapshots,
+    read_activities,
+    replace_snapshot,
+    save_snapshot,
+    start_sync,
+    sync_activities,
+    sync_done,
+    sync_result,
+    write_activities
     )
 
 from backend.test import (
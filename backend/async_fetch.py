@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+The asyncio fetch engine, an alternative to the threads in threadpools that
+waits on the sockets in a single event loop and parses the pages in a thread
+pool shared by all sessions, so the amount of threads does not grow with the
+amount of logins.
+"""
+# Standard library
+import asyncio
+import concurrent.futures as c_futures
+import itertools
+import typing
+# Third party
+import pandas as pd
+try:
+    # optional asynchronous HTTP client for the asyncio engine
+    import aiohttp
+except ImportError:
+    aiohttp = None
+# Local imports
+import backend
+
+AIOHTTP_AVAILABLE: bool = aiohttp is not None
+# the parse workers shared by the event loops of all sessions
+_PARSE_POOL: c_futures.ThreadPoolExecutor = c_futures.ThreadPoolExecutor(
+    max_workers=backend.PARSE_WORKERS,
+    thread_name_prefix="parse"
+                                                                          )
+
+
+async def async_get_request(session: "aiohttp.ClientSession",
+                            url: str,
+                            params: dict = None,
+                            headers: dict = None,
+                            retries: int = 4,
+                            backoff_factor: float = 1) -> dict | list:
+    """
+    The asynchronous counterpart of get_request with the same retry policy as
+    the HTTPClient, honouring the Retry-After header.
+
+    Parameters
+    ----------
+    session : aiohttp.ClientSession
+        The session with the pooled connections.
+    url : str
+        The requested url.
+    params : dict, optional
+        The query string elements. The default is None.
+    headers : dict, optional
+        The HTTP headers. The default is None.
+    retries : int, optional
+        The total number of retries. The default is 4.
+    backoff_factor : float, optional
+        The backoff factor between retries. The default is 1.
+
+    Returns
+    -------
+    dict | list
+        The json response or a dictionary with the status code and reason.
+
+    """
+    for attempt in range(retries + 1):
+        async with session.get(url,
+                               params=params,
+                               headers=headers) as response:
+            backend.LIMITER.update(response.headers)
+            if response.ok:
+                return backend.json_loads(await response.read())
+            if response.status not in (429, 500, 502, 503, 504) or\
+                    attempt == retries:
+                return {str(response.status): response.reason}
+            retry_after: str = response.headers.get("Retry-After", "")
+            await asyncio.sleep(float(retry_after) if retry_after.isdigit()
+                                else backoff_factor * 2 ** attempt)
+    return {}
+
+
+async def _get_and_parse(token: str,
+                         window: int,
+                         per_page: int,
+                         params: dict) -> list[pd.DataFrame]:
+    """
+    Request the pages with window requests in flight and parse them in the
+    shared parse pool. A page that can not be retrieved or parsed ends the
+    retrieval like the last page and fails it afterwards.
+
+    Parameters
+    ----------
+    token : str
+        Strava access token.
+    window : int
+        The amount of pages requested at the same time.
+    per_page : int
+        The amount of activities per page.
+    params : dict
+        Additional query string elements such as after.
+
+    Raises
+    ------
+    FetchError
+        When a page can not be retrieved or parsed, with the activities of
+        the pages before it as partial.
+
+    Returns
+    -------
+    list[pd.DataFrame]
+        The parsed pages in the order of their page numbers.
+
+    """
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    pages: typing.Iterator[int] = itertools.count(1)
+    exhausted: asyncio.Event = asyncio.Event()
+    # the parse of every page and the failure of every page per page number
+    parsing: dict[int, asyncio.Future] = {}
+    errors: dict[int, Exception] = {}
+    header: dict = {"Authorization": f"Bearer {token}"}
+
+    async def worker(session: "aiohttp.ClientSession") -> None:
+        """
+        Request the next page until the last page has been seen.
+
+        Parameters
+        ----------
+        session : aiohttp.ClientSession
+            The session with the pooled connections.
+
+        Returns
+        -------
+        None.
+
+        """
+        while not exhausted.is_set():
+            page: int = next(pages)
+            # wait for the turn of this session within the rate limits
+            # without blocking the event loop, keeping the turn meanwhile
+            with backend.LIMITER.waiting(token):
+                while not backend.LIMITER.try_acquire(token):
+                    await asyncio.sleep(
+                        min(backend.LIMITER.expected_wait(), 1) or .05)
+            try:
+                response: list[dict] | dict = await async_get_request(
+                    session,
+                    backend.ACTIVITIES_LINK,
+                    params={**(params or {}),
+                            "per_page": per_page,
+                            "page": page},
+                    headers=header
+                                                                      )
+            except aiohttp.ClientError as error:
+                response = {"error": str(error)}
+            if isinstance(response, dict):
+                errors[page] = backend.FetchError(
+                    f"Page {page} could not be retrieved: {response}")
+                exhausted.set()
+                return
+            # a short page or an empty page ends the fetch
+            if len(response) < per_page:
+                exhausted.set()
+            if len(response) > 0:
+                parsing[page] = loop.run_in_executor(_PARSE_POOL,
+                                                     backend.parse,
+                                                     response)
+
+    connector = aiohttp.TCPConnector(limit_per_host=window)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker(session) for _ in range(window)))
+    parsed: dict[int, pd.DataFrame | Exception] = dict(zip(
+        parsing,
+        await asyncio.gather(*parsing.values(), return_exceptions=True)))
+    errors.update({page: result for page, result in parsed.items()
+                   if isinstance(result, Exception)})
+    if errors:
+        # hand over the pages that were parsed before the failure
+        failed: int = min(errors)
+        error: Exception = errors[failed]
+        message: str = str(error) if isinstance(error, backend.FetchError)\
+            else f"Page {failed} could not be parsed: {error!r}"
+        raise backend.FetchError(message, backend.combine_pages(
+            [parsed[page] for page in sorted(parsed) if page < failed]
+                                                                )) from error
+    return [parsed[page] for page in sorted(parsed)]
+
+
+def async_get_and_parse(token: str,
+                        window: int = None,
+                        per_page: int = None,
+                        params: dict = None) -> pd.DataFrame:
+    """
+    Use asyncio to send the get requests with bounded concurrency and parse the
+    responses, with the same result as thread_get_and_parse.
+
+    Parameters
+    ----------
+    token : str
+        Strava access token.
+    window : int, optional
+        The amount of pages requested at the same time. The default is None
+        which uses PAGE_WINDOW.
+    per_page : int, optional
+        The amount of activities per page. The default is None which uses
+        PER_PAGE.
+    params : dict, optional
+        Additional query string elements such as after. The default is None.
+
+    Raises
+    ------
+    FetchError
+        When a page can not be retrieved or parsed, with the activities of
+        the pages before it as partial.
+
+    Returns
+    -------
+    total : pd.DataFrame
+        Table of all the retrieved activities.
+
+    """
+    if not AIOHTTP_AVAILABLE:
+        raise ImportError("The asyncio engine requires aiohttp")
+    results: list = asyncio.run(_get_and_parse(token,
+                                               window or backend.PAGE_WINDOW,
+                                               per_page or backend.PER_PAGE,
+                                               params))
+    total: pd.DataFrame = backend.combine_pages(results)
+    return total
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,1276 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+Benchmarks of the app against the local stand-in of the Strava API.
+
+Run from the root of the repository with:
+    python -m backend.benchmark fetch
+    python -m backend.benchmark parse
+    python -m backend.benchmark polyline
+    python -m backend.benchmark geocode
+    python -m backend.benchmark processes
+    python -m backend.benchmark memory
+    python -m backend.benchmark snapshot
+    python -m backend.benchmark routes
+    python -m backend.benchmark coalesce
+    python -m backend.benchmark clock
+    python -m backend.benchmark map
+    python -m backend.benchmark lod
+    python -m backend.benchmark heatmap
+    python -m backend.benchmark timeline
+"""
+# Standard library
+import argparse
+import concurrent.futures as c_futures
+import datetime as dt
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+# Third party
+import numpy as np
+import pandas as pd
+import polyline
+# Local imports
+import backend
+from backend.stand_in import StandInServer, synthetic_activities
+
+
+def _print_table(rows: list[dict]) -> None:
+    """
+    Print the results of a benchmark as an aligned table.
+
+    Parameters
+    ----------
+    rows : list[dict]
+        The results with the same keys in every row.
+
+    Returns
+    -------
+    None.
+
+    """
+    if not rows:
+        return
+    headers: list[str] = list(rows[0])
+    cells: list[list[str]] = [[f"{value:.4g}" if isinstance(value, float)
+                               else str(value) for value in row.values()]
+                              for row in rows]
+    widths: list[int] = [max(len(header), *(len(row[index]) for row in cells))
+                         for index, header in enumerate(headers)]
+    print("  ".join(header.rjust(width)
+                    for header, width in zip(headers, widths)))
+    for row in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def benchmark_fetch(sizes: tuple[int] = (100, 1_000, 10_000, 50_000),
+                    strategy: str = None,
+                    latency: float = 0.05,
+                    jitter: float = 0.01) -> list[dict]:
+    """
+    Measure the end to end time to get access, retrieve and parse a history
+    from the stand-in server, and the connections of the shared HTTP client
+    that were opened and reused for it.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (100, 1_000, 10_000, 50_000).
+    strategy : str, optional
+        The fetch strategy, "pages" or "windows". The default is None which
+        uses FETCH_STRATEGY.
+    latency : float, optional
+        The seconds every response is delayed. The default is 0.05.
+    jitter : float, optional
+        The maximum seconds added to or subtracted from the latency. The
+        default is 0.01.
+
+    Returns
+    -------
+    results : list[dict]
+        The duration, amount of requests, opened and reused connections and
+        throughput per history.
+
+    """
+    results: list[dict] = []
+    for size in sizes:
+        activities: list[dict] = synthetic_activities(size)
+        with StandInServer(activities,
+                           latency=latency,
+                           jitter=jitter) as server:
+            before: dict = backend.get_client().stats()
+            start: float = time.perf_counter()
+            access_token, _, _, created_at, _ = backend.get_access("code")
+            data = backend.fetch_activities(access_token,
+                                            created_at,
+                                            strategy)
+            duration: float = time.perf_counter() - start
+            after: dict = backend.get_client().stats()
+        results.append({"activities": size,
+                        "retrieved": len(data),
+                        "requests": server.requests,
+                        "opened": after["opened"] - before["opened"],
+                        "reused": after["reused"] - before["reused"],
+                        "seconds": duration,
+                        "activities/s": size / duration})
+    return results
+
+
+def _legacy_parse(activities: list[dict]) -> pd.DataFrame:
+    """
+    The former row by row parse of the Strava activities, kept as the
+    reference for the parse benchmark.
+
+    Decode the polyline to coordinates.
+    Reverse lookup the country from start coordinates of the activity.
+
+    Parameters
+    ----------
+    activities : list[dict]
+        List of API responses containing the activities.
+
+    Returns
+    -------
+    dataframe : pd.DataFrame
+        The dataframe containing the parsed activities.
+
+    """
+    # if no activities are provided return an empty dataframe.
+    if activities == [{}]:
+        return pd.DataFrame()
+    parsed_activities: list = []
+    # for each activity
+    for activity in activities:
+        # create timestamp from the local start date
+        timestamp = pd.to_datetime(activity.get("start_date_local"))
+        elements: dict = {"id": activity.get("id"),
+                          "name": activity.get("name"),
+                          "sport_type": activity.get("sport_type"),
+                          "polyline": activity.get("map", {}
+                                                   ).get("summary_polyline"),
+                          "timestamp": timestamp,
+                          "year": timestamp.year,
+                          "week": timestamp.week,
+                          "calender-week":
+                              f"{timestamp.year}-{timestamp.week}",
+                          "date": timestamp.date(),
+                          "weekday": timestamp.weekday(),
+                          "time": timestamp.time(),
+                          "hour": timestamp.hour,
+                          "minutes": timestamp.minute,
+                          }
+        # unpack the starting coordinates to lat and lon
+        elements.update(dict(zip(
+            # keys
+            ["lat", "lon"],
+            # values
+            activity.get("start_latlng",
+                         [None, None]
+                         )
+                                 )
+                             )
+                        )
+        # if there is a polyline for the activity add the individual
+        # coordinates to the activity and lookup the country name
+        if elements.get("polyline"):
+            elements.update({"coords":
+                             polyline.decode(
+                                 # make a raw string from the polyline
+                                 expression=fr"{elements.get('polyline')}",
+                                 # precision which is 5 for Google Maps
+                                 precision=5
+                                             ),
+                             "country":
+                             # provide the function with the coordinates of the
+                             # activity as an unpacked tuple of the coordinates
+                             # after mapping a rounding to 1 decimal and
+                             # filling the strings to the length
+                             # locate_country(*tuple(map(lambda x:
+                             #     # round the string to 1 decimal and store
+                             #     # it
+                             #     (s := str(round(x, 1))).ljust(
+                             #         # fill out the string to the length of
+                             #         # the rounded string plus 2 characters
+                             #         len(s.split(".")[0])+2,
+                             #         # fill character
+                             #         "0"
+                             #                                   ),
+                             #     [elements.get("lat"), elements.get("lon")]
+                             #                            )
+                             #                    )
+                             #                 )
+                             "Poland"
+                             }
+                            )
+        parsed_activities.append(elements)
+    # create a dataframe from the dictionary
+    dataframe: pd.DataFrame = pd.DataFrame(parsed_activities)
+    # add the label Strava to each activity
+    dataframe["app"]: pd.Series = "Strava"
+    return dataframe
+
+
+def _object_schema(parsed: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the parsed activities back to the former dtypes: date and time
+    objects, strings and 64 bit integers.
+
+    Parameters
+    ----------
+    parsed : pd.DataFrame
+        The parsed activities with the dtypes of STRAVA_DTYPES.
+
+    Returns
+    -------
+    pd.DataFrame
+        The activities with the former dtypes.
+
+    """
+    return parsed.assign(**{
+        column: parsed[column].dt.date if column == "date" else
+        parsed[column].dt.time if column == "time" else
+        parsed[column].astype(object) if dtype == "category" else
+        parsed[column].astype("int64") if dtype.startswith("int") else
+        parsed[column]
+        for column, dtype in backend.STRAVA_DTYPES.items()
+        if column in parsed
+                            })
+
+
+def _assert_parsed_equal(parsed: pd.DataFrame,
+                         reference: pd.DataFrame) -> None:
+    """
+    Check that a parsed table has the values of the reference, comparing the
+    decoded polylines with the coordinates of the reference. The country is
+    not compared as the former parser did not locate it.
+
+    Parameters
+    ----------
+    parsed : pd.DataFrame
+        The parsed activities.
+    reference : pd.DataFrame
+        The activities parsed by the reference parser.
+
+    Raises
+    ------
+    AssertionError
+        When the tables differ.
+
+    Returns
+    -------
+    None.
+
+    """
+    columns: list[str] = [column for column in reference.columns
+                          if column not in ("coords", "country")]
+    pd.testing.assert_frame_equal(_object_schema(parsed).loc[:, columns],
+                                  reference.loc[:, columns],
+                                  check_dtype=False)
+    for route, expected in zip(backend.ROUTES.get_many(parsed["polyline"]),
+                               reference["coords"]):
+        np.testing.assert_array_equal(np.column_stack(
+                                          backend.route_latlon(route)),
+                                      np.column_stack(
+                                          backend.route_latlon(expected)))
+
+
+def benchmark_parse(sizes: tuple[int] = (10_000, 50_000, 100_000),
+                    points: int = 20) -> list[dict]:
+    """
+    Measure the cost per activity of parsing a history with parse and with
+    the former row by row parse, and check that both give the same table.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (10_000, 50_000, 100_000).
+    points : int, optional
+        The average amount of points per route. The default is 20.
+
+    Returns
+    -------
+    results : list[dict]
+        The microseconds per activity of both parsers and the speedup per
+        history.
+
+    """
+    results: list[dict] = []
+    for size in sizes:
+        activities: list[dict] = synthetic_activities(size,
+                                                      points=points)
+        start: float = time.perf_counter()
+        legacy: pd.DataFrame = _legacy_parse(activities)
+        legacy_duration: float = time.perf_counter() - start
+        start = time.perf_counter()
+        columnar: pd.DataFrame = backend.parse(activities)
+        duration: float = time.perf_counter() - start
+        _assert_parsed_equal(columnar, legacy)
+        results.append({"activities": size,
+                        "row by row us": legacy_duration / size * 1e6,
+                        "columnar us": duration / size * 1e6,
+                        "speedup": legacy_duration / duration})
+    return results
+
+
+def benchmark_polyline(sizes: tuple[int] = (10_000, 50_000, 100_000),
+                       points: int = 100) -> list[dict]:
+    """
+    Measure the cost per point of decoding the summary polylines in bulk with
+    decode_polylines and one by one with the polyline package, the tests in
+    tests/test_routes.py check that both give the same coordinates.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (10_000, 50_000, 100_000).
+    points : int, optional
+        The average amount of points per route. The default is 100.
+
+    Returns
+    -------
+    results : list[dict]
+        The nanoseconds per point of both decoders and the speedup per
+        history.
+
+    """
+    results: list[dict] = []
+    for size in sizes:
+        polylines: list[str] = [
+            activity["map"]["summary_polyline"]
+            for activity in synthetic_activities(size, points=points)
+                                ]
+        # an empty and a missing route are decoded as empty routes
+        polylines[:2] = ["", None]
+        start: float = time.perf_counter()
+        for line in polylines:
+            if line:
+                polyline.decode(line, 5)
+        reference_duration: float = time.perf_counter() - start
+        start = time.perf_counter()
+        coords, offsets = backend.decode_polylines(polylines)
+        duration: float = time.perf_counter() - start
+        results.append({"activities": size,
+                        "points": len(coords),
+                        "polyline ns": reference_duration / len(coords) * 1e9,
+                        "bulk ns": duration / len(coords) * 1e9,
+                        "speedup": reference_duration / duration})
+    return results
+
+
+def benchmark_geocode(sizes: tuple[int] = (1_000, 10_000, 100_000)
+                      ) -> list[dict]:
+    """
+    Measure the time to locate the countries of the start points of synthetic
+    histories with the offline country index of PATH_GEOJSON, the first
+    lookup includes building the cells of the grid it needs.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (1_000, 10_000, 100_000).
+
+    Raises
+    ------
+    FileNotFoundError
+        When the geojson file is missing.
+
+    Returns
+    -------
+    results : list[dict]
+        The seconds of the first and of a repeated lookup per history.
+
+    """
+    start: float = time.perf_counter()
+    if backend.get_country_index() is None:
+        raise FileNotFoundError(backend.PATH_GEOJSON)
+    print(f"index loaded in {time.perf_counter() - start:.3g} seconds")
+    results: list[dict] = []
+    for size in sizes:
+        activities: list[dict] = synthetic_activities(size, points=1)
+        lat, lon = np.array([activity["start_latlng"] or [np.nan, np.nan]
+                             for activity in activities]).T
+        start = time.perf_counter()
+        countries: np.ndarray = backend.locate_countries(lat, lon)
+        duration: float = time.perf_counter() - start
+        start = time.perf_counter()
+        backend.locate_countries(lat, lon)
+        repeated: float = time.perf_counter() - start
+        results.append({"activities": size,
+                        "countries": len({country for country in countries
+                                          if isinstance(country, str)} -
+                                         {"undefined"}),
+                        "first seconds": duration,
+                        "repeated seconds": repeated})
+    return results
+
+
+def benchmark_processes(sizes: tuple[int] = (10_000, 50_000, 100_000),
+                        processes: tuple[int] = None,
+                        points: int = 100) -> list[dict]:
+    """
+    Measure how parsing the raw pages of a history scales with the amount of
+    parse processes, compared with the parse threads of PARSE_WORKERS, and
+    check that both give the same table. The processes are started and
+    warmed up before the timing.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (10_000, 50_000, 100_000).
+    processes : tuple[int], optional
+        The amounts of processes. The default is None which doubles from 1 to
+        the amount of cores.
+    points : int, optional
+        The average amount of points per route. The default is 100.
+
+    Returns
+    -------
+    results : list[dict]
+        The seconds and activities per second of the threads and of every
+        amount of processes per history.
+
+    """
+    cores: int = os.cpu_count() or 1
+    processes = processes or tuple(2 ** power for power in
+                                   range(cores.bit_length())
+                                   if 2 ** power <= cores)
+    print(f"{cores} cores")
+    histories: dict[int, list[bytes]] = {}
+    for size in sizes:
+        activities: list[dict] = synthetic_activities(size,
+                                                      points=points)
+        histories[size] = [json.dumps(activities[start:start +
+                                                 backend.PER_PAGE]).encode()
+                           for start in range(0, size, backend.PER_PAGE)]
+    results: list[dict] = []
+    with c_futures.ThreadPoolExecutor(backend.PARSE_WORKERS) as threadpool:
+        for size, pages in histories.items():
+            start: float = time.perf_counter()
+            expected: pd.DataFrame = backend.combine_pages(list(threadpool.map(
+                lambda content: backend.parse(backend.json_loads(content)),
+                pages)))
+            duration: float = time.perf_counter() - start
+            results.append({"activities": size,
+                            "parse": f"{backend.PARSE_WORKERS} threads",
+                            "seconds": duration,
+                            "activities/s": size / duration})
+            histories[size] = (pages, expected)
+    for amount in processes:
+        with c_futures.ProcessPoolExecutor(
+                max_workers=amount,
+                mp_context=multiprocessing.get_context("spawn")
+                                           ) as pool, \
+                c_futures.ThreadPoolExecutor(amount) as threadpool:
+            # start every process and import the app in it
+            pages: list[bytes] = histories[sizes[0]][0]
+            list(threadpool.map(lambda content: backend.parse_shared(content,
+                                                                     pool),
+                                pages[:amount] * 2))
+            for size, (pages, expected) in histories.items():
+                start = time.perf_counter()
+                parsed: pd.DataFrame = backend.combine_pages(list(
+                    threadpool.map(
+                        lambda content: backend.parse_shared(content, pool),
+                        pages)))
+                duration = time.perf_counter() - start
+                pd.testing.assert_frame_equal(
+                    parsed.reset_index(drop=True).fillna(np.nan),
+                    expected.reset_index(drop=True).fillna(np.nan))
+                results.append({"activities": size,
+                                "parse": f"{amount} processes",
+                                "seconds": duration,
+                                "activities/s": size / duration})
+    results.sort(key=lambda row: row["activities"])
+    return results
+
+
+def benchmark_memory(sizes: tuple[int] = (10_000, 50_000, 100_000),
+                     points: int = 20) -> list[dict]:
+    """
+    Measure the bytes per activity of the parsed activities with the compact
+    dtypes of STRAVA_DTYPES and with the former object dtypes, per column and
+    in total.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (10_000, 50_000, 100_000).
+    points : int, optional
+        The average amount of points per route. The default is 20.
+
+    Returns
+    -------
+    results : list[dict]
+        The bytes per activity before and after per column and the total per
+        history.
+
+    """
+    results: list[dict] = []
+    for size in sizes:
+        parsed: pd.DataFrame = backend.parse(
+            synthetic_activities(size, points=points))
+        before: pd.Series = _object_schema(parsed).memory_usage(
+            index=False, deep=True)
+        after: pd.Series = parsed.memory_usage(index=False, deep=True)
+        for column in [*backend.STRAVA_DTYPES, "total"]:
+            bytes_before: float = before.sum() if column == "total"\
+                else before[column]
+            bytes_after: float = after.sum() if column == "total"\
+                else after[column]
+            results.append({"activities": size,
+                            "column": column,
+                            "dtype": "" if column == "total"
+                            else str(parsed[column].dtype),
+                            "bytes before": bytes_before / size,
+                            "bytes after": bytes_after / size,
+                            "reduction": 1 - bytes_after / bytes_before})
+    return results
+
+
+def benchmark_snapshot(sizes: tuple[int] = (10_000, 50_000, 100_000),
+                       points: int = 100) -> list[dict]:
+    """
+    Measure the time to load a parsed history from an Arrow snapshot, entirely
+    and only the columns of the table on the dashboard, against decoding and
+    parsing the json of the history again, and check the snapshot gives the
+    same table.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (10_000, 50_000, 100_000).
+    points : int, optional
+        The average amount of points per route. The default is 100.
+
+    Returns
+    -------
+    results : list[dict]
+        The milliseconds to parse, write, read and read the projection and
+        the size of the snapshot per history.
+
+    """
+    results: list[dict] = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            content: bytes = json.dumps(
+                synthetic_activities(size, points=points)
+                                        ).encode()
+            path: str = os.path.join(directory, f"{size}.arrow")
+            start: float = time.perf_counter()
+            parsed: pd.DataFrame = backend.parse(backend.json_loads(content))
+            parse_duration: float = time.perf_counter() - start
+            start = time.perf_counter()
+            backend.write_activities(parsed, path)
+            write_duration: float = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded: pd.DataFrame = backend.read_activities(path)
+            read_duration: float = time.perf_counter() - start
+            start = time.perf_counter()
+            backend.read_activities(path, backend.DISPLAY_COLS)
+            projection_duration: float = time.perf_counter() - start
+            pd.testing.assert_frame_equal(loaded, parsed)
+            results.append({"activities": size,
+                            "parse ms": parse_duration * 1e3,
+                            "write ms": write_duration * 1e3,
+                            "read ms": read_duration * 1e3,
+                            "projection ms": projection_duration * 1e3,
+                            "MB": os.path.getsize(path) / 1e6})
+    return results
+
+
+def _cache_heap(cache: "backend.RouteCache",
+                polylines: list[str]) -> int:
+    """
+    The bytes allocated on the heap by filling a route cache.
+
+    Parameters
+    ----------
+    cache : backend.RouteCache
+        The empty route cache.
+    polylines : list[str]
+        The encoded polylines.
+
+    Returns
+    -------
+    int
+        The bytes still allocated after filling the cache.
+
+    """
+    tracemalloc.start()
+    try:
+        cache.get_many(polylines)
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_routes(sizes: tuple[int] = (10_000, 50_000, 100_000),
+                     points: int = 100) -> list[dict]:
+    """
+    Measure the routes decoded into the heap of the process against the
+    routes of the memory mapped route store: the time to decode, to decode and
+    write them to the store, to load them from the store in a new process and
+    the heap taken by a cache of all routes. The stored routes are checked to
+    equal the decoded routes.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (10_000, 50_000, 100_000).
+    points : int, optional
+        The average amount of points per route. The default is 100.
+
+    Returns
+    -------
+    results : list[dict]
+        The milliseconds and megabytes of the heap per history.
+
+    """
+    results: list[dict] = []
+    for size in sizes:
+        polylines: list[str] = [
+            activity["map"]["summary_polyline"]
+            for activity in synthetic_activities(size, points=points)
+                                ]
+        with tempfile.TemporaryDirectory() as directory:
+            start: float = time.perf_counter()
+            decoded: list = backend.RouteCache(size).get_many(polylines)
+            decode_duration: float = time.perf_counter() - start
+            start = time.perf_counter()
+            backend.RouteCache(size, backend.RouteStore(directory)
+                               ).get_many(polylines)
+            write_duration: float = time.perf_counter() - start
+            # a new store maps the segments like another server process
+            start = time.perf_counter()
+            loaded: list = backend.RouteCache(
+                size,
+                backend.RouteStore(directory)
+                                              ).get_many(polylines)
+            load_duration: float = time.perf_counter() - start
+            for route, expected in zip(loaded, decoded):
+                np.testing.assert_array_equal(route, expected)
+            heap: int = _cache_heap(backend.RouteCache(size), polylines)
+            mapped_heap: int = _cache_heap(
+                backend.RouteCache(size, backend.RouteStore(directory)),
+                polylines
+                                           )
+            del loaded
+        results.append({"activities": size,
+                        "decode ms": decode_duration * 1e3,
+                        "decode and store ms": write_duration * 1e3,
+                        "load ms": load_duration * 1e3,
+                        "heap MB": heap / 1e6,
+                        "mapped heap MB": mapped_heap / 1e6})
+    return results
+
+
+def benchmark_coalesce(sizes: tuple[int] = (1_000, 10_000),
+                       sessions: int = 4,
+                       stagger: float = 0.1,
+                       latency: float = 0.05) -> list[dict]:
+    """
+    Measure the requests and time of several sessions retrieving the history
+    of the same athlete at the same time from the stand-in server, each with
+    its own retrieval and sharing one retrieval through shared_pages, and
+    check that every session gets all activities.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (1_000, 10_000).
+    sessions : int, optional
+        The amount of sessions. The default is 4.
+    stagger : float, optional
+        The seconds between the start of the sessions. The default is 0.1.
+    latency : float, optional
+        The seconds every response is delayed. The default is 0.05.
+
+    Returns
+    -------
+    results : list[dict]
+        The requests, seconds and coalesced retrievals per history and mode.
+
+    """
+
+    def session(key: int | None,
+                delay: float) -> int:
+        """
+        Retrieve the history in a session that starts after a delay.
+
+        Parameters
+        ----------
+        key : int | None
+            The key of the retrieval, None for a retrieval of its own.
+        delay : float
+            The seconds before the session starts.
+
+        Returns
+        -------
+        int
+            The amount of activities retrieved.
+
+        """
+        time.sleep(delay)
+        return len(backend.combine_pages(list(backend.shared_pages(
+            key,
+            lambda: backend.iter_get_and_parse("token")
+                                                                   ))))
+
+    results: list[dict] = []
+    for size in sizes:
+        activities: list[dict] = synthetic_activities(size, points=1)
+        for key in (None, size):
+            with StandInServer(activities,
+                               latency=latency) as server, \
+                    c_futures.ThreadPoolExecutor(sessions) as threadpool:
+                coalesced: int = backend.FLIGHTS.coalesced
+                start: float = time.perf_counter()
+                retrieved: list[int] = list(threadpool.map(
+                    session,
+                    [key] * sessions,
+                    [stagger * index for index in range(sessions)]))
+                duration: float = time.perf_counter() - start
+            assert retrieved == [size] * sessions, retrieved
+            results.append({"activities": size,
+                            "sessions": sessions,
+                            "shared": key is not None,
+                            "requests": server.requests,
+                            "coalesced": backend.FLIGHTS.coalesced -
+                            coalesced,
+                            "seconds": duration})
+    return results
+
+
+def _legacy_hours(original: pd.DataFrame,
+                  plot_height: int) -> "backend.plotly_charts.go.Figure":
+    """
+    The former clock chart that binned the activities on the frame itself
+    and stacked them row by row.
+
+    Parameters
+    ----------
+    original : pd.DataFrame
+        The entire dataframe, which is modified.
+    plot_height : int
+        The height of the plot.
+
+    Returns
+    -------
+    go.Figure
+        The clock chart.
+
+    """
+    original["timestep"] = original["hour"].astype(int)*60 +\
+        original["minutes"]//10
+    original["timestep"] = original["timestep"].apply(backend.min2ang)
+    original.sort_values(by="timestep",
+                         ascending=True,
+                         inplace=True)
+    original["pos"] = 1
+    last = None
+    count = None
+    for index, row in original.loc[:].iterrows():
+        step = row["timestep"]
+        if step != last:
+            last = step
+            count = 1
+            continue
+        count += 1
+        original.loc[index, "pos"] = count
+    return backend.plotly_charts.clock_figure(original,
+                                              title="Hours",
+                                              height=plot_height)
+
+
+def _clock_points(figure: "backend.plotly_charts.go.Figure") -> dict:
+    """
+    The points of a clock chart per trace, ignoring the order of the points
+    of the same bin.
+
+    Parameters
+    ----------
+    figure : go.Figure
+        The clock chart.
+
+    Returns
+    -------
+    dict
+        The sorted pairs of angle and position per trace name.
+
+    """
+    return {trace.name: sorted(zip(trace.theta, trace.r))
+            for trace in figure.data}
+
+
+def benchmark_clock(sizes: tuple[int] = (1_000, 10_000, 50_000)
+                    ) -> list[dict]:
+    """
+    Measure the time of the clock chart with the vectorized binning of hours
+    and with the former row by row stacking and check that both place the
+    same points.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (1_000, 10_000, 50_000).
+
+    Returns
+    -------
+    results : list[dict]
+        The seconds of both versions and the speedup per history.
+
+    """
+    results: list[dict] = []
+    for size in sizes:
+        parsed: pd.DataFrame = backend.parse(
+            synthetic_activities(size, points=1))
+        start: float = time.perf_counter()
+        legacy: "backend.plotly_charts.go.Figure" = _legacy_hours(
+            parsed.copy(), backend.BOTTOM_ROW_HEIGHT)
+        legacy_duration: float = time.perf_counter() - start
+        start = time.perf_counter()
+        clock: "backend.plotly_charts.go.Figure" = backend.hours(
+            parsed, backend.BOTTOM_ROW_HEIGHT)
+        duration: float = time.perf_counter() - start
+        assert _clock_points(clock) == _clock_points(legacy)
+        results.append({"activities": size,
+                        "row by row s": legacy_duration,
+                        "vectorized s": duration,
+                        "speedup": legacy_duration / duration})
+    return results
+
+
+def _legacy_process_data(data: pd.DataFrame) -> dict[list]:
+    """
+    The former flattening of the routes for the world map that extended
+    Python lists point by point for every row.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The dataframe containing rows with a lat and a lon coordinate.
+
+    Returns
+    -------
+    dict[list]
+        A dictionary with the lists of values for the line mapbox.
+
+    """
+    lats, lons, colors, names, dates, times = [], [], [], [], [], []
+    routes = backend.ROUTES.get_many(data["polyline"])
+    for route, (_, row) in zip(routes, data.iterrows()):
+        lat, lon = backend.route_latlon(route)
+        segment_length = len(lat)+1
+        lats.extend([row["lat"]]+list(lat))
+        lons.extend([row["lon"]]+list(lon))
+        colors.extend([row["app"]]*segment_length)
+        names.extend([row["name"]]*segment_length)
+        dates.extend([row["date"]]*segment_length)
+        times.extend([row["time"]]*segment_length)
+        lats.append(None)
+        lons.append(None)
+        colors.append(row["app"])
+        names.append(None)
+        dates.append(None)
+        times.append(None)
+    return {"lat": lats,
+            "lon": lons,
+            "color": colors,
+            "name": names,
+            "date": dates,
+            "time": times}
+
+
+def benchmark_map(sizes: tuple[int] = (1_000, 10_000, 50_000),
+                  points: int = 20) -> list[dict]:
+    """
+    Measure the time of building the world map against the amount of route
+    points, flattening the routes with process_data and with the former
+    lists, and check that both give the same lines.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (1_000, 10_000, 50_000).
+    points : int, optional
+        The average amount of points per route. The default is 20.
+
+    Returns
+    -------
+    results : list[dict]
+        The seconds of flattening the routes with both versions and of
+        building the map from them per history.
+
+    """
+    geojson: dict = {"type": "FeatureCollection", "features": []}
+    countries: pd.DataFrame = pd.DataFrame({"country": [], "count": []})
+    results: list[dict] = []
+    for size in sizes:
+        data: pd.DataFrame = backend.parse(
+            synthetic_activities(size, points=points))
+        # decode the routes beforehand so both versions only flatten them
+        backend.ROUTES.get_many(data["polyline"])
+        durations: list[float] = []
+        flattened: list[dict] = []
+        for process in (_legacy_process_data,
+                        backend.plotly_charts.process_data):
+            start: float = time.perf_counter()
+            lines: dict = process(data)
+            backend.plotly_charts.worldmap_figure(data,
+                                                  countries,
+                                                  geojson,
+                                                  title="Locations",
+                                                  **lines)
+            durations.append(time.perf_counter() - start)
+            flattened.append(lines)
+        legacy, vectorized = flattened
+        for key in ("lat", "lon"):
+            np.testing.assert_array_equal(
+                np.array(legacy[key], dtype=float), vectorized[key])
+        for key in ("color", "name"):
+            assert list(vectorized[key]) == legacy[key], key
+        for key in ("date", "time"):
+            pd.testing.assert_index_equal(pd.DatetimeIndex(vectorized[key]),
+                                          pd.DatetimeIndex(legacy[key]))
+        results.append({"activities": size,
+                        "points": len(vectorized["lat"]),
+                        "row by row s": durations[0],
+                        "vectorized s": durations[1],
+                        "speedup": durations[0] / durations[1]})
+    return results
+
+
+def _douglas_peucker(points: np.ndarray,
+                     tolerance: float) -> np.ndarray:
+    """
+    The reference Douglas-Peucker simplification of one route, splitting
+    the segments one at a time.
+
+    Parameters
+    ----------
+    points : np.ndarray
+        The projected points of the route, of shape (points, 2).
+    tolerance : float
+        The largest distance of a left out point to the simplified route.
+
+    Returns
+    -------
+    keep : np.ndarray
+        Whether each point is kept.
+
+    """
+    keep: np.ndarray = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    segments: list[tuple[int]] = [(0, len(points) - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        direction: np.ndarray = points[last] - points[first]
+        offset: np.ndarray = points[first + 1:last] - points[first]
+        squared: float = direction @ direction
+        fraction: np.ndarray = np.clip(offset @ direction / squared, 0, 1)\
+            if squared > 0 else np.zeros(len(offset))
+        distance: np.ndarray = np.hypot(
+            *(offset - fraction[:, None] * direction).T)
+        middle: int = first + 1 + int(np.argmax(distance))
+        if distance[middle - first - 1] > tolerance:
+            keep[middle] = True
+            segments += [(first, middle), (middle, last)]
+    return keep
+
+
+def benchmark_lod(sizes: tuple[int] = (10_000, 50_000, 100_000),
+                  points: int = 50,
+                  sample: int = 200) -> list[dict]:
+    """
+    Measure the points, the time and the size of the json sent to the
+    browser of the world map with every route point and with the routes
+    simplified for the zoom MAP_ZOOM of the map within the budget of
+    MAP_POINTS, the first time and cached, and check the simplification of a
+    sample of the routes against the reference Douglas-Peucker at several
+    zooms.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (10_000, 50_000, 100_000).
+    points : int, optional
+        The average amount of points per route. The default is 50.
+    sample : int, optional
+        The amount of routes checked against the reference. The default is
+        200.
+
+    Returns
+    -------
+    results : list[dict]
+        The route points, the zoom of the level of detail, the seconds and
+        megabytes of the map per history.
+
+    """
+    geojson: dict = {"type": "FeatureCollection", "features": []}
+    countries: pd.DataFrame = pd.DataFrame({"country": [], "count": []})
+    results: list[dict] = []
+    for size in sizes:
+        data: pd.DataFrame = backend.parse(
+            synthetic_activities(size, points=points))
+        routes: list[np.ndarray] = backend.ROUTES.get_many(data["polyline"])
+        significance: list[np.ndarray] = backend.LEVELS.significance(
+            data["polyline"][:sample])
+        for zoom in (0, 4, 8, 12):
+            tolerance: float = backend.zoom_tolerance(zoom)
+            for route, values in zip(routes[:sample], significance):
+                if len(route):
+                    np.testing.assert_array_equal(
+                        _douglas_peucker(backend.mercator(route), tolerance),
+                        values > tolerance)
+        backend.LEVELS.clear()
+        durations: list[float] = []
+        shipped: list[int] = []
+        payloads: list[int] = []
+        for zoom, budget in ((None, None),
+                             (backend.MAP_ZOOM, backend.MAP_POINTS),
+                             (backend.MAP_ZOOM, backend.MAP_POINTS)):
+            start: float = time.perf_counter()
+            lines: dict = backend.plotly_charts.process_data(
+                data,
+                zoom=zoom,
+                budget=budget
+                                                             )
+            worldmap: "backend.plotly_charts.go.Figure" = \
+                backend.plotly_charts.worldmap_figure(data,
+                                                      countries,
+                                                      geojson,
+                                                      title="Locations",
+                                                      **lines)
+            payloads.append(len(worldmap.to_json()))
+            durations.append(time.perf_counter() - start)
+            shipped.append(int(np.count_nonzero(~np.isnan(lines["lat"]))))
+        _, zoom = backend.LEVELS.fit(data["polyline"],
+                                     backend.MAP_POINTS,
+                                     backend.MAP_ZOOM)
+        assert shipped[1] <= backend.MAP_POINTS + len(data), shipped
+        results.append({"activities": size,
+                        "points": shipped[0],
+                        "simplified": shipped[1],
+                        "zoom": zoom,
+                        "every point MB": payloads[0] / 1e6,
+                        "simplified MB": payloads[1] / 1e6,
+                        "every point s": durations[0],
+                        "first s": durations[1],
+                        "cached s": durations[2]})
+    return results
+
+
+def benchmark_heatmap(sizes: tuple[int] = (10_000, 50_000, 100_000),
+                      points: int = 50) -> list[dict]:
+    """
+    Measure the time and the size of the json sent to the browser of the
+    world map with the simplified lines and with the density heatmap of the
+    routes, the heatmap the first time and cached, and check that the grid
+    counts every cell of every route once.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (10_000, 50_000, 100_000).
+    points : int, optional
+        The average amount of points per route. The default is 50.
+
+    Returns
+    -------
+    results : list[dict]
+        The route points, the cells of the heatmap, the seconds and megabytes
+        of the map per history.
+
+    """
+    geojson: dict = {"type": "FeatureCollection", "features": []}
+    countries: pd.DataFrame = pd.DataFrame({"country": [], "count": []})
+    results: list[dict] = []
+    for size in sizes:
+        data: pd.DataFrame = backend.parse(
+            synthetic_activities(size, points=points))
+        backend.ROUTES.get_many(data["polyline"])
+        backend.DENSITY.clear()
+        durations: list[float] = []
+        payloads: list[int] = []
+        for heatmap in (False, True, True):
+            start: float = time.perf_counter()
+            layer: dict = backend.plotly_charts.process_density(data)\
+                if heatmap else backend.plotly_charts.process_data(
+                    data, zoom=backend.MAP_ZOOM, budget=backend.MAP_POINTS)
+            worldmap: "backend.plotly_charts.go.Figure" = \
+                backend.plotly_charts.worldmap_figure(data,
+                                                      countries,
+                                                      geojson,
+                                                      title="Locations",
+                                                      **layer)
+            payloads.append(len(worldmap.to_json()))
+            durations.append(time.perf_counter() - start)
+        # without merging cells and in smaller chunks
+        grid: dict = backend.DENSITY.grid(data["polyline"],
+                                          budget=np.inf,
+                                          chunk=1_000)
+        assert grid["count"].sum() == sum(
+            map(len, backend.DENSITY.cells(data["polyline"])))
+        results.append({"activities": size,
+                        "points": sum(map(len, backend.ROUTES.get_many(
+                            data["polyline"]))),
+                        "cells": len(worldmap.data[1].z),
+                        "lines MB": payloads[0] / 1e6,
+                        "heatmap MB": payloads[1] / 1e6,
+                        "lines s": durations[0],
+                        "heatmap s": durations[1],
+                        "cached s": durations[2]})
+    return results
+
+
+def _legacy_timeline(original: pd.DataFrame,
+                     plot_height: int,
+                     creation: str) -> "backend.plotly_charts.go.Figure":
+    """
+    The former timeline that parsed a "year-week-1" string per row for the
+    first day of the week and stacked the activities of every week with a
+    groupby apply.
+
+    Parameters
+    ----------
+    original : pd.DataFrame
+        The entire dataframe.
+    plot_height : int
+        The height of the plot.
+    creation : str
+        The creation date of the profile in DT_FORMAT.
+
+    Returns
+    -------
+    go.Figure
+        The timeline.
+
+    """
+
+    def first_day_of_week(table: pd.DataFrame) -> pd.Series:
+        """
+        The Monday of the week of every row, parsed from a string per row.
+        """
+        return pd.to_datetime(table.loc[:, ["year", "week"]].apply(
+            lambda row: f"{row.get('year')}-{row.get('week')}-1", axis=1),
+                              format="%Y-%W-%w")
+
+    def give_position(group: pd.DataFrame) -> pd.DataFrame:
+        """
+        The position of every activity of a week by its date and time.
+        """
+        group = group.sort_values(["date", "time"],
+                                  ascending=[True, True]
+                                  ).reset_index()
+        group["pos"] = group.index
+        return group
+
+    data = original.groupby(["app", "year", "week"], observed=True)["id"]\
+        .count().reset_index().rename({"id": "Times per week"}, axis=1)
+    data["calender-week"] = first_day_of_week(data)
+    dataframe = original.groupby(["year", "week"])[["date", "time", "name"]]\
+        .apply(give_position).reset_index()
+    dataframe["cw"] = first_day_of_week(dataframe)
+    return backend.plotly_charts.timeline_figure(
+        aggregated_data=data,
+        data=dataframe,
+        title="Timeline",
+        height=plot_height,
+        x="calender-week",
+        y="Times per week",
+        group="app",
+        creation_date=dt.datetime.strptime(creation,
+                                           backend.DT_FORMAT).date(),
+        scatter_x="cw",
+        scatter_y="pos",
+        creation=creation
+                                                 )
+
+
+def benchmark_timeline(sizes: tuple[int] = (1_000, 10_000, 100_000)
+                       ) -> list[dict]:
+    """
+    Measure the time of the timeline with the vectorized weeks and stacking
+    and with the former row by row version, and check that both give the
+    same chart.
+
+    Parameters
+    ----------
+    sizes : tuple[int], optional
+        The amounts of activities in the histories. The default is
+        (1_000, 10_000, 100_000).
+
+    Returns
+    -------
+    results : list[dict]
+        The seconds of both versions and the speedup per history.
+
+    """
+    results: list[dict] = []
+    for size in sizes:
+        parsed: pd.DataFrame = backend.parse(
+            synthetic_activities(size, points=1))
+        creation: str = dt.datetime.strftime(parsed["date"].min(),
+                                             backend.DT_FORMAT)
+        start: float = time.perf_counter()
+        legacy: "backend.plotly_charts.go.Figure" = _legacy_timeline(
+            parsed, backend.TOP_ROW_HEIGHT, creation)
+        legacy_duration: float = time.perf_counter() - start
+        start = time.perf_counter()
+        vectorized: "backend.plotly_charts.go.Figure" = backend.timeline(
+            parsed, backend.TOP_ROW_HEIGHT, creation=creation)
+        duration: float = time.perf_counter() - start
+        assert vectorized.to_json() == legacy.to_json()
+        results.append({"activities": size,
+                        "row by row s": legacy_duration,
+                        "vectorized s": duration,
+                        "speedup": legacy_duration / duration})
+    return results
+
+
+BENCHMARKS: dict = {"fetch": benchmark_fetch,
+                    "parse": benchmark_parse,
+                    "polyline": benchmark_polyline,
+                    "geocode": benchmark_geocode,
+                    "processes": benchmark_processes,
+                    "memory": benchmark_memory,
+                    "snapshot": benchmark_snapshot,
+                    "routes": benchmark_routes,
+                    "coalesce": benchmark_coalesce,
+                    "clock": benchmark_clock,
+                    "map": benchmark_map,
+                    "lod": benchmark_lod,
+                    "heatmap": benchmark_heatmap,
+                    "timeline": benchmark_timeline}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmark",
+                        choices=list(BENCHMARKS))
+    parser.add_argument("--sizes",
+                        type=int,
+                        nargs="+",
+                        help="the amounts of activities to benchmark")
+    arguments = parser.parse_args()
+    _print_table(BENCHMARKS[arguments.benchmark](
+        **({"sizes": arguments.sizes} if arguments.sizes else {})))
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+The density of the routes on a grid of cells for the heatmap of the world
+map. Every route is rasterized once into the cells it passes and cached, the
+grid of the history is the count of the routes per cell, added up a chunk of
+routes at a time so its memory is bounded by the amount of cells.
+
+functions:
+    grid_keys
+    rasterize_routes
+
+classes:
+    RouteDensity
+"""
+# Standard library
+import collections
+import threading
+import typing
+# Third party
+import numpy as np
+# Local imports
+import backend
+
+
+def _columns(cell: float) -> int:
+    """
+    The amount of columns of the grid around the world.
+    """
+    return int(np.ceil(360 / cell))
+
+
+def grid_keys(coords: np.ndarray,
+              cell: float) -> np.ndarray:
+    """
+    The keys of the cells of the points.
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        The latitude and longitude of the points, of shape (points, 2).
+    cell : float
+        The size of the cells in degrees.
+
+    Returns
+    -------
+    np.ndarray
+        The key of the cell of every point, the row times the amount of
+        columns plus the column.
+
+    """
+    columns: int = _columns(cell)
+    rows: np.ndarray = np.clip(np.floor((coords[:, 0] + 90) / cell),
+                               0, np.ceil(180 / cell) - 1).astype(np.int64)
+    cols: np.ndarray = np.clip(np.floor((coords[:, 1] + 180) / cell),
+                               0, columns - 1).astype(np.int64)
+    return rows * columns + cols
+
+
+def rasterize_routes(routes: list[np.ndarray],
+                     cell: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The cells every route passes, for all routes at once. The segments of
+    the routes are sampled at steps of at most a cell, so consecutive samples
+    are in the same or in neighbouring cells.
+
+    Parameters
+    ----------
+    routes : list[np.ndarray]
+        The coordinates of the routes, of shape (points, 2).
+    cell : float
+        The size of the cells in degrees.
+
+    Returns
+    -------
+    route : np.ndarray
+        The index of the route of every cell, in ascending order.
+    keys : np.ndarray
+        The keys of the cells, every cell once per route.
+
+    """
+    lengths: np.ndarray = np.fromiter(map(len, routes),
+                                      dtype=np.int64,
+                                      count=len(routes))
+    if not lengths.sum():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    coords: np.ndarray = np.concatenate(routes).reshape(-1, 2)
+    owner: np.ndarray = np.repeat(np.arange(len(routes)), lengths)
+    # the segments between the consecutive points of the same route
+    start: np.ndarray = np.flatnonzero(owner[:-1] == owner[1:])
+    delta: np.ndarray = coords[start + 1] - coords[start]
+    steps: np.ndarray = np.maximum(
+        1, np.ceil(np.abs(delta).max(axis=1, initial=0.) / cell)
+                                   ).astype(np.int64)
+    segment: np.ndarray = np.repeat(np.arange(len(start)), steps)
+    fraction: np.ndarray = (np.arange(steps.sum()) -
+                            np.repeat(np.cumsum(steps) - steps, steps)) /\
+        np.repeat(steps, steps)
+    # the samples along the segments and the last point of every route
+    samples: np.ndarray = np.concatenate((
+        coords[start][segment] + fraction[:, None] * delta[segment],
+        coords))
+    route: np.ndarray = np.concatenate((owner[start][segment], owner))
+    keys: np.ndarray = grid_keys(samples, cell)
+    order: np.ndarray = np.lexsort((keys, route))
+    route, keys = route[order], keys[order]
+    first: np.ndarray = np.ones(len(keys), dtype=bool)
+    first[1:] = (route[1:] != route[:-1]) | (keys[1:] != keys[:-1])
+    return route[first], keys[first]
+
+
+class RouteDensity:
+    """
+    The cells of the routes, shared by all sessions, and the density grid of
+    a history from them. The routes are taken from a route cache and only the
+    routes that are not cached yet are rasterized, so a history that grows
+    by a page only rasterizes the routes of that page.
+
+    Parameters
+    ----------
+    routes : backend.RouteCache
+        The cache of the decoded routes.
+    maxsize : int
+        The amount of routes whose cells are kept before the least recently
+        used are dropped.
+    cell : float
+        The size of the cells in degrees.
+
+    """
+
+    def __init__(self,
+                 routes: "backend.RouteCache",
+                 maxsize: int,
+                 cell: float) -> None:
+        self.routes: "backend.RouteCache" = routes
+        self.maxsize: int = maxsize
+        self.cell: float = cell
+        self.hits: int = 0
+        self.misses: int = 0
+        self._cells: collections.OrderedDict = collections.OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def cells(self,
+              polylines: typing.Iterable[str | None],
+              owner: int | str = None) -> list[np.ndarray]:
+        """
+        The keys of the cells every route passes, rasterizing the routes
+        that are not cached yet at once.
+
+        Parameters
+        ----------
+        polylines : typing.Iterable[str | None]
+            The encoded polylines, a missing polyline is an empty route.
+        owner : int | str, optional
+            The athlete whose routes they are, as for RouteCache.get_many.
+            The default is None.
+
+        Returns
+        -------
+        list[np.ndarray]
+            The keys of the cells of every route.
+
+        """
+        keys: list[str | None] = [line if isinstance(line, str) and line
+                                  else None for line in polylines]
+        found: dict = {}
+        with self._lock:
+            for key in keys:
+                if key is not None and key not in found and\
+                        (cells := self._cells.get(key)) is not None:
+                    self._cells.move_to_end(key)
+                    found[key] = cells
+                    self.hits += 1
+        missing: list[str] = list(dict.fromkeys(
+            key for key in keys if key is not None and key not in found))
+        if missing:
+            route, cells = rasterize_routes(self.routes.get_many(missing,
+                                                                 owner),
+                                            self.cell)
+            splits: np.ndarray = np.cumsum(np.bincount(route,
+                                                       minlength=len(missing)))
+            rasterized: list[np.ndarray] = np.split(cells, splits[:-1])
+            found.update(zip(missing, rasterized))
+            with self._lock:
+                self.misses += len(missing)
+                self._cells.update(zip(missing, rasterized))
+                while len(self._cells) > self.maxsize:
+                    self._cells.popitem(last=False)
+        empty: np.ndarray = np.empty(0, dtype=np.int64)
+        return [empty if key is None else found[key] for key in keys]
+
+    def grid(self,
+             polylines: typing.Sequence[str | None],
+             budget: int = None,
+             chunk: int = None,
+             owner: int | str = None) -> dict[np.ndarray]:
+        """
+        The density grid of the routes: the amount of routes passing every
+        cell. The cells are merged into cells twice as large until there are
+        no more than the budget.
+
+        Parameters
+        ----------
+        polylines : typing.Sequence[str | None]
+            The encoded polylines, a missing polyline is an empty route.
+        budget : int, optional
+            The amount of cells at most. The default is None which uses
+            MAP_POINTS.
+        chunk : int, optional
+            The amount of routes added to the grid at a time. The default is
+            None which uses DENSITY_CHUNK.
+        owner : int | str, optional
+            The athlete whose routes they are, as for RouteCache.get_many.
+            The default is None.
+
+        Returns
+        -------
+        dict[np.ndarray]
+            The lat and lon of the centres of the cells with routes, the
+            count of routes and the size of the cells in degrees.
+
+        """
+        budget = budget or backend.MAP_POINTS
+        chunk = chunk or backend.DENSITY_CHUNK
+        polylines = list(polylines)
+        keys: np.ndarray = np.empty(0, dtype=np.int64)
+        counts: np.ndarray = np.empty(0, dtype=np.int64)
+        for start in range(0, len(polylines), chunk):
+            keys, inverse = np.unique(np.concatenate(
+                [keys] + self.cells(polylines[start:start + chunk], owner)),
+                                      return_inverse=True)
+            counts = np.bincount(
+                inverse,
+                weights=np.concatenate((counts, np.ones(
+                    len(inverse) - len(counts), dtype=np.int64))),
+                minlength=len(keys)
+                                 ).astype(np.int64)
+        rows, cols = np.divmod(keys, _columns(self.cell))
+        factor: int = 1
+        while len(keys) > budget:
+            factor *= 2
+            keys, inverse = np.unique(rows // factor * _columns(self.cell) +
+                                      cols // factor,
+                                      return_inverse=True)
+            counts = np.bincount(inverse,
+                                 weights=counts,
+                                 minlength=len(keys)).astype(np.int64)
+            rows, cols = np.divmod(keys, _columns(self.cell))
+            rows, cols = rows * factor, cols * factor
+        size: float = self.cell * factor
+        return {"lat": (rows + factor / 2) * self.cell - 90,
+                "lon": (cols + factor / 2) * self.cell - 180,
+                "count": counts,
+                "cell": size}
+
+    def info(self) -> dict:
+        """
+        The statistics of the cache.
+
+        Returns
+        -------
+        dict
+            The hits, misses, amount of routes and cells kept.
+
+        """
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "routes": len(self._cells),
+                    "cells": sum(len(cells)
+                                 for cells in self._cells.values())}
+
+    def clear(self) -> None:
+        """
+        Drop the cells of all routes.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            self._cells.clear()
+
+
+DENSITY: RouteDensity = RouteDensity(backend.ROUTES,
+                                     backend.ROUTE_CACHE,
+                                     backend.DENSITY_CELL)
+
+
+if __name__ == "__main__":
+    pass
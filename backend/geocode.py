@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+The offline reverse lookup of the country of coordinates with the country
+polygons of the geojson file, without requests to Nominatim.
+
+functions:
+    get_country_index
+    locate_countries
+
+classes:
+    CountryIndex
+"""
+# Standard library
+import os
+import threading
+# Third party
+import numpy as np
+# Local imports
+import backend
+
+_INDEX: "CountryIndex" = None
+_INDEX_LOADED: bool = False
+_INDEX_LOCK: threading.Lock = threading.Lock()
+
+
+class CountryIndex:
+    """
+    A grid over the country polygons for the reverse lookup of many points at
+    once. Every cell of the grid holds the polygons whose bounding box
+    overlaps it, with only the edges that can be crossed by a ray from a point
+    in the cell. A cell that no edge passes through lies within one country,
+    or none, and its points are assigned without a point in polygon test.
+
+    The cells are built on first use so only the cells with activities cost
+    time and memory.
+
+    Parameters
+    ----------
+    geojson : dict
+        The feature collection of the country polygons.
+    mapper : dict
+        The mapper of country codes to country names, the name of the feature
+        is used for a code that is missing from it.
+    cell : float, optional
+        The size of the cells in degrees. The default is 1.
+
+    """
+
+    def __init__(self,
+                 geojson: dict,
+                 mapper: dict,
+                 cell: float = 1.) -> None:
+        self.cell: float = cell
+        self.names: list[str] = []
+        # the edges of every polygon as rows of lon1, lat1, lon2, lat2
+        self.edges: list[np.ndarray] = []
+        for feature in geojson.get("features", []):
+            properties: dict = feature.get("properties") or {}
+            geometry: dict = feature.get("geometry") or {}
+            name: str = mapper.get(str(properties.get("ISO_A2", "")).upper(),
+                                   properties.get("ADMIN", "undefined"))
+            polygons: list = [geometry.get("coordinates", [])]\
+                if geometry.get("type") == "Polygon" else\
+                geometry.get("coordinates", [])
+            for polygon in polygons:
+                # the holes are handled by counting the crossings of all rings
+                rings: list[np.ndarray] = [np.asarray(ring, dtype=float)[:, :2]
+                                           for ring in polygon if len(ring)]
+                if not rings:
+                    continue
+                self.names.append(name)
+                self.edges.append(np.vstack(
+                    [np.hstack((ring[:-1], ring[1:])) for ring in rings]))
+        self.bounds: np.ndarray = np.array(
+            [[edges[:, [0, 2]].min(), edges[:, [1, 3]].min(),
+              edges[:, [0, 2]].max(), edges[:, [1, 3]].max()]
+             for edges in self.edges]).reshape(-1, 4)
+        self._cells: dict = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def _inside(lon: np.ndarray,
+                lat: np.ndarray,
+                edges: np.ndarray) -> np.ndarray:
+        """
+        Test which points are inside a polygon by counting the edges crossed
+        by a ray towards the east.
+
+        Parameters
+        ----------
+        lon : np.ndarray
+            The longitudes of the points.
+        lat : np.ndarray
+            The latitudes of the points.
+        edges : np.ndarray
+            The edges of the polygon as rows of lon1, lat1, lon2, lat2.
+
+        Returns
+        -------
+        np.ndarray
+            Whether each point is inside the polygon.
+
+        """
+        inside: np.ndarray = np.zeros(len(lon), dtype=bool)
+        # limit the size of the points by edges arrays
+        step: int = max(1, 2_000_000 // max(1, len(edges)))
+        x1, y1, x2, y2 = (edges[:, index] for index in range(4))
+        for start in range(0, len(lon), step):
+            x: np.ndarray = lon[start:start + step, None]
+            y: np.ndarray = lat[start:start + step, None]
+            spans: np.ndarray = (y1 > y) != (y2 > y)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossing: np.ndarray = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            inside[start:start + step] = np.count_nonzero(
+                spans & (x < crossing), axis=1) % 2 == 1
+        return inside
+
+    def _build(self, key: tuple[int]) -> list[tuple] | int:
+        """
+        Build a cell of the grid.
+
+        Parameters
+        ----------
+        key : tuple[int]
+            The column and row of the cell.
+
+        Returns
+        -------
+        list[tuple] | int
+            The polygons with their edges that matter for the cell, or the
+            index of the polygon that covers the entire cell, -1 for none.
+
+        """
+        west: float = key[0] * self.cell
+        south: float = key[1] * self.cell
+        east: float = west + self.cell
+        north: float = south + self.cell
+        candidates: list[tuple] = []
+        crossed: bool = False
+        overlapping: np.ndarray = np.flatnonzero(
+            (self.bounds[:, 0] <= east) & (self.bounds[:, 2] >= west) &
+            (self.bounds[:, 1] <= north) & (self.bounds[:, 3] >= south))
+        for index in overlapping:
+            edges: np.ndarray = self.edges[index]
+            low: np.ndarray = np.minimum(edges[:, 1], edges[:, 3])
+            high: np.ndarray = np.maximum(edges[:, 1], edges[:, 3])
+            # the edges within the latitudes of the cell east of its west side
+            edges = edges[(low <= north) & (high >= south) &
+                          (np.maximum(edges[:, 0], edges[:, 2]) >= west)]
+            if len(edges) == 0:
+                continue
+            candidates.append((index, edges))
+            crossed = crossed or bool(np.any(
+                np.minimum(edges[:, 0], edges[:, 2]) <= east))
+        if crossed:
+            return candidates
+        # no edge passes through the cell so its centre decides for all points
+        centre: tuple[np.ndarray] = (np.array([west + self.cell / 2]),
+                                     np.array([south + self.cell / 2]))
+        for index, edges in candidates:
+            if self._inside(*centre, edges)[0]:
+                return int(index)
+        return -1
+
+    def _get_cell(self, key: tuple[int]) -> list[tuple] | int:
+        """
+        Get a cell of the grid, building it on first use.
+
+        Parameters
+        ----------
+        key : tuple[int]
+            The column and row of the cell.
+
+        Returns
+        -------
+        list[tuple] | int
+            The cell as returned by _build.
+
+        """
+        with self._lock:
+            if key not in self._cells:
+                self._cells[key] = self._build(key)
+            return self._cells[key]
+
+    def lookup(self,
+               lat: np.ndarray,
+               lon: np.ndarray) -> np.ndarray:
+        """
+        Locate the country of every point.
+
+        Parameters
+        ----------
+        lat : np.ndarray
+            The latitudes of the points.
+        lon : np.ndarray
+            The longitudes of the points.
+
+        Returns
+        -------
+        countries : np.ndarray
+            The country names, "undefined" for a point outside every country
+            and NaN for a missing coordinate.
+
+        """
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        polygon: np.ndarray = np.full(len(lat), -1)
+        valid: np.ndarray = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        columns: np.ndarray = np.floor(lon[valid] / self.cell).astype(int)
+        rows: np.ndarray = np.floor(lat[valid] / self.cell).astype(int)
+        keys: np.ndarray = np.stack((columns, rows), axis=1)
+        # handle the points per cell
+        cells, groups = np.unique(keys, axis=0, return_inverse=True)
+        order: np.ndarray = np.argsort(groups.ravel(), kind="stable")
+        splits: np.ndarray = np.cumsum(np.bincount(groups.ravel(),
+                                                   minlength=len(cells)))[:-1]
+        for key, members in zip(cells, np.split(valid[order], splits)):
+            cell: list[tuple] | int = self._get_cell(tuple(key))
+            if isinstance(cell, int):
+                polygon[members] = cell
+                continue
+            for index, edges in cell:
+                # only test the points that were not located yet
+                members = members[polygon[members] == -1]
+                if len(members) == 0:
+                    break
+                inside: np.ndarray = self._inside(lon[members],
+                                                  lat[members],
+                                                  edges)
+                polygon[members[inside]] = index
+        names: np.ndarray = np.array(self.names + ["undefined"],
+                                     dtype=object)
+        countries: np.ndarray = names[polygon]
+        countries[np.isnan(lat) | np.isnan(lon)] = np.nan
+        return countries
+
+
+def get_country_index() -> CountryIndex | None:
+    """
+    Get the process wide country index, loading the polygons of PATH_GEOJSON
+    on first use.
+
+    Returns
+    -------
+    CountryIndex | None
+        The shared country index, None if the geojson file is missing.
+
+    """
+    global _INDEX, _INDEX_LOADED
+    with _INDEX_LOCK:
+        if not _INDEX_LOADED:
+            _INDEX_LOADED = True
+            if os.path.exists(backend.PATH_GEOJSON):
+                _INDEX = CountryIndex(
+                    backend.load_geojson(backend.PATH_GEOJSON),
+                    backend.strava.COUNTRIES
+                                      )
+    return _INDEX
+
+
+def locate_countries(lat: np.ndarray,
+                     lon: np.ndarray) -> np.ndarray:
+    """
+    Locate the countries of the points in one pass over the country index.
+
+    Parameters
+    ----------
+    lat : np.ndarray
+        The latitudes of the points.
+    lon : np.ndarray
+        The longitudes of the points.
+
+    Returns
+    -------
+    np.ndarray
+        The country names, "undefined" if the point is outside every country
+        or the geojson file is missing, and NaN for a missing coordinate.
+
+    """
+    index: CountryIndex | None = get_country_index()
+    if index is None:
+        missing: np.ndarray = np.isnan(np.asarray(lat, dtype=float))
+        return np.where(missing, np.nan, np.array("undefined", dtype=object))
+    return index.lookup(lat, lon)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+The persistent cache of the country lookups on the Nominatim API and the
+single background worker that fills it within the usage policy of one request
+per second.
+
+functions:
+    cell_keys
+    get_worker
+    lookup_countries
+    purge_lookups
+
+classes:
+    GeocodeCache
+    NominatimWorker
+"""
+# Standard library
+import contextlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import typing
+# Third party
+import numpy as np
+# Local imports
+import backend
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+_WORKER: "NominatimWorker" = None
+_WORKER_LOCK: threading.Lock = threading.Lock()
+
+
+def cell_keys(lat: np.ndarray,
+              lon: np.ndarray,
+              cell: float = None) -> np.ndarray:
+    """
+    Quantize the coordinates to the cells that share a lookup.
+
+    Parameters
+    ----------
+    lat : np.ndarray
+        The latitudes.
+    lon : np.ndarray
+        The longitudes.
+    cell : float, optional
+        The size of the cells in degrees. The default is None which uses
+        NOMINATIM_CELL.
+
+    Returns
+    -------
+    np.ndarray
+        The key of the cell of every coordinate, None for a missing
+        coordinate.
+
+    """
+    cell = cell or backend.NOMINATIM_CELL
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    missing: np.ndarray = np.isnan(lat) | np.isnan(lon)
+    rows: np.ndarray = np.floor(np.nan_to_num(lat) / cell).astype(int)
+    columns: np.ndarray = np.floor(np.nan_to_num(lon) / cell).astype(int)
+    keys: np.ndarray = np.char.add(np.char.add(rows.astype(str), ":"),
+                                   columns.astype(str)).astype(object)
+    keys[missing] = None
+    return keys
+
+
+class GeocodeCache:
+    """
+    The countries of the looked up cells in a SQLite database, shared by all
+    sessions and kept between restarts.
+
+    Parameters
+    ----------
+    path : str
+        The file path of the database.
+
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self._lock: threading.Lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock, self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS cells "
+                               "(key TEXT PRIMARY KEY, "
+                               "country TEXT, "
+                               "looked_up REAL)")
+
+    @contextlib.contextmanager
+    def _connect(self) -> typing.Iterator[sqlite3.Connection]:
+        """
+        Open a connection to the database for one transaction.
+
+        Yields
+        ------
+        sqlite3.Connection
+            The connection, closed when leaving the context.
+
+        """
+        connection: sqlite3.Connection = sqlite3.connect(self.path,
+                                                         timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get_many(self, keys: typing.Iterable[str]) -> dict[str, str]:
+        """
+        The countries of the cells that were looked up.
+
+        Parameters
+        ----------
+        keys : typing.Iterable[str]
+            The keys of the cells.
+
+        Returns
+        -------
+        found : dict[str, str]
+            The country per key of the cells that were looked up.
+
+        """
+        keys = list(keys)
+        found: dict[str, str] = {}
+        with self._lock, self._connect() as connection:
+            # stay below the maximum amount of variables of SQLite
+            for start in range(0, len(keys), 500):
+                chunk: list[str] = keys[start:start + 500]
+                found.update(connection.execute(
+                    "SELECT key, country FROM cells WHERE key IN "
+                    f"({', '.join('?' * len(chunk))})",
+                    chunk
+                                                ).fetchall())
+        return found
+
+    def put(self,
+            key: str,
+            country: str) -> None:
+        """
+        Store the country of a cell.
+
+        Parameters
+        ----------
+        key : str
+            The key of the cell.
+        country : str
+            The country name.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock, self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO cells VALUES (?, ?, ?)",
+                               (key, country, time.time()))
+
+    def prune(self, retention_days: float) -> int:
+        """
+        Delete the cells that were looked up before the retention period, a
+        later visit looks them up again.
+
+        Parameters
+        ----------
+        retention_days : float
+            The days a lookup is kept.
+
+        Returns
+        -------
+        int
+            The amount of deleted cells.
+
+        """
+        with self._lock, self._connect() as connection:
+            return connection.execute(
+                "DELETE FROM cells WHERE looked_up < ?",
+                (time.time() - retention_days * 86400,)
+                                      ).rowcount
+
+
+class NominatimWorker:
+    """
+    The single thread that looks up the cells on the Nominatim API one at a
+    time, at most one request every NOMINATIM_INTERVAL seconds for the entire
+    process, and stores the results in the cache.
+
+    Parameters
+    ----------
+    cache : GeocodeCache
+        The cache receiving the countries.
+    interval : float, optional
+        The minimum seconds between two requests. The default is None which
+        uses NOMINATIM_INTERVAL.
+
+    """
+
+    def __init__(self,
+                 cache: GeocodeCache,
+                 interval: float = None) -> None:
+        self.cache: GeocodeCache = cache
+        self.interval: float = interval or backend.NOMINATIM_INTERVAL
+        self.requests: int = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._pending: set = set()
+        self._lock: threading.Lock = threading.Lock()
+        self._last: float = -np.inf
+        self._thread: threading.Thread = threading.Thread(target=self._run,
+                                                          name="nominatim",
+                                                          daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """
+        The amount of cells waiting for a lookup.
+        """
+        with self._lock:
+            return len(self._pending)
+
+    def submit(self, cells: typing.Iterable[tuple[str, float, float]]
+               ) -> None:
+        """
+        Queue the cells for a lookup, skipping the cells already queued.
+
+        Parameters
+        ----------
+        cells : typing.Iterable[tuple[str, float, float]]
+            The key of every cell with the latitude and longitude of the
+            point in it that is looked up.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            for key, lat, lon in cells:
+                if key not in self._pending:
+                    self._pending.add(key)
+                    self._queue.put((key, lat, lon))
+
+    def _run(self) -> None:
+        """
+        Look up the queued cells forever.
+
+        Returns
+        -------
+        None.
+
+        """
+        while True:
+            key, lat, lon = self._queue.get()
+            try:
+                if not self.cache.get_many([key]):
+                    self._lookup(key, lat, lon)
+            except Exception as error:
+                # leave the cell out of the cache to try again later
+                LOGGER.warning("Lookup of cell %s failed: %s", key, error)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def _lookup(self,
+                key: str,
+                lat: float,
+                lon: float) -> None:
+        """
+        Look up the country of a cell at a point of an activity in it within
+        the rate limit. The centre of the cell may be at sea or across a
+        border for the activities near a coast or a border.
+
+        Parameters
+        ----------
+        key : str
+            The key of the cell.
+        lat : float
+            The latitude of the point in the cell.
+        lon : float
+            The longitude of the point in the cell.
+
+        Returns
+        -------
+        None.
+
+        """
+        time.sleep(max(0., self._last + self.interval - time.monotonic()))
+        self.requests += 1
+        try:
+            response: dict = backend.nomatim_lookup(f"{lat:.4f}",
+                                                    f"{lon:.4f}")
+        finally:
+            # count the interval from the end of the request to be safe
+            self._last = time.monotonic()
+        if "address" in response:
+            country_code: str = response["address"].get("country_code", "")
+            self.cache.put(key, backend.strava.COUNTRIES.get(
+                country_code.upper(), "undefined"))
+        elif "error" in response:
+            # a location outside every country, such as the sea
+            self.cache.put(key, "undefined")
+
+
+def get_worker() -> NominatimWorker:
+    """
+    Get the process wide Nominatim worker, starting it on first use with the
+    cache at PATH_GEOCODE.
+
+    Returns
+    -------
+    NominatimWorker
+        The shared worker.
+
+    """
+    global _WORKER
+    with _WORKER_LOCK:
+        if _WORKER is None:
+            _WORKER = NominatimWorker(GeocodeCache(backend.PATH_GEOCODE))
+    return _WORKER
+
+
+def lookup_countries(lat: np.ndarray,
+                     lon: np.ndarray) -> tuple[np.ndarray, int]:
+    """
+    Look up the countries of many coordinates at once. The coordinates are
+    quantized to cells and deduplicated, the cells in the cache are answered
+    directly and the others are queued for the background worker with the
+    first coordinate in them, so a later call finds them.
+
+    Parameters
+    ----------
+    lat : np.ndarray
+        The latitudes.
+    lon : np.ndarray
+        The longitudes.
+
+    Returns
+    -------
+    countries : np.ndarray
+        The country names, NaN for a missing coordinate, a cell that was not
+        looked up yet or a cell outside every country, so these keep the
+        offline country.
+    pending : int
+        The amount of cells still waiting for a lookup in the process.
+
+    """
+    worker: NominatimWorker = get_worker()
+    keys: np.ndarray = cell_keys(lat, lon)
+    # the first coordinate of every cell is the point that is looked up
+    points: dict[str, tuple] = {}
+    for key, point in zip(keys, zip(lat, lon)):
+        if key is not None:
+            points.setdefault(key, point)
+    found: dict[str, str] = worker.cache.get_many(points)
+    worker.submit((key, *point) for key, point in points.items()
+                  if key not in found)
+    countries: np.ndarray = np.array([found.get(key, np.nan) for key in keys],
+                                     dtype=object)
+    # a cell outside every country keeps the offline country
+    countries[countries == "undefined"] = np.nan
+    return countries, worker.pending
+
+
+def purge_lookups(retention_days: float = None) -> int:
+    """
+    Delete the lookups older than the retention period from the cache at
+    PATH_GEOCODE, without creating it when there is none.
+
+    Parameters
+    ----------
+    retention_days : float, optional
+        The days a lookup is kept. The default is None which uses
+        STORE_RETENTION_DAYS.
+
+    Returns
+    -------
+    int
+        The amount of deleted cells.
+
+    """
+    retention_days = retention_days or backend.STORE_RETENTION_DAYS
+    with _WORKER_LOCK:
+        cache: GeocodeCache | None = _WORKER.cache if _WORKER else None
+    if cache is None:
+        if not os.path.exists(backend.PATH_GEOCODE):
+            return 0
+        cache = GeocodeCache(backend.PATH_GEOCODE)
+    return cache.prune(retention_days)
+
+
+if __name__ == "__main__":
+    pass
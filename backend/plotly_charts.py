@@ -16,6 +16,7 @@ preprocessing and graph functions:
     hours -> clock_figure
     types -> sunburst_figure
     locations -> process_data -> worldmap_figure
+    locations -> process_density -> worldmap_figure
 
 """
 # Standard library
@@ -23,6 +24,7 @@ import datetime as dt
 import math
 import typing
 # Third party
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -129,46 +131,32 @@ def _update_layout(fig: go.Figure,
     return fig
 
 
-def give_position(group):
+def first_day_of_week(table: pd.DataFrame) -> pd.Series:
     """
-
-
-    Parameters
-    ----------
-    group : TYPE
-        DESCRIPTION.
-
-    Returns
-    -------
-    group : TYPE
-        DESCRIPTION.
-
-    """
-    group = group.sort_values(["date", "time"],
-                              ascending=[True, True]
-                              ).reset_index()
-    group["pos"] = group.index
-    return group
-
-
-def first_day_of_week(table):
-    """
-
+    The Monday of the week of every row, like parsing "year-week-1" with the
+    format "%Y-%W-%w" but with date arithmetic on the entire columns: week 1
+    starts on the first Monday of the year.
 
     Parameters
     ----------
-    table : TYPE
-        DESCRIPTION.
+    table : pd.DataFrame
+        The dataframe with the year and week columns.
 
     Returns
     -------
-    column : TYPE
-        DESCRIPTION.
-
-    """
-    column = pd.to_datetime(table.loc[:, ["year", "week"]].apply(
-        lambda row: f"{row.get('year')}-{row.get('week')}-1", axis=1),
-                                format="%Y-%W-%w")
+    column : pd.Series
+        The date of the Monday of the week.
+
+    """
+    year = table["year"].to_numpy(dtype=np.int64)
+    week = table["week"].to_numpy(dtype=np.int64)
+    new_year = (year - 1970).astype("datetime64[Y]").astype("datetime64[D]")
+    # the weekday of the first of January with Monday as 0, 1970 began on
+    # a Thursday
+    weekday = (new_year.astype(np.int64) + 3) % 7
+    column = pd.Series(new_year + ((7 - weekday) % 7 + 7 * (week - 1)),
+                       index=table.index,
+                       dtype="datetime64[ns]")
     return column
 
 
@@ -232,13 +220,16 @@ def timeline(original: pd.DataFrame,
     # prepare data
     summarize_name = "Times per week"
     name = "calender-week"
-    data = original.groupby(["app", "year", "week"])["id"]\
+    data = original.groupby(["app", "year", "week"], observed=True)["id"]\
         .count().reset_index().rename({"id": summarize_name},
                                       axis=1)
     data[name] = first_day_of_week(data)
 
-    dataframe = original.groupby(["year", "week"])[["date", "time", "name"]]\
-        .apply(give_position).reset_index()
+    # stack the activities of every week in the order of their date and time
+    dataframe = original.loc[:, ["year", "week", "date", "time", "name"]]\
+        .sort_values(["year", "week", "date", "time"], kind="stable")\
+        .reset_index(drop=True)
+    dataframe["pos"] = dataframe.groupby(["year", "week"]).cumcount()
     dataframe["cw"] = first_day_of_week(dataframe)
 
     # make creation_
@@ -311,9 +302,15 @@ def timeline_figure(aggregated_data: pd.DataFrame,
                      **kwargs.get("area", {})
                      )
     figure.update_traces(hovertemplate="Activity on %{customdata[0]}")
-    figure.add_scatter(customdata=data.loc[:, ["name", "date"]].values,
-                       hovertemplate="""
-                       <b>%{customdata[0]}</b><br>%{customdata[1]}
+    # dates as strings spare plotly a deep copy of a timestamp per activity
+    figure.add_scatter(customdata=np.column_stack((
+                           data["name"].to_numpy(dtype=object),
+                           np.datetime_as_string(
+                               data["date"].to_numpy(dtype="datetime64[s]"))
+                                                   )),
+                       hovertemplate=f"""
+                       <b>%{{customdata[0]}}</b><br>
+                       %{{customdata[1]|{backend.HOVER_DATE}}}
                        """,
                        marker={"size": 3},
                        mode="markers",  # select drawing mode
@@ -371,7 +368,8 @@ def days(original: pd.DataFrame,
 
     plot_title = "Weekdays"
     # prepare data
-    data = original.groupby(["app", "weekday"])["id"].count().reset_index()
+    data = original.groupby(["app", "weekday"], observed=True)["id"]\
+        .count().reset_index()
     data["percentage"] = data["id"] / original.shape[0]
     # create figure
     weekdays = weekdays_figure(data,
@@ -471,31 +469,26 @@ def hours(original: pd.DataFrame,
     """
     plot_title = "Hours"
     # prepare data
-    original["timestep"] = original["hour"]*60 + original["minutes"]//10
-    original["timestep"] = original["timestep"].apply(backend.min2ang)
-    # original = original.groupby(["app", "timestep"])[["date", "time", "name"]].apply(give_position).reset_index()
-    # print(f"{original.columns=}")
-    original.sort_values(by="timestep",
-                          ascending=True,
-                          inplace=True)
-    original["pos"] = 1
-    last = None
-    count = None
-    for index, row in original.loc[:].iterrows():
-        step = row["timestep"]
-        if step != last:
-            last = step
-            count = 1
-            continue
-        count += 1
-        original.loc[index, "pos"] = count
+    # the frame is shared with the other charts so work on a copy of the
+    # columns of the clock
+    data = original.loc[:, ["app", "name", "time"]]
+    # bins of 10 minutes, widen the small integers before they overflow
+    data["timestep"] = backend.min2ang(
+        original["hour"].to_numpy(dtype=int)*60 +
+        original["minutes"].to_numpy(dtype=int)//10
+                                       )
+    data = data.sort_values(by="timestep",
+                            ascending=True,
+                            kind="stable")
+    # stack the activities of a bin outwards in the order of the history
+    data["pos"] = data.groupby("timestep").cumcount() + 1
     # create figure
-    clock = clock_figure(original,
+    clock = clock_figure(data,
                          title=plot_title,
                          height=plot_height,
                          **kwargs)
     # show empty figure if no data is provided
-    if original.empty:
+    if data.empty:
         clock = _add_annotation(clock)
     return clock
 
@@ -538,8 +531,9 @@ def clock_figure(preprocessed_data: pd.DataFrame,
                               height=height,
                               **kwargs
                               )
-    figure.update_traces(hovertemplate="""
-                         <b>%{customdata[0]}</b><br>%{customdata[1]}
+    figure.update_traces(hovertemplate=f"""
+                         <b>%{{customdata[0]}}</b><br>
+                         %{{customdata[1]|{backend.HOVER_TIME}}}
                          """)
     max_axis = 0 if preprocessed_data.empty \
         else int(preprocessed_data["pos"].max())
@@ -547,8 +541,9 @@ def clock_figure(preprocessed_data: pd.DataFrame,
     figure.update_layout(polar={"radialaxis": {"tickvals":
                                                list(range(0, max_axis+1, 5))},
                                 "angularaxis": {"tickvals":
-                                                [backend.hr2ang(hr)
-                                                 for hr in range(24)],
+                                                backend.hr2ang(
+                                                    pd.RangeIndex(24)
+                                                               ).tolist(),
                                                 "ticktext":
                                                 [str(24 if hr == 0 else hr)
                                                  for hr in range(24)]}
@@ -585,7 +580,8 @@ def types(original: pd.DataFrame,
                             plot_height)
     # prepare data
     mapper = backend.load_category_mapper(backend.PATH_MAPPER)
-    data = original.loc[:, ["sport_type"]].copy()
+    # plotly express groups the path without dropping unused categories
+    data = original.loc[:, ["sport_type"]].astype(object)
     data["type"] = data["sport_type"].map(mapper)
     data["counts"] = 1
     # create figure
@@ -635,6 +631,8 @@ def sunburst_figure(aggregated_data: pd.DataFrame,
 
 def locations(original: pd.DataFrame,
               plot_height: int,
+              heatmap: bool = False,
+              owner: int | str = None,
               **kwargs: typing.Any) -> go.Figure:
     """
 
@@ -645,6 +643,12 @@ def locations(original: pd.DataFrame,
         The entire dataframe.
     plot_height : int
         The height of the plot.
+    heatmap : bool, optional
+        Show the density of the routes instead of a line per activity. The
+        default is False.
+    owner : int | str, optional
+        The athlete whose routes they are, who owns them in the route store.
+        The default is None.
     **kwargs : typing.Any
         Key word arguments.
 
@@ -664,7 +668,9 @@ def locations(original: pd.DataFrame,
                     (~original["lon"].isna()),
                     :]
     if not data.empty:
-        countries_count = data.country.value_counts().reset_index()
+        # count only the countries with activities, not every category
+        countries_count = data.country.value_counts()\
+            .loc[lambda counts: counts > 0].reset_index()
         # get the colors closer together by taking the log of the value
         countries_count["count"] = countries_count["count"].apply(math.log) + 2
     geojson_file = backend.load_geojson(backend.PATH_GEOJSON)
@@ -674,8 +680,12 @@ def locations(original: pd.DataFrame,
                                geojson_file,
                                title=plot_title,
                                height=plot_height,
-                               **process_data(data),
-                               zoom=1,
+                               **(process_density(data, owner=owner)
+                                  if heatmap else
+                                  process_data(data,
+                                               zoom=backend.MAP_ZOOM,
+                                               budget=backend.MAP_POINTS,
+                                               owner=owner)),
                                **kwargs)
     if data.empty:
         worldmap = _add_annotation(worldmap)
@@ -683,57 +693,100 @@ def locations(original: pd.DataFrame,
 
 
 def process_data(data: pd.DataFrame,
-                 **kwargs: typing.Any) -> dict[list]:
+                 zoom: int = None,
+                 budget: int = None,
+                 owner: int | str = None,
+                 **kwargs: typing.Any) -> dict[np.ndarray]:
     """
+    Flatten the routes of all activities into one line per activity for the
+    line mapbox, in one pass over contiguous arrays. Every line starts at the
+    start coordinates of the activity followed by the points of the route and
+    ends with a missing value that separates it from the next line.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The dataframe containing rows with a lat and a lon coordinate.
+    zoom : int, optional
+        The zoom of the map the routes are simplified for. The default is
+        None which keeps every point unless there is a budget.
+    budget : int, optional
+        The amount of route points at most, the routes are simplified to a
+        coarser level of detail when they exceed it. The default is None
+        which does not limit them.
+    owner : int | str, optional
+        The athlete whose routes they are. The default is None.
+    **kwargs : typing.Any
+        Key word arguments.
 
+    Returns
+    -------
+    arrays: dict[np.ndarray]
+        A dictionary with the arrays of values for the line mapbox, NaN, NaT
+        or None at the separators.
+
+    """
+    _ = kwargs
+    # decode the routes that are not cached yet at once
+    if zoom is None and budget is None:
+        routes = backend.ROUTES.get_many(data["polyline"], owner)
+    else:
+        routes, _ = backend.LEVELS.fit(data["polyline"], budget, zoom, owner)
+    points = np.fromiter(map(len, routes), dtype=np.int64, count=len(routes))
+    # the start, the points of the route and the separator of every line
+    lengths = points + 2
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    lats = np.full(ends[-1] if len(ends) else 0, np.nan)
+    lons = lats.copy()
+    lats[starts] = data["lat"].to_numpy(dtype=float)
+    lons[starts] = data["lon"].to_numpy(dtype=float)
+    if points.sum():
+        # the position of every point of the routes in the lines
+        positions = np.repeat(starts + 1 - (np.cumsum(points) - points),
+                              points) + np.arange(points.sum())
+        coords = np.concatenate(routes)
+        lats[positions] = coords[:, 0]
+        lons[positions] = coords[:, 1]
+    separators = ends - 1
+    arrays = {"lat": lats,
+              "lon": lons,
+              "color": np.repeat(data["app"].to_numpy(dtype=object),
+                                 lengths)}
+    for key, column in [("name", "name"),
+                        ("date", "date"),
+                        ("time", "time")]:
+        values = np.repeat(data[column].to_numpy(), lengths)
+        # a missing value of the type of the column
+        values[separators] = None
+        arrays[key] = values
+    return arrays
+
+
+def process_density(data: pd.DataFrame,
+                    owner: int | str = None,
+                    **kwargs: typing.Any) -> dict[dict]:
+    """
+    Rasterize the routes of all activities into the density grid of the
+    heatmap, at most MAP_POINTS cells whatever the amount of route points.
 
     Parameters
     ----------
     data : pd.DataFrame
         The dataframe containing rows with a lat and a lon coordinate.
+    owner : int | str, optional
+        The athlete whose routes they are. The default is None.
     **kwargs : typing.Any
         Key word arguments.
 
     Returns
     -------
-    list: dict[list]
-        A dictionary with the lists of values for the line mapbox.
+    dict[dict]
+        A dictionary with the grid of the density mapbox.
 
     """
     _ = kwargs
-    lats = []
-    lons = []
-    colors = []
-    names = []
-    dates = []
-    times = []
-    for _, row in data.iterrows():
-        segment_length = len(coords := row["coords"])+1
-        lat, lon = zip(*coords)  # unpack a list of tuples to two lists
-        lat = [row["lat"]]+list(lat)
-        lon = [row["lon"]]+list(lon)
-        lats.extend(lat)
-        lons.extend(lon)
-
-        colors.extend([row["app"]]*segment_length)
-        names.extend([row["name"]]*segment_length)
-        dates.extend([row["date"]]*segment_length)
-        times.extend([row["time"]]*segment_length)
-        # make a seperation in the lists
-
-        lats.append(None)
-        lons.append(None)
-        colors.append(row["app"])
-        names.append(None)
-        dates.append(None)
-        times.append(None)
-    lists = {"lat": lats,
-             "lon": lons,
-             "color": colors,
-             "name": names,
-             "date": dates,
-             "time": times}
-    return lists
+    return {"density": backend.DENSITY.grid(data["polyline"], owner=owner)}
 
 
 def worldmap_figure(data: pd.DataFrame,
@@ -758,18 +811,20 @@ def worldmap_figure(data: pd.DataFrame,
     height : int, optional
         The height of the plot. The default is None.
     **kwargs : typing.Any
-        Key word arguments.
+        Key word arguments, the lines of process_data or the density of
+        process_density.
 
     Returns
     -------
     figure : go.Figure
-        The plotly line mapbox of the locations and routes overlayed with the
-        scatter plot.
+        The plotly line mapbox of the locations and routes, or the density
+        mapbox of the routes, overlayed with the scatter plot.
 
     """
-    lats: list = kwargs.get("lat", [])
-    lons: list = kwargs.get("lon", [])
-    name: list = kwargs.get("name", [])
+    lats: np.ndarray = kwargs.get("lat", [])
+    lons: np.ndarray = kwargs.get("lon", [])
+    name: np.ndarray = kwargs.get("name", [])
+    density: dict = kwargs.get("density")
     # color the countries by (log of) the amount of activities
     figure = px.choropleth_mapbox(data_frame=countries,
                                   geojson=geojson,
@@ -778,10 +833,11 @@ def worldmap_figure(data: pd.DataFrame,
                                   color="count",
                                   # remover hover label for choropleth plot
                                   hover_data=["country"],
-                                  color_continuous_scale=backend.DISCRETE_COLOR,
+                                  color_continuous_scale=(
+                                      backend.DISCRETE_COLOR),
                                   range_color=[0, countries["count"].max()],
                                   opacity=.5,
-                                  zoom=1,
+                                  zoom=backend.MAP_ZOOM,
                                   # center map on coordinates of activities
                                   center={"lat": data["lat"].mean(),
                                           "lon": data["lon"].mean()},
@@ -790,17 +846,31 @@ def worldmap_figure(data: pd.DataFrame,
                                   height=height
                                   )
     # add the routes of the activities
-    figure.add_scattermapbox(below="",  # put trace above all others
-                             lat=lats,
-                             lon=lons,
-                             marker={"size": 1,
-                                     "color": backend.COLOR_MAP.get("Strava"),
-                                     "symbol": "circle",
-                                     },
-                             mode="lines",
-                             customdata=name,
-                             name="Strava"
-                             )
+    if density is not None:
+        # the log keeps the quiet routes visible next to the daily ones
+        figure.add_densitymapbox(below="",  # put trace above all others
+                                 lat=density["lat"],
+                                 lon=density["lon"],
+                                 z=np.log1p(density["count"]),
+                                 radius=backend.DENSITY_RADIUS,
+                                 colorscale=backend.DISCRETE_COLOR,
+                                 showscale=False,
+                                 customdata=density["count"],
+                                 name="Strava"
+                                 )
+    else:
+        figure.add_scattermapbox(below="",  # put trace above all others
+                                 lat=lats,
+                                 lon=lons,
+                                 marker={"size": 1,
+                                         "color":
+                                             backend.COLOR_MAP.get("Strava"),
+                                         "symbol": "circle",
+                                         },
+                                 mode="lines",
+                                 customdata=name,
+                                 name="Strava"
+                                 )
     figure.add_scattermapbox(below="",   # put trace above all others
                              lat=data["lat"],
                              lon=data["lon"],
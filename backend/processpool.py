@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+The process pool that parses the pages outside of the interpreter of the app,
+so the parsing is not serialized on the GIL of the threads. The workers
+receive the raw json of a page and return the parsed table as an Arrow stream
+in a block of shared memory instead of a pickled DataFrame.
+
+functions:
+    get_process_pool
+    parse_shared
+"""
+# Standard library
+import concurrent.futures as c_futures
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+# Third party
+import pandas as pd
+import pyarrow as pa
+# Local imports
+import backend
+
+_POOL: c_futures.ProcessPoolExecutor = None
+_POOL_LOCK: threading.Lock = threading.Lock()
+
+
+def get_process_pool(processes: int = None) -> c_futures.ProcessPoolExecutor:
+    """
+    Get the process wide pool of parse processes, starting it on first use.
+    The processes are spawned rather than forked since the app runs threads.
+
+    Parameters
+    ----------
+    processes : int, optional
+        The amount of processes when the pool is started. The default is None
+        which uses PARSE_PROCESSES.
+
+    Returns
+    -------
+    c_futures.ProcessPoolExecutor
+        The shared process pool.
+
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = c_futures.ProcessPoolExecutor(
+                max_workers=processes or backend.PARSE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn")
+                                                  )
+    return _POOL
+
+
+def _parse_to_shared(content: bytes) -> tuple[str, int]:
+    """
+    Parse the raw json of a page in a worker process and write the table as
+    an Arrow stream into a new block of shared memory. The block is left for
+    the app to read and release.
+
+    Parameters
+    ----------
+    content : bytes
+        The body of the response with the activities of a page.
+
+    Returns
+    -------
+    name : str
+        The name of the block of shared memory.
+    size : int
+        The amount of bytes of the Arrow stream in the block.
+
+    """
+    table: pa.Table = pa.Table.from_pandas(
+        backend.parse(backend.json_loads(content)),
+        preserve_index=False
+                                           )
+    # measure the stream to allocate the block at once
+    sink: pa.MockOutputStream = pa.MockOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    size: int = sink.size()
+    block: shared_memory.SharedMemory = shared_memory.SharedMemory(
+        create=True,
+        size=max(size, 1)
+                                                                   )
+    try:
+        stream: pa.FixedSizeBufferWriter = pa.FixedSizeBufferWriter(
+            pa.py_buffer(block.buf))
+        with pa.ipc.new_stream(stream, table.schema) as writer:
+            writer.write_table(table)
+        # drop the views on the block so it can be closed
+        del stream, writer
+    except Exception:
+        # the block is of no use without the table
+        block.unlink()
+        raise
+    block.close()
+    return block.name, size
+
+
+def _read_shared(name: str,
+                 size: int) -> pd.DataFrame:
+    """
+    Read the table of a page from a block of shared memory and release the
+    block.
+
+    Parameters
+    ----------
+    name : str
+        The name of the block of shared memory.
+    size : int
+        The amount of bytes of the Arrow stream in the block.
+
+    Returns
+    -------
+    parsed : pd.DataFrame
+        The parsed activities of the page.
+
+    """
+    block: shared_memory.SharedMemory = shared_memory.SharedMemory(name=name)
+    try:
+        buffer: pa.Buffer = pa.py_buffer(block.buf)[:size]
+        table: pa.Table = pa.ipc.open_stream(buffer).read_all()
+        # copy the columns out so no view on the block is left
+        parsed: pd.DataFrame = table.to_pandas().copy()
+        del table, buffer
+    finally:
+        block.unlink()
+        block.close()
+    return parsed
+
+
+def parse_shared(content: bytes,
+                 pool: c_futures.ProcessPoolExecutor = None) -> pd.DataFrame:
+    """
+    Parse the raw json of a page in the process pool, the counterpart of
+    parse for the parse workers of iter_get_and_parse. The calling thread
+    waits without holding the GIL.
+
+    Parameters
+    ----------
+    content : bytes
+        The body of the response with the activities of a page.
+    pool : c_futures.ProcessPoolExecutor, optional
+        The process pool. The default is None which uses the shared pool of
+        get_process_pool.
+
+    Returns
+    -------
+    pd.DataFrame
+        The parsed activities of the page.
+
+    """
+    pool = pool or get_process_pool()
+    name, size = pool.submit(_parse_to_shared, content).result()
+    return _read_shared(name, size)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+The process wide scheduler that keeps all sessions within the application wide
+rate limits of the Strava API.
+"""
+# Standard library
+import collections
+import contextlib
+import threading
+import time
+import typing
+# Local imports
+import backend
+
+
+class RateLimiter:
+    """
+    A token bucket per rate limit window of the Strava API, the short window of
+    15 minutes and the daily window, shared by all sessions of the process.
+    The buckets are refilled when the windows reset and corrected with the
+    usage reported in the X-RateLimit headers of every response.
+
+    Requests are granted fairly: every key, such as the access token of a
+    session, takes its turn in a round robin so a single large history can not
+    starve the other sessions.
+
+    Parameters
+    ----------
+    limits : tuple[int], optional
+        The amount of requests allowed in each window. The default is
+        (200, 2000).
+    windows : tuple[int], optional
+        The length of each window in seconds. The default is (900, 86400).
+
+    """
+
+    def __init__(self,
+                 limits: tuple[int] = (200, 2000),
+                 windows: tuple[int] = (900, 86400)) -> None:
+        self.limits: list[int] = list(limits)
+        self.windows: tuple[int] = windows
+        self.usage: list[int] = [0] * len(windows)
+        self.resets: list[float] = [self._next_reset(window, time.time())
+                                    for window in windows]
+        self._condition: threading.Condition = threading.Condition()
+        # the amount of waiting requests per key and the order of the turns
+        self._waiting: collections.Counter = collections.Counter()
+        self._turns: collections.deque = collections.deque()
+
+    @staticmethod
+    def _next_reset(window: int,
+                    now: float) -> float:
+        """
+        The moment the window resets, the windows of Strava are aligned to the
+        quarter hours and to midnight UTC.
+
+        Parameters
+        ----------
+        window : int
+            The length of the window in seconds.
+        now : float
+            The current epoch timestamp.
+
+        Returns
+        -------
+        float
+            The epoch timestamp of the next reset.
+
+        """
+        return (now // window + 1) * window
+
+    def _refill(self, now: float) -> None:
+        """
+        Empty the usage of the windows that have been reset.
+
+        Parameters
+        ----------
+        now : float
+            The current epoch timestamp.
+
+        Returns
+        -------
+        None.
+
+        """
+        for index, window in enumerate(self.windows):
+            if now >= self.resets[index]:
+                self.usage[index] = 0
+                self.resets[index] = self._next_reset(window, now)
+
+    def _available(self) -> int:
+        """
+        The amount of requests that can be sent before a window is exhausted.
+
+        Returns
+        -------
+        int
+            The tokens left in the emptiest bucket.
+
+        """
+        return min(limit - usage
+                   for limit, usage in zip(self.limits, self.usage))
+
+    def _wait(self, now: float) -> float:
+        """
+        The seconds until a token is available.
+
+        Parameters
+        ----------
+        now : float
+            The current epoch timestamp.
+
+        Returns
+        -------
+        float
+            The seconds until the last exhausted window resets.
+
+        """
+        return max([reset - now
+                    for limit, usage, reset in zip(self.limits,
+                                                   self.usage,
+                                                   self.resets)
+                    if usage >= limit] + [0.])
+
+    def update(self, headers: dict) -> None:
+        """
+        Correct the buckets with the limits and usage reported by Strava.
+
+        Parameters
+        ----------
+        headers : dict
+            The headers of a response from the Strava API.
+
+        Returns
+        -------
+        None.
+
+        """
+        limits: str = headers.get("X-RateLimit-Limit")
+        usage: str = headers.get("X-RateLimit-Usage")
+        if not limits or not usage:
+            return
+        with self._condition:
+            self._refill(time.time())
+            self.limits = [int(value) for value in limits.split(",")]
+            self.usage = [int(value) for value in usage.split(",")]
+            self._condition.notify_all()
+
+    def _enter(self, key: str) -> None:
+        """
+        Count a waiting request of the key, giving the key a turn when it has
+        none yet. Called with the condition held.
+        """
+        if self._waiting[key] == 0:
+            self._turns.append(key)
+        self._waiting[key] += 1
+
+    def _leave(self, key: str) -> None:
+        """
+        Uncount a waiting request of the key, dropping its turn after the
+        last one. Called with the condition held.
+        """
+        self._waiting[key] -= 1
+        if self._waiting[key] == 0:
+            self._turns.remove(key)
+            del self._waiting[key]
+        self._condition.notify_all()
+
+    def _take(self, key: str, now: float) -> bool:
+        """
+        Take the tokens when it is the turn of the key and every bucket has
+        one, then pass the turn to the next key. Called with the condition
+        held.
+        """
+        self._refill(now)
+        if self._turns[0] != key or self._available() <= 0:
+            return False
+        self.usage = [usage + 1 for usage in self.usage]
+        self._turns.rotate(-1)
+        return True
+
+    @contextlib.contextmanager
+    def waiting(self, key: str) -> typing.Iterator[None]:
+        """
+        Keep a turn for a request of the key while it polls try_acquire, for
+        requesters that can not block in acquire such as an event loop.
+
+        Parameters
+        ----------
+        key : str
+            The key of the requester, such as the access token of a session.
+
+        Yields
+        ------
+        None.
+
+        """
+        with self._condition:
+            self._enter(key)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._leave(key)
+
+    def try_acquire(self, key: str) -> bool:
+        """
+        Take the tokens without waiting when it is the turn of the key, which
+        must be waiting.
+
+        Parameters
+        ----------
+        key : str
+            The key of the requester, such as the access token of a session.
+
+        Returns
+        -------
+        bool
+            Whether the tokens were taken.
+
+        """
+        with self._condition:
+            return self._take(key, time.time())
+
+    def acquire(self,
+                key: str,
+                cancel: threading.Event = None,
+                timeout: float = None) -> bool:
+        """
+        Wait for the turn of the key and for a token in every bucket, then
+        take the tokens.
+
+        Parameters
+        ----------
+        key : str
+            The key of the requester, such as the access token of a session.
+        cancel : threading.Event, optional
+            Stop waiting when it is set. The default is None.
+        timeout : float, optional
+            The maximum seconds to wait. The default is None which waits until
+            the tokens are taken.
+
+        Returns
+        -------
+        bool
+            Whether the tokens were taken, False if the wait was cancelled or
+            timed out.
+
+        """
+        deadline: float = None if timeout is None else time.time() + timeout
+        with self._condition:
+            self._enter(key)
+            try:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        return False
+                    now: float = time.time()
+                    if self._take(key, now):
+                        return True
+                    if deadline is not None and now >= deadline:
+                        return False
+                    # wake up for a reset, the deadline or to notice a cancel
+                    self._condition.wait(timeout=min(
+                        self._wait(now) or 1,
+                        1,
+                        deadline - now if deadline is not None else 1))
+            finally:
+                self._leave(key)
+
+    def expected_wait(self) -> float:
+        """
+        Estimate the seconds a new request waits before it is sent.
+
+        Returns
+        -------
+        float
+            The seconds until enough tokens are available for all requests
+            that are waiting.
+
+        """
+        with self._condition:
+            now: float = time.time()
+            self._refill(now)
+            waiting: int = sum(self._waiting.values())
+            if waiting < self._available():
+                return 0.
+            return max(self._wait(now),
+                       min(self.resets) - now)
+
+
+LIMITER: RateLimiter = RateLimiter(backend.RATE_LIMITS)
+
+
+if __name__ == "__main__":
+    pass
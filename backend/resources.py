@@ -13,6 +13,9 @@ import plotly.express as px
 STRAVA_CLIENT_ID = os.environ.get("STRAVA_CLIENT_ID")
 STRAVA_CLIENT_SECRET = os.environ.get("STRAVA_CLIENT_SECRET")
 
+# RETENTION
+STORE_RETENTION_DAYS: int = 30  # days a history is kept after its last sync
+
 # TEXT
 CAPTION: str = \
     """
@@ -20,11 +23,13 @@ This page was created by UnicornOnAzur and the code can be found on
 https://github.com/UnicornOnAzur/activity_mapper .
 """
 EXPLANATION: str =\
-    """
+    f"""
 To use this dashboard click on "Connect with Strava". This will redirect you to
 the Strava page. Then select to view public and/or private activities, and
-click "Authorize". This provides the dashboard with your data for the duration
-of your use.
+click "Authorize". This provides the dashboard with your data.
+Your activities are stored on the server so a next visit only retrieves the new
+ones. They are deleted {STORE_RETENTION_DAYS} days after your last visit, or at
+once with "Delete my stored data".
 """
 ERROR_MESSAGE1: str =\
     """
@@ -34,6 +39,25 @@ ERROR_MESSAGE2: str =\
     """
 An error occurred while retrieving the data. Please try to authorize again.
 """
+ERROR_MESSAGE3: str =\
+    """
+Not all activities could be retrieved. Only the activities retrieved before the
+error are shown.
+"""
+ERROR_MESSAGE4: str =\
+    """
+Your new activities could not be synced. The stored activities are shown, the
+next visit tries again.
+"""
+LOOKUP_HELP: str = """
+Look up the countries on OpenStreetMap Nominatim instead of the built-in
+borders. The lookups are shared and kept, new locations are filled in one per
+second.
+"""
+HEATMAP_HELP: str = """
+Show the density of the routes as a heatmap instead of a line per activity,
+which stays fast and readable for thousands of activities.
+"""
 HELP_TEXT: str = """See this activity on the Strava website"""
 TITLE: str = "Activity Mapper"
 DT_FORMAT: str = "%Y-%m-%dT%H:%M:%SZ"
@@ -61,8 +85,27 @@ STRAVA_COLS: list[str] = ["name",
                           "year",
                           "week",
                           "timestamp",
-                          "coords"
+                          "polyline"  # decoded by the locations figure
                           ]
+# the compact dtypes of the columns, the other columns stay objects and floats
+STRAVA_DTYPES: dict[str, str] = {"id": "int64",
+                                 "sport_type": "category",
+                                 "country": "category",
+                                 "app": "category",
+                                 "weekday": "int8",
+                                 # the time of day on the first of January 1970
+                                 "date": "datetime64[ns]",
+                                 "time": "datetime64[ns]",
+                                 "hour": "int8",
+                                 "minutes": "int8",
+                                 "calender-week": "category",
+                                 "year": "int16",
+                                 "week": "int8",
+                                 "timestamp": "datetime64[ns, UTC]"
+                                 }
+# the formats of the date and time columns in the hover labels
+HOVER_DATE: str = "%Y-%m-%d"
+HOVER_TIME: str = "%H:%M:%S"
 
 # DICT WITH CONFIGURATION FOR PLOTLY CHARTS
 CONFIG: dict = {"displaylogo": False,  # remove the plotly logo
@@ -81,6 +124,10 @@ PATH_CONNECT: str = "logos/btn_strava_connectwith_orange@2x.png"
 PATH_LOGO: str = "logos/api_logo_pwrdBy_strava_horiz_light.png"
 PATH_GEOJSON: str = "files/countries.geojson"
 PATH_MAPPER: str = "files/strava_categories.txt"
+PATH_STORE: str = "files/store"  # the directory of the stored activities
+SNAPSHOT_COMPRESSION: str = "lz4"  # "uncompressed", "lz4" or "zstd"
+PATH_GEOCODE: str = "files/store/geocode.sqlite"  # the Nominatim lookups
+PATH_ROUTES: str = "files/store/routes"  # the decoded routes, None for memory
 
 # COLORS AND THEMES
 COLOR_MAP: dict = {"Strava": "#FC4C02"}  # the color of the Strava app
@@ -94,6 +141,30 @@ TOP_BOTTOM_MARGIN: int = 25
 TOP_ROW_HEIGHT: int = 200
 BOTTOM_ROW_HEIGHT: int = 600
 
+# THREADING
+FETCH_WORKERS: int = 5  # workers retrieving pages
+PARSE_WORKERS: int = 10  # workers parsing the retrieved pages
+PARSE_PROCESSES: int = 0  # processes parsing the pages, 0 parses in threads
+PAGE_WINDOW: int = 10  # pages requested at the same time
+PER_PAGE: int = 200  # the maximum page size allowed by Strava
+FETCH_STRATEGY: str = "pages"  # "pages" or "windows" of time in parallel
+FETCH_ENGINE: str = "threads"  # "threads" or "asyncio" which needs aiohttp
+RECONCILE_DAYS: int = 7  # days between retrieving the entire history again
+RATE_LIMITS: tuple[int] = (200, 2000)  # requests per 15 minutes and per day
+STREAM_INTERVAL: float = 2.  # seconds between redrawing the figures
+
+# ROUTES
+ROUTE_CACHE: int = 20_000  # decoded routes kept for all sessions together
+ROUTE_SEGMENTS: int = 16  # segments of an athlete before compacting them
+ROUTE_STORE_POINTS: int = 20_000_000  # points of an athlete in the route store
+MAP_ZOOM: int = 1  # the zoom of the world map and of its routes
+MAP_POINTS: int = 200_000  # route points sent to the world map at most
+LOD_PIXELS: float = .5  # deviation of a simplified route on the map in pixels
+LOD_MAX_ZOOM: int = 16  # the zoom of the finest level of detail of the routes
+DENSITY_CELL: float = .005  # the size of the cells of the heatmap in degrees
+DENSITY_CHUNK: int = 10_000  # routes added to the heatmap at a time
+DENSITY_RADIUS: int = 4  # the radius of a cell of the heatmap in pixels
+
 # URLS
 ACTIVITIES_LINK: str = "https://www.strava.com/api/v3/athlete/activities"
 ACTIVITIES_URL: str = "https://www.strava.com/activities/"
@@ -106,5 +177,10 @@ authorization_link = f"""
 """
 TOKEN_LINK: str = "https://www.strava.com/oauth/token"
 
+# NOMINATIM
+NOMINATIM_CELL: float = .1  # degrees of the cells that share a lookup
+NOMINATIM_INTERVAL: float = 1.  # seconds between requests as per the policy
+NOMINATIM_USER_AGENT: str = f"activity-mapper ({APP_URL})"
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,766 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+The decoding of the encoded polylines of the routes in bulk into flat NumPy
+arrays, and the stores keeping the decoded routes.
+
+functions:
+    decode_polylines
+    split_routes
+    route_latlon
+    route_keys
+
+classes:
+    RouteStore
+    RouteCache
+"""
+# Standard library
+import collections
+import contextlib
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+import typing
+import uuid
+# Third party
+import numpy as np
+# Local imports
+import backend
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+# the fixed width records of the route index of a segment
+INDEX_DTYPE: np.dtype = np.dtype([("key", "<u8"),
+                                  ("start", "<i8"),
+                                  ("stop", "<i8")])
+
+
+def decode_polylines(polylines: typing.Sequence[str | None],
+                     precision: int = 5) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decode many encoded polylines in one call into a single contiguous array
+    of coordinates and the offsets of every route in it, like a compressed
+    sparse row matrix. The coordinates of route i are
+    coords[offsets[i]:offsets[i + 1]], a missing polyline is an empty route.
+    A malformed polyline, with a character outside the alphabet of the
+    encoding, a truncated last value or an odd amount of values, is decoded
+    as an empty route as well and does not affect the other routes.
+
+    The characters of all polylines are decoded at once: every character
+    carries 5 bits of a value and a continuation bit, the values are summed
+    per group of characters, zigzag decoded and accumulated per route to undo
+    the delta encoding of the latitude and longitude.
+
+    Parameters
+    ----------
+    polylines : typing.Sequence[str | None]
+        The encoded polylines, such as the summary polylines of the
+        activities.
+    precision : int, optional
+        The precision of the encoding which is 5 for Google Maps. The default
+        is 5.
+
+    Returns
+    -------
+    coords : np.ndarray
+        The latitude and longitude of all points, of shape (points, 2).
+    offsets : np.ndarray
+        The index of the first point of every route and the amount of points,
+        of length len(polylines) + 1.
+
+    """
+    # characters outside of ascii are bytes outside of the alphabet
+    encoded: list[bytes] = [line.encode("utf-8")
+                            if isinstance(line, str) else b""
+                            for line in polylines]
+    lengths, chars, ends = _characters(encoded)
+    # drop the malformed polylines before their values run into the next
+    invalid: np.ndarray = _malformed(lengths, chars, ends)
+    if invalid.any():
+        LOGGER.warning("Skipped %d malformed polylines", invalid.sum())
+        encoded = [b"" if skip else line
+                   for line, skip in zip(encoded, invalid)]
+        lengths, chars, ends = _characters(encoded)
+    starts: np.ndarray = np.concatenate(([0], ends[:-1] + 1))[:len(ends)]
+    # the position of every character within its value sets the bit shift
+    position: np.ndarray = np.arange(len(chars)) -\
+        np.repeat(starts, ends - starts + 1)
+    values: np.ndarray = np.add.reduceat((chars & 0x1f) << (5 * position),
+                                         starts) if len(ends) else\
+        np.empty(0, dtype=np.int64)
+    # undo the zigzag encoding of the sign
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+    # the amount of values per route from the value ends per polyline
+    bounds: np.ndarray = np.concatenate(([0], np.cumsum(lengths)))
+    counts: np.ndarray = np.diff(np.searchsorted(ends, bounds))
+    offsets: np.ndarray = np.concatenate(([0], np.cumsum(counts // 2)))
+    # accumulate the deltas restarting at every route
+    deltas: np.ndarray = values.reshape(-1, 2)
+    totals: np.ndarray = np.cumsum(deltas, axis=0)
+    restart: np.ndarray = np.vstack((np.zeros((1, 2), dtype=np.int64),
+                                     totals))[offsets[:-1]]
+    totals -= np.repeat(restart, np.diff(offsets), axis=0)
+    coords: np.ndarray = totals / float(10 ** precision)
+    return coords, offsets
+
+
+def _characters(encoded: list[bytes]
+                ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The lengths of the polylines, the 6 bits of all their characters and the
+    index of the last character of every value.
+    """
+    lengths: np.ndarray = np.fromiter(map(len, encoded),
+                                      dtype=np.int64,
+                                      count=len(encoded))
+    chars: np.ndarray = np.frombuffer(b"".join(encoded),
+                                      dtype=np.uint8).astype(np.int64) - 63
+    # a value ends at every character without the continuation bit
+    ends: np.ndarray = np.flatnonzero((chars & 0x20) == 0)
+    return lengths, chars, ends
+
+
+def _malformed(lengths: np.ndarray,
+               chars: np.ndarray,
+               ends: np.ndarray) -> np.ndarray:
+    """
+    Whether every polyline has a character outside of the alphabet, a last
+    value without end or an odd amount of values.
+    """
+    bounds: np.ndarray = np.concatenate(([0], np.cumsum(lengths)))
+    owner: np.ndarray = np.repeat(np.arange(len(lengths)), lengths)
+    outside: np.ndarray = np.bincount(owner[(chars < 0) | (chars > 63)],
+                                      minlength=len(lengths)) > 0
+    nonempty: np.ndarray = lengths > 0
+    truncated: np.ndarray = np.zeros(len(lengths), dtype=bool)
+    truncated[nonempty] = (chars[bounds[1:][nonempty] - 1] & 0x20) != 0
+    counts: np.ndarray = np.diff(np.searchsorted(ends, bounds))
+    return outside | truncated | (counts % 2 == 1)
+
+
+def split_routes(coords: np.ndarray,
+                 offsets: np.ndarray) -> list[np.ndarray]:
+    """
+    Split the coordinates into a view per route without copying them.
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        The latitude and longitude of all points, of shape (points, 2).
+    offsets : np.ndarray
+        The index of the first point of every route and the amount of points.
+
+    Returns
+    -------
+    list[np.ndarray]
+        The coordinates of every route, of shape (points, 2).
+
+    """
+    return [coords[start:end] for start, end in zip(offsets[:-1],
+                                                    offsets[1:])]
+
+
+def route_latlon(route: typing.Any) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The latitudes and longitudes of a route in any of the forms stored in the
+    coords column: an array of shape (points, 2), a list of (lat, lon) tuples
+    or a missing value.
+
+    Parameters
+    ----------
+    route : typing.Any
+        The coordinates of the route.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The latitudes and the longitudes, empty for a missing route.
+
+    """
+    if not isinstance(route, (np.ndarray, list, tuple)) or len(route) == 0:
+        return np.empty(0), np.empty(0)
+    points: np.ndarray = np.asarray(route, dtype=float).reshape(-1, 2)
+    return points[:, 0], points[:, 1]
+
+
+def route_keys(polylines: typing.Iterable[str]) -> np.ndarray:
+    """
+    The keys of the routes in the route store, a 64 bit hash of the encoded
+    polyline that is the same in every process.
+
+    Parameters
+    ----------
+    polylines : typing.Iterable[str]
+        The encoded polylines.
+
+    Returns
+    -------
+    np.ndarray
+        The keys as unsigned 64 bit integers.
+
+    """
+    return np.array([int.from_bytes(hashlib.blake2b(line.encode("ascii"),
+                                                    digest_size=8).digest(),
+                                    "little")
+                     for line in polylines], dtype=np.uint64)
+
+
+def _owner(owner: int | str | None) -> str:
+    """
+    The owner in the names of the segments, "shared" for no athlete.
+    """
+    return "shared" if owner is None else str(owner)
+
+
+class RouteStore:
+    """
+    The decoded routes on disk, shared by all server processes through memory
+    mapping. The routes are kept in immutable segments of two files: a
+    contiguous blob with the coordinates of the routes and an index with a
+    fixed width record per route, the key of its polyline and the start and
+    stop of its points in the blob, sorted by key. A process writes the
+    routes it decoded as a new segment and every process maps the segments
+    it finds, so the coordinates are shared through the page cache and are
+    not held on the heap of the process.
+
+    Every segment belongs to an owner, the athlete whose routes it holds, so
+    the routes of an athlete can be deleted with the stored activities, and
+    segments are expired after a number of days like the activities.
+
+    The directory is only listed again when its modification time changed.
+    Above a number of segments of an owner they are compacted into one,
+    keeping every route once and only the most recently written routes within
+    a number of points. The views handed out before stay valid as the maps of
+    removed files remain until they are released. Two processes compacting
+    at the same time leave duplicate routes that the next compaction merges.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the segments, created on the first write.
+    segments : int, optional
+        The amount of segments of an owner that triggers a compaction. The
+        default is None which uses ROUTE_SEGMENTS.
+    points : int, optional
+        The amount of points of an owner kept by a compaction. The default is
+        None which uses ROUTE_STORE_POINTS.
+
+    """
+
+    def __init__(self,
+                 path: str,
+                 segments: int = None,
+                 points: int = None) -> None:
+        self.path: str = path
+        self.segments: int = segments or backend.ROUTE_SEGMENTS
+        self.points: int = points or backend.ROUTE_STORE_POINTS
+        self.loaded: int = 0
+        self.compactions: int = 0
+        self._segments: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._mtime: int = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def _open(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Map a segment into memory.
+
+        Parameters
+        ----------
+        name : str
+            The name of the segment.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The index and the coordinates of the segment.
+
+        """
+        base: str = os.path.join(self.path, name)
+        # plain views on the maps are lighter per route than memmap slices
+        return (np.load(f"{base}.index.npy", mmap_mode="r").view(np.ndarray),
+                np.load(f"{base}.coords.npy", mmap_mode="r").view(np.ndarray))
+
+    @staticmethod
+    def _parse(name: str) -> tuple[str | None, int]:
+        """
+        The owner of a segment and the moment it was written in nanoseconds,
+        None and 0 for a name of another form.
+        """
+        parts: list[str] = name.rsplit("-", 3)
+        if len(parts) != 4 or not parts[1].isdigit():
+            return None, 0
+        return parts[0], int(parts[1])
+
+    def _write(self,
+               index: np.ndarray,
+               coords: np.ndarray,
+               owner: str) -> str:
+        """
+        Write a segment, the index last so a segment with an index is
+        complete, and map it.
+
+        Parameters
+        ----------
+        index : np.ndarray
+            The records of the routes sorted by key.
+        coords : np.ndarray
+            The latitude and longitude of all points, of shape (points, 2).
+        owner : str
+            The owner of the routes.
+
+        Returns
+        -------
+        name : str
+            The name of the segment, the owner followed by the moment it was
+            written.
+
+        """
+        os.makedirs(self.path, exist_ok=True)
+        name: str = f"{owner}-{time.time_ns()}-{os.getpid()}-"\
+            f"{uuid.uuid4().hex[:8]}"
+        base: str = os.path.join(self.path, name)
+        for suffix, array in (("coords", coords), ("index", index)):
+            with open(f"{base}.{suffix}.tmp", mode="wb") as file:
+                np.save(file, np.ascontiguousarray(array))
+            os.replace(f"{base}.{suffix}.tmp", f"{base}.{suffix}.npy")
+        self._segments[name] = self._open(name)
+        return name
+
+    def _refresh(self) -> None:
+        """
+        Map the segments written by other processes and drop the segments
+        they removed since the last refresh, when the directory changed.
+
+        Returns
+        -------
+        None.
+
+        """
+        with contextlib.suppress(FileNotFoundError):
+            mtime: int = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            names: set[str] = {
+                os.path.basename(path)[:-len(".index.npy")]
+                for path in glob.glob(os.path.join(self.path, "*.index.npy"))}
+            for name in set(self._segments) - names:
+                del self._segments[name]
+            for name in names - set(self._segments):
+                with contextlib.suppress(OSError, ValueError):
+                    self._segments[name] = self._open(name)
+
+    def _remove(self, names: list[str]) -> None:
+        """
+        Unmap the segments and remove their files.
+        """
+        for name in names:
+            self._segments.pop(name, None)
+            base: str = os.path.join(self.path, name)
+            # a file still mapped elsewhere on Windows is left for later
+            for suffix in ("index", "coords"):
+                with contextlib.suppress(OSError):
+                    os.remove(f"{base}.{suffix}.npy")
+
+    def _compact(self, owner: str) -> None:
+        """
+        Merge the mapped segments of an owner into one and remove their
+        files. Every route is kept once, from its most recent segment, and
+        the most recently written routes are kept up to the amount of points.
+
+        Parameters
+        ----------
+        owner : str
+            The owner of the segments.
+
+        Returns
+        -------
+        None.
+
+        """
+        # the newest first
+        names: list[str] = sorted((name for name in self._segments
+                                   if self._parse(name)[0] == owner),
+                                  key=lambda name: self._parse(name)[1],
+                                  reverse=True)
+        indexes: list[np.ndarray] = [self._segments[name][0]
+                                     for name in names]
+        keys: np.ndarray = np.concatenate([index["key"]
+                                           for index in indexes])
+        lengths: np.ndarray = np.concatenate([index["stop"] - index["start"]
+                                              for index in indexes])
+        segment: np.ndarray = np.repeat(np.arange(len(names)),
+                                        [len(index) for index in indexes])
+        row: np.ndarray = np.concatenate([np.arange(len(index))
+                                          for index in indexes])
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+        kept: np.ndarray = first[np.cumsum(lengths[first]) <= self.points]
+        kept = kept[np.argsort(keys[kept], kind="stable")]
+        coords: np.ndarray = np.concatenate([np.empty((0, 2))] + [
+            self._segments[names[source]][1][
+                indexes[source]["start"][position]:
+                    indexes[source]["stop"][position]]
+            for source, position in zip(segment[kept], row[kept])])
+        offsets: np.ndarray = np.concatenate(([0], np.cumsum(lengths[kept])))
+        index: np.ndarray = np.empty(len(kept), dtype=INDEX_DTYPE)
+        index["key"] = keys[kept]
+        index["start"] = offsets[:-1]
+        index["stop"] = offsets[1:]
+        self._write(index, coords, owner)
+        self._remove(names)
+        self.compactions += 1
+        LOGGER.info("Compacted %d route segments, kept %d of %d routes",
+                    len(names), len(kept), len(keys))
+
+    def get_many(self,
+                 polylines: list[str]) -> dict[str, np.ndarray]:
+        """
+        The stored routes of the polylines.
+
+        Parameters
+        ----------
+        polylines : list[str]
+            The unique encoded polylines.
+
+        Returns
+        -------
+        found : dict[str, np.ndarray]
+            The read only memory mapped coordinates per polyline that is
+            stored, of shape (points, 2).
+
+        """
+        found: dict[str, np.ndarray] = {}
+        if not polylines:
+            return found
+        keys: np.ndarray = route_keys(polylines)
+        with self._lock:
+            self._refresh()
+            missing: np.ndarray = np.ones(len(keys), dtype=bool)
+            for index, coords in self._segments.values():
+                if len(index) == 0:
+                    continue
+                positions: np.ndarray = np.searchsorted(index["key"], keys)
+                positions[positions == len(index)] = 0
+                hits: np.ndarray = np.flatnonzero(
+                    missing & (index["key"][positions] == keys))
+                for hit, start, stop in zip(hits,
+                                            index["start"][positions[hits]],
+                                            index["stop"][positions[hits]]):
+                    found[polylines[hit]] = coords[start:stop]
+                missing[hits] = False
+                if not missing.any():
+                    break
+            self.loaded += len(found)
+        return found
+
+    def put_many(self,
+                 polylines: list[str],
+                 coords: np.ndarray,
+                 offsets: np.ndarray,
+                 owner: int | str = None) -> list[np.ndarray]:
+        """
+        Write decoded routes as a new segment of their owner, compacting the
+        segments of the owner when there are too many.
+
+        Parameters
+        ----------
+        polylines : list[str]
+            The unique encoded polylines.
+        coords : np.ndarray
+            The latitude and longitude of all points, of shape (points, 2).
+        offsets : np.ndarray
+            The index of the first point of every route and the amount of
+            points, as returned by decode_polylines.
+        owner : int | str, optional
+            The athlete whose routes they are. The default is None for the
+            routes of no athlete, such as the demo data.
+
+        Returns
+        -------
+        list[np.ndarray]
+            The read only memory mapped coordinates of every route.
+
+        """
+        owner = _owner(owner)
+        index: np.ndarray = np.empty(len(polylines), dtype=INDEX_DTYPE)
+        index["key"] = route_keys(polylines)
+        index["start"] = offsets[:-1]
+        index["stop"] = offsets[1:]
+        order: np.ndarray = np.argsort(index["key"], kind="stable")
+        with self._lock:
+            mapped: np.ndarray = self._segments[
+                self._write(index[order], coords, owner)][1]
+            self._refresh()
+            if sum(self._parse(name)[0] == owner
+                   for name in self._segments) > self.segments:
+                self._compact(owner)
+        return split_routes(mapped, offsets)
+
+    def delete(self, owner: int | str) -> np.ndarray:
+        """
+        Delete the routes of an owner.
+
+        Parameters
+        ----------
+        owner : int | str
+            The athlete whose routes are deleted.
+
+        Returns
+        -------
+        keys : np.ndarray
+            The keys of the deleted routes.
+
+        """
+        owner = _owner(owner)
+        with self._lock:
+            self._refresh()
+            names: list[str] = [name for name in self._segments
+                                if self._parse(name)[0] == owner]
+            keys: np.ndarray = np.concatenate(
+                [np.empty(0, dtype=np.uint64)] +
+                [self._segments[name][0]["key"] for name in names])
+            self._remove(names)
+        return keys
+
+    def expire(self, retention_days: float) -> int:
+        """
+        Delete the segments written before the retention period, their routes
+        are decoded and written again when they are needed.
+
+        Parameters
+        ----------
+        retention_days : float
+            The days a segment is kept.
+
+        Returns
+        -------
+        int
+            The amount of deleted segments.
+
+        """
+        oldest: int = time.time_ns() - int(retention_days * 86400 * 1e9)
+        with self._lock:
+            self._refresh()
+            names: list[str] = [name for name in self._segments
+                                if self._parse(name)[1] < oldest]
+            self._remove(names)
+        return len(names)
+
+    def info(self) -> dict:
+        """
+        The size of the store.
+
+        Returns
+        -------
+        dict
+            The amount of segments, routes and points mapped, the routes
+            loaded from the store and the compactions.
+
+        """
+        with self._lock:
+            return {"segments": len(self._segments),
+                    "compactions": self.compactions,
+                    "routes": sum(len(index)
+                                  for index, _ in self._segments.values()),
+                    "points": sum(len(coords)
+                                  for _, coords in self._segments.values()),
+                    "loaded": self.loaded}
+
+
+class RouteCache:
+    """
+    A least recently used cache of decoded routes keyed by their encoded
+    polyline, shared by all sessions. The activities only hold the encoded
+    polyline and a route is decoded the first time it is needed, the routes
+    that are missing from the cache are decoded together in bulk. With a
+    route store the missing routes are first looked up in the store and the
+    decoded routes are written to it, the cache then only holds views on the
+    memory mapped store.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The maximum amount of routes kept. The default is 20_000.
+    store : RouteStore, optional
+        The route store shared with other processes. The default is None.
+
+    """
+
+    def __init__(self,
+                 maxsize: int = 20_000,
+                 store: RouteStore = None) -> None:
+        self.maxsize: int = maxsize
+        self.store: RouteStore = store
+        self.hits: int = 0
+        self.misses: int = 0
+        self._routes: collections.OrderedDict = collections.OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def get_many(self,
+                 polylines: typing.Iterable[str | None],
+                 owner: int | str = None) -> list[np.ndarray]:
+        """
+        The decoded routes of the polylines.
+
+        Parameters
+        ----------
+        polylines : typing.Iterable[str | None]
+            The encoded polylines, a missing polyline is an empty route.
+        owner : int | str, optional
+            The athlete whose routes they are, who owns the decoded routes
+            in the route store. The default is None for no athlete.
+
+        Returns
+        -------
+        routes : list[np.ndarray]
+            The read only coordinates of every route, of shape (points, 2).
+
+        """
+        keys: list[str | None] = [line if isinstance(line, str) and line
+                                  else None for line in polylines]
+        found: dict = {}
+        with self._lock:
+            for key in keys:
+                if key is None or key in found:
+                    continue
+                if (route := self._routes.get(key)) is not None:
+                    self._routes.move_to_end(key)
+                    found[key] = route
+                    self.hits += 1
+        missing: list[str] = list(dict.fromkeys(
+            key for key in keys if key is not None and key not in found))
+        added: list[str] = missing
+        if missing and self.store is not None:
+            found.update(self.store.get_many(missing))
+            missing = [key for key in missing if key not in found]
+        if missing:
+            found.update(zip(missing, self._decode(missing, owner)))
+        if added:
+            with self._lock:
+                self.misses += len(missing)
+                self._routes.update((key, found[key]) for key in added)
+                while len(self._routes) > self.maxsize:
+                    self._routes.popitem(last=False)
+        empty: np.ndarray = np.empty((0, 2))
+        routes: list[np.ndarray] = [empty if key is None else found[key]
+                                    for key in keys]
+        return routes
+
+    def _decode(self,
+                polylines: list[str],
+                owner: int | str = None) -> list[np.ndarray]:
+        """
+        Decode the routes, writing them to the route store if there is one.
+
+        Parameters
+        ----------
+        polylines : list[str]
+            The unique encoded polylines.
+        owner : int | str, optional
+            The athlete whose routes they are. The default is None.
+
+        Returns
+        -------
+        routes : list[np.ndarray]
+            The read only coordinates of every route.
+
+        """
+        coords, offsets = decode_polylines(polylines)
+        # an empty blob can not be mapped
+        if self.store is not None and len(coords):
+            try:
+                return self.store.put_many(polylines, coords, offsets, owner)
+            except OSError as error:
+                LOGGER.warning("Routes could not be stored: %s", error)
+        # copy every route so an evicted route frees its own memory
+        routes: list[np.ndarray] = [route.copy()
+                                    for route in split_routes(coords,
+                                                              offsets)]
+        for route in routes:
+            route.flags.writeable = False
+        return routes
+
+    def info(self) -> dict:
+        """
+        The usage of the cache.
+
+        Returns
+        -------
+        dict
+            The hits, misses, amount of routes and points kept.
+
+        """
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "routes": len(self._routes),
+                    "points": sum(len(route)
+                                  for route in self._routes.values())}
+
+    def clear(self) -> None:
+        """
+        Drop all decoded routes.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            self._routes.clear()
+
+    def delete(self, owner: int | str) -> None:
+        """
+        Delete the routes of an athlete from the route store and drop them
+        from the cache. Without a route store the routes are only dropped
+        when they are the least recently used.
+
+        Parameters
+        ----------
+        owner : int | str
+            The athlete whose routes are deleted.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.store is None:
+            return
+        keys: np.ndarray = self.store.delete(owner)
+        with self._lock:
+            polylines: list[str] = list(self._routes)
+            for polyline in np.array(polylines, dtype=object)[
+                    np.isin(route_keys(polylines), keys)]:
+                del self._routes[polyline]
+
+    def expire(self, retention_days: float) -> None:
+        """
+        Delete the routes written to the route store before the retention
+        period, the cache drops them when they are the least recently used.
+
+        Parameters
+        ----------
+        retention_days : float
+            The days the routes are kept.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.store is not None:
+            self.store.expire(retention_days)
+
+
+ROUTES: RouteCache = RouteCache(backend.ROUTE_CACHE,
+                                RouteStore(backend.PATH_ROUTES)
+                                if backend.PATH_ROUTES else None)
+
+
+if __name__ == "__main__":
+    pass
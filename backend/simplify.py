@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+The levels of detail of the routes for the world map. The Douglas-Peucker
+simplification of all routes is computed once, in bulk, as the significance
+of every point: a route simplified for a tolerance keeps the points whose
+significance exceeds it, which is the same as running Douglas-Peucker with
+that tolerance. The tolerance of a level follows from the zoom of the map, so
+a simplified route deviates less than LOD_PIXELS from the route on screen.
+
+functions:
+    mercator
+    route_significance
+    zoom_tolerance
+
+classes:
+    RouteLevels
+"""
+# Standard library
+import collections
+import threading
+import typing
+# Third party
+import numpy as np
+# Local imports
+import backend
+
+
+def mercator(coords: np.ndarray) -> np.ndarray:
+    """
+    Project the coordinates to web mercator in degrees of longitude, the
+    units in which a pixel of the map has the same size everywhere.
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        The latitude and longitude of the points, of shape (points, 2).
+
+    Returns
+    -------
+    np.ndarray
+        The x and y of the points, of shape (points, 2).
+
+    """
+    lat: np.ndarray = np.radians(np.clip(coords[:, 0], -85., 85.))
+    return np.column_stack((coords[:, 1],
+                            np.degrees(np.log(np.tan(np.pi / 4 + lat / 2)))))
+
+
+def zoom_tolerance(zoom: float) -> float:
+    """
+    The tolerance of the simplification for a zoom of the map, LOD_PIXELS
+    pixels of tiles of 256 pixels in degrees of longitude.
+
+    Parameters
+    ----------
+    zoom : float
+        The zoom of the map.
+
+    Returns
+    -------
+    float
+        The tolerance in degrees of longitude.
+
+    """
+    return backend.LOD_PIXELS * 360 / (256 * 2 ** zoom)
+
+
+def route_significance(coords: np.ndarray,
+                       offsets: np.ndarray) -> np.ndarray:
+    """
+    The Douglas-Peucker significance of every point of many routes at once,
+    in the layout of decode_polylines. The segments of all routes are split
+    together, one level of the recursion per pass: every segment is split at
+    its point furthest from it, whose significance is that distance capped at
+    the significance of the split before it. The first and last points of a
+    route are always kept.
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        The latitude and longitude of all points, of shape (points, 2).
+    offsets : np.ndarray
+        The index of the first point of every route and the amount of points.
+
+    Returns
+    -------
+    significance : np.ndarray
+        The significance of every point in degrees of longitude, inf for the
+        first and last points of the routes.
+
+    """
+    points: np.ndarray = mercator(coords)
+    significance: np.ndarray = np.zeros(len(points))
+    nonempty: np.ndarray = offsets[1:] > offsets[:-1]
+    first: np.ndarray = offsets[:-1][nonempty]
+    last: np.ndarray = offsets[1:][nonempty] - 1
+    significance[first] = significance[last] = np.inf
+    cap: np.ndarray = np.full(len(first), np.inf)
+    while len(first):
+        # only the segments with points between their ends are split
+        inner: np.ndarray = last - first - 1
+        split: np.ndarray = inner > 0
+        first, last, cap, inner = (first[split], last[split], cap[split],
+                                   inner[split])
+        if not len(first):
+            break
+        segment: np.ndarray = np.repeat(np.arange(len(first)), inner)
+        starts: np.ndarray = np.cumsum(inner) - inner
+        index: np.ndarray = np.repeat(first + 1 - starts, inner) +\
+            np.arange(inner.sum())
+        # the distance of the points to the segment between the ends
+        origin: np.ndarray = points[first][segment]
+        direction: np.ndarray = points[last][segment] - origin
+        offset: np.ndarray = points[index] - origin
+        squared: np.ndarray = np.einsum("ij,ij->i", direction, direction)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction: np.ndarray = np.clip(np.where(
+                squared > 0,
+                np.einsum("ij,ij->i", offset, direction) / squared,
+                0.), 0., 1.)
+        distance: np.ndarray = np.hypot(
+            *(offset - fraction[:, None] * direction).T)
+        # the first point with the largest distance of every segment
+        largest: np.ndarray = np.maximum.reduceat(distance, starts)
+        candidates: np.ndarray = np.flatnonzero(
+            distance == np.repeat(largest, inner))
+        _, chosen = np.unique(segment[candidates], return_index=True)
+        middle: np.ndarray = index[candidates[chosen]]
+        cap = np.minimum(largest, cap)
+        significance[middle] = cap
+        first, last, cap = (np.concatenate((first, middle)),
+                            np.concatenate((middle, last)),
+                            np.concatenate((cap, cap)))
+    return significance
+
+
+class RouteLevels:
+    """
+    The significance of the points of the routes and the simplified routes
+    per level of detail, shared by all sessions. The routes are taken from a
+    route cache and a level is an integer zoom of the map.
+
+    Parameters
+    ----------
+    routes : backend.RouteCache
+        The cache of the decoded routes.
+    maxsize : int
+        The amount of routes kept per cache before the least recently used
+        are dropped.
+
+    """
+
+    def __init__(self,
+                 routes: "backend.RouteCache",
+                 maxsize: int) -> None:
+        self.routes: "backend.RouteCache" = routes
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._significance: collections.OrderedDict = \
+            collections.OrderedDict()
+        self._simplified: collections.OrderedDict = collections.OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def _keys(polylines: typing.Iterable[str | None]) -> list[str | None]:
+        """
+        The keys of the polylines, None for a missing polyline.
+        """
+        return [line if isinstance(line, str) and line else None
+                for line in polylines]
+
+    @staticmethod
+    def _store(cache: collections.OrderedDict,
+               items: typing.Iterable[tuple],
+               maxsize: int) -> None:
+        """
+        Add the items to a cache and drop the least recently used above its
+        size.
+        """
+        cache.update(items)
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+
+    def significance(self,
+                     polylines: typing.Iterable[str | None],
+                     owner: int | str = None) -> list[np.ndarray]:
+        """
+        The significance of the points of the routes, computed at once for the
+        routes that are not cached yet.
+
+        Parameters
+        ----------
+        polylines : typing.Iterable[str | None]
+            The encoded polylines, a missing polyline is an empty route.
+        owner : int | str, optional
+            The athlete whose routes they are, as for RouteCache.get_many.
+            The default is None.
+
+        Returns
+        -------
+        list[np.ndarray]
+            The significance of every point of every route.
+
+        """
+        keys: list[str | None] = self._keys(polylines)
+        found: dict = {}
+        with self._lock:
+            for key in keys:
+                if key is not None and key not in found and\
+                        (values := self._significance.get(key)) is not None:
+                    self._significance.move_to_end(key)
+                    found[key] = values
+        missing: list[str] = list(dict.fromkeys(
+            key for key in keys if key is not None and key not in found))
+        if missing:
+            routes: list[np.ndarray] = self.routes.get_many(missing, owner)
+            lengths: np.ndarray = np.fromiter(map(len, routes),
+                                              dtype=np.int64,
+                                              count=len(routes))
+            offsets: np.ndarray = np.concatenate(([0], np.cumsum(lengths)))
+            computed: list[np.ndarray] = backend.split_routes(
+                route_significance(np.concatenate(routes).reshape(-1, 2),
+                                   offsets),
+                offsets)
+            found.update(zip(missing, computed))
+            with self._lock:
+                self._store(self._significance,
+                            zip(missing, computed),
+                            self.maxsize)
+        empty: np.ndarray = np.empty(0)
+        return [empty if key is None else found[key] for key in keys]
+
+    def get_many(self,
+                 polylines: typing.Iterable[str | None],
+                 zoom: int,
+                 owner: int | str = None) -> list[np.ndarray]:
+        """
+        The routes simplified for a zoom of the map.
+
+        Parameters
+        ----------
+        polylines : typing.Iterable[str | None]
+            The encoded polylines, a missing polyline is an empty route.
+        zoom : int
+            The level of detail, the zoom of the map the routes are
+            simplified for.
+        owner : int | str, optional
+            The athlete whose routes they are, as for RouteCache.get_many.
+            The default is None.
+
+        Returns
+        -------
+        list[np.ndarray]
+            The coordinates of every simplified route, of shape (points, 2).
+
+        """
+        keys: list[str | None] = self._keys(polylines)
+        found: dict = {}
+        with self._lock:
+            for key in keys:
+                if key is not None and key not in found and\
+                        (route := self._simplified.get((zoom, key)))\
+                        is not None:
+                    self._simplified.move_to_end((zoom, key))
+                    found[key] = route
+                    self.hits += 1
+        missing: list[str] = list(dict.fromkeys(
+            key for key in keys if key is not None and key not in found))
+        if missing:
+            tolerance: float = zoom_tolerance(zoom)
+            simplified: list[np.ndarray] = [
+                route[significance > tolerance]
+                for route, significance in zip(
+                    self.routes.get_many(missing, owner),
+                    self.significance(missing, owner))]
+            found.update(zip(missing, simplified))
+            with self._lock:
+                self.misses += len(missing)
+                self._store(self._simplified,
+                            (((zoom, key), route)
+                             for key, route in zip(missing, simplified)),
+                            self.maxsize * (backend.LOD_MAX_ZOOM + 1))
+        empty: np.ndarray = np.empty((0, 2))
+        return [empty if key is None else found[key] for key in keys]
+
+    def fit(self,
+            polylines: typing.Iterable[str | None],
+            budget: int = None,
+            zoom: int = None,
+            owner: int | str = None) -> tuple[list[np.ndarray], int]:
+        """
+        The routes at the level of detail of a zoom of the map, or at the
+        finest coarser level that stays within a budget of points. When even
+        the coarsest level exceeds it, the routes with the smallest extent are
+        left out, their activities keep their start.
+
+        Parameters
+        ----------
+        polylines : typing.Iterable[str | None]
+            The encoded polylines, a missing polyline is an empty route.
+        budget : int, optional
+            The amount of points of all routes together at most. The default
+            is None which does not limit them.
+        zoom : int, optional
+            The zoom of the map, the finest level of detail used. The default
+            is None which uses LOD_MAX_ZOOM.
+        owner : int | str, optional
+            The athlete whose routes they are, as for RouteCache.get_many.
+            The default is None.
+
+        Returns
+        -------
+        routes : list[np.ndarray]
+            The coordinates of every simplified route, of shape (points, 2).
+        zoom : int
+            The level of detail of the routes.
+
+        """
+        keys: list[str | None] = self._keys(polylines)
+        finest: int = backend.LOD_MAX_ZOOM if zoom is None else\
+            int(np.clip(zoom, 0, backend.LOD_MAX_ZOOM))
+        if budget is None:
+            return self.get_many(keys, finest, owner), finest
+        significance: np.ndarray = np.sort(np.concatenate(
+            [np.empty(0)] + self.significance(keys, owner)))
+        # the amount of points kept by every level from the finest down
+        zooms: np.ndarray = np.arange(finest, -1, -1)
+        kept: np.ndarray = len(significance) - np.searchsorted(
+            significance,
+            [zoom_tolerance(zoom) for zoom in zooms],
+            side="right")
+        fitting: np.ndarray = np.flatnonzero(kept <= budget)
+        zoom: int = int(zooms[fitting[0] if len(fitting) else -1])
+        routes: list[np.ndarray] = self.get_many(keys, zoom, owner)
+        if len(fitting) == 0:
+            extent: np.ndarray = np.array([np.ptp(route, axis=0).max()
+                                           if len(route) else 0.
+                                           for route in routes])
+            order: np.ndarray = np.argsort(-extent, kind="stable")
+            lengths: np.ndarray = np.fromiter(map(len, routes),
+                                              dtype=np.int64,
+                                              count=len(routes))
+            dropped: np.ndarray = order[np.cumsum(lengths[order]) > budget]
+            empty: np.ndarray = np.empty((0, 2))
+            for index in dropped:
+                routes[index] = empty
+        return routes, zoom
+
+    def info(self) -> dict:
+        """
+        The statistics of the caches.
+
+        Returns
+        -------
+        dict
+            The hits, misses, amount of routes with a significance and of
+            simplified routes kept.
+
+        """
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "routes": len(self._significance),
+                    "simplified": len(self._simplified)}
+
+    def clear(self) -> None:
+        """
+        Drop all significances and simplified routes.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            self._significance.clear()
+            self._simplified.clear()
+
+
+LEVELS: RouteLevels = RouteLevels(backend.ROUTES, backend.ROUTE_CACHE)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+The process wide single flight of the retrievals, so the sessions requesting
+the history of the same athlete at the same time share one retrieval instead
+of each retrieving it again.
+
+functions:
+    shared_pages
+
+classes:
+    Flight
+    SingleFlight
+"""
+# Standard library
+import logging
+import threading
+import typing
+# Third party
+import pandas as pd
+# Local imports
+import backend
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """
+    A retrieval in progress with the pages retrieved so far, which every
+    session following it replays from the first page.
+    """
+
+    def __init__(self) -> None:
+        self.pages: list[pd.DataFrame] = []
+        self.done: bool = False
+        self.complete: bool = False
+        self.error: Exception = None
+        self._condition: threading.Condition = threading.Condition()
+
+    def publish(self, page: pd.DataFrame) -> None:
+        """
+        Add a retrieved page for the followers.
+
+        Parameters
+        ----------
+        page : pd.DataFrame
+            The parsed activities of a page.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._condition:
+            self.pages.append(page)
+            self._condition.notify_all()
+
+    def finish(self,
+               complete: bool,
+               error: Exception = None) -> None:
+        """
+        End the retrieval.
+
+        Parameters
+        ----------
+        complete : bool
+            Whether all pages were retrieved.
+        error : Exception, optional
+            The failure of the retrieval. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._condition:
+            self.done = True
+            self.complete = complete
+            self.error = error
+            self._condition.notify_all()
+
+    def follow(self,
+               cancel: threading.Event = None
+               ) -> typing.Iterator[pd.DataFrame]:
+        """
+        Yield the pages retrieved so far and the pages that follow until the
+        retrieval ends.
+
+        Parameters
+        ----------
+        cancel : threading.Event, optional
+            Stop following when it is set, ending the iteration without an
+            error. The default is None.
+
+        Raises
+        ------
+        FetchError
+            When the retrieval failed or was interrupted before it completed.
+
+        Yields
+        ------
+        pd.DataFrame
+            The parsed activities of a page.
+
+        """
+        index: int = 0
+        while True:
+            with self._condition:
+                while index == len(self.pages) and not self.done:
+                    if cancel is not None and cancel.is_set():
+                        return
+                    self._condition.wait(timeout=.1)
+                pages: list[pd.DataFrame] = self.pages[index:]
+                done: bool = self.done
+            for page in pages:
+                yield page
+            index += len(pages)
+            if done and index == len(self.pages):
+                break
+        if self.error is not None:
+            raise backend.FetchError(str(self.error)) from self.error
+        if not self.complete:
+            raise backend.FetchError("The retrieval of the session that "
+                                     "started it was interrupted")
+
+
+class SingleFlight:
+    """
+    The retrievals in progress per key, such as the id of the athlete, and
+    the amount of retrievals that were started and that were coalesced with
+    one in progress.
+    """
+
+    def __init__(self) -> None:
+        self.started: int = 0
+        self.coalesced: int = 0
+        self.completed: int = 0
+        self.interrupted: int = 0
+        self.failed: int = 0
+        self._flights: dict[typing.Hashable, Flight] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def join(self, key: typing.Hashable) -> tuple[Flight, bool]:
+        """
+        Join the retrieval of the key in progress or start a new one.
+
+        Parameters
+        ----------
+        key : typing.Hashable
+            The key of the retrieval.
+
+        Returns
+        -------
+        flight : Flight
+            The retrieval.
+        leader : bool
+            Whether the caller started the retrieval and has to run it.
+
+        """
+        with self._lock:
+            flight: Flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.started += 1
+            return flight, True
+
+    def finish(self,
+               key: typing.Hashable,
+               flight: Flight,
+               complete: bool,
+               error: Exception = None) -> None:
+        """
+        End the retrieval of the key, the next request starts a new one.
+
+        Parameters
+        ----------
+        key : typing.Hashable
+            The key of the retrieval.
+        flight : Flight
+            The retrieval.
+        complete : bool
+            Whether all pages were retrieved.
+        error : Exception, optional
+            The failure of the retrieval. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if error is not None:
+                self.failed += 1
+            elif complete:
+                self.completed += 1
+            else:
+                self.interrupted += 1
+        flight.finish(complete, error)
+
+    def stats(self) -> dict:
+        """
+        The counts of the retrievals.
+
+        Returns
+        -------
+        dict
+            The retrievals started, coalesced, in progress, completed,
+            interrupted and failed.
+
+        """
+        with self._lock:
+            return {"started": self.started,
+                    "coalesced": self.coalesced,
+                    "in flight": len(self._flights),
+                    "completed": self.completed,
+                    "interrupted": self.interrupted,
+                    "failed": self.failed}
+
+
+FLIGHTS: SingleFlight = SingleFlight()
+
+
+def shared_pages(key: typing.Hashable,
+                 start: typing.Callable[[], typing.Iterator[pd.DataFrame]],
+                 cancel: threading.Event = None,
+                 stats: dict = None) -> typing.Iterator[pd.DataFrame]:
+    """
+    Iterate the pages of the retrieval of the key, attaching to the retrieval
+    in progress in another session or starting it. The session that starts it
+    runs it and publishes every page, the other sessions replay the pages. A
+    follower whose leader is cancelled or stops gets a FetchError with the
+    pages so far, like a failed retrieval, so the next sync resumes it.
+
+    Parameters
+    ----------
+    key : typing.Hashable
+        The key of the retrieval, such as the id of the athlete. None starts
+        a retrieval that is not shared.
+    start : typing.Callable[[], typing.Iterator[pd.DataFrame]]
+        Starts the retrieval, such as iter_get_and_parse with the token.
+    cancel : threading.Event, optional
+        The signal to cancel the retrieval of the caller, also passed to the
+        retrieval by start. The default is None.
+    stats : dict, optional
+        A dictionary receiving under leader whether the caller runs the
+        retrieval, only the leader should store its result. The default is
+        None.
+
+    Raises
+    ------
+    FetchError
+        When the retrieval fails or, for a follower, when it was interrupted.
+
+    Yields
+    ------
+    pd.DataFrame
+        The parsed activities of a page.
+
+    """
+    stats: dict = {} if stats is None else stats
+    if key is None:
+        stats["leader"] = True
+        yield from start()
+        return
+    flight, leader = FLIGHTS.join(key)
+    stats["leader"] = leader
+    if not leader:
+        LOGGER.info("Joined the retrieval of %s in progress", key)
+        yield from flight.follow(cancel)
+        return
+    complete: bool = False
+    error: Exception = None
+    try:
+        for page in start():
+            flight.publish(page)
+            yield page
+        complete = cancel is None or not cancel.is_set()
+    except Exception as failure:
+        error = failure
+        raise
+    finally:
+        FLIGHTS.finish(key, flight, complete, error)
+
+
+if __name__ == "__main__":
+    pass
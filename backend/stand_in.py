@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+A local stand-in for the Strava API and the reverse lookup of Nominatim to
+exercise and benchmark the retrieval of the activities without sending
+requests to Strava or Nominatim.
+
+functions:
+    synthetic_activities
+
+classes:
+    StandInServer
+"""
+# Standard library
+import datetime as dt
+import http.server
+import json
+import math
+import random
+import threading
+import time
+import typing
+import urllib.parse
+# Third party
+import polyline
+# Local imports
+import backend
+
+SPORT_TYPES: list[str] = ["Ride", "Run", "Walk", "Hike", "Swim",
+                          "MountainBikeRide", "VirtualRide", "Yoga"]
+
+
+def synthetic_activities(count: int,
+                         seed: int = 0,
+                         start: str = "2015-01-01T00:00:00Z",
+                         points: int = 100) -> list[dict]:
+    """
+    Create a history of activities in the format of the Strava API, spread
+    evenly at random between start and now with a random walk as route.
+
+    Parameters
+    ----------
+    count : int
+        The amount of activities.
+    seed : int, optional
+        The seed of the random generator. The default is 0.
+    start : str, optional
+        The date of the first activity. The default is "2015-01-01T00:00:00Z".
+    points : int, optional
+        The average amount of points per route. The default is 100.
+
+    Returns
+    -------
+    activities : list[dict]
+        The activities sorted by their start date.
+
+    """
+    generator: random.Random = random.Random(seed)
+    first: float = dt.datetime.strptime(start, backend.DT_FORMAT).replace(
+        tzinfo=dt.timezone.utc).timestamp()
+    moments: list[float] = sorted(generator.uniform(first, time.time())
+                                  for _ in range(count))
+    activities: list[dict] = []
+    for number, moment in enumerate(moments):
+        offset: int = generator.choice([-7, 0, 1, 2]) * 3600
+        sport_type: str = generator.choice(SPORT_TYPES)
+        lat: float = generator.uniform(35, 60)
+        lon: float = generator.uniform(-10, 30)
+        route: list[tuple[float]] = [(lat, lon)]
+        for _ in range(max(1, int(generator.gauss(points, points / 4)))):
+            route.append((route[-1][0] + generator.gauss(0, 5e-4),
+                          route[-1][1] + generator.gauss(0, 5e-4)))
+        indoor: bool = sport_type in ("VirtualRide", "Yoga")
+        activities.append({
+            "id": 1_000_000_000 + number,
+            "name": f"{sport_type} {number}",
+            "type": sport_type,
+            "sport_type": sport_type,
+            "start_date": dt.datetime.fromtimestamp(
+                moment, dt.timezone.utc).strftime(backend.DT_FORMAT),
+            "start_date_local": dt.datetime.fromtimestamp(
+                moment + offset, dt.timezone.utc).strftime(backend.DT_FORMAT),
+            "utc_offset": offset,
+            "start_latlng": [] if indoor else [round(lat, 2), round(lon, 2)],
+            "map": {"id": f"a{number}",
+                    "summary_polyline": None if indoor
+                    else polyline.encode(route, 5),
+                    "resource_state": 2}
+                           })
+    return activities
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Answer the requests of the app like the Strava API would.
+    """
+    # keep the connections alive like the Strava API does
+    protocol_version: str = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        """
+        Silence the logging of every request.
+        """
+
+    def _respond(self,
+                 body: typing.Any,
+                 status: int = 200) -> None:
+        """
+        Send the body as json with the rate limit headers.
+
+        Parameters
+        ----------
+        body : typing.Any
+            The json serializable body.
+        status : int, optional
+            The HTTP status code. The default is 200.
+
+        Returns
+        -------
+        None.
+
+        """
+        content: bytes = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in self.server.rate_limit_headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _handle(self) -> None:
+        """
+        Delay, count and route the request, failing on purpose at the
+        configured error rate.
+
+        Returns
+        -------
+        None.
+
+        """
+        server: StandInServer = self.server
+        url: urllib.parse.ParseResult = urllib.parse.urlparse(self.path)
+        query: dict = dict(urllib.parse.parse_qsl(url.query))
+        if self.command == "POST":
+            length: int = int(self.headers.get("Content-Length", 0))
+            query.update(urllib.parse.parse_qsl(
+                self.rfile.read(length).decode("utf-8")))
+        time.sleep(max(0., server.latency +
+                       server.random.uniform(-server.jitter, server.jitter)))
+        if not server.count_request():
+            self._respond({"message": "Rate Limit Exceeded"}, 429)
+        elif server.random.random() < server.error_rate:
+            self._respond({"message": "Internal Server Error"}, 500)
+        elif url.path == "/oauth/token":
+            self._respond({"access_token": "access",
+                           "refresh_token": "refresh",
+                           "athlete": server.athlete})
+        elif url.path == "/api/v3/athlete":
+            self._respond(server.athlete)
+        elif url.path == "/api/v3/athlete/activities":
+            self._respond(server.activities_page(query))
+        elif url.path == "/reverse":
+            server.reverse_requests.append((time.monotonic(),
+                                            self.headers.get("User-Agent")))
+            self._respond(server.reverse(query))
+        else:
+            self._respond({"message": "Record Not Found"}, 404)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    """
+    A local HTTP server with the OAuth token, athlete and activities endpoints
+    of the Strava API, serving a synthetic or recorded history, and the
+    reverse endpoint of Nominatim answered with the offline country index.
+
+    Used as a context manager it runs in a background thread and points the
+    links in backend to itself.
+
+    Parameters
+    ----------
+    activities : list[dict]
+        The synthetic or recorded activities to serve.
+    latency : float, optional
+        The seconds every response is delayed. The default is 0.05.
+    jitter : float, optional
+        The maximum seconds added to or subtracted from the latency. The
+        default is 0.
+    error_rate : float, optional
+        The fraction of requests answered with a 500. The default is 0.
+    rate_limits : tuple[int], optional
+        The requests allowed per 15 minutes and per day. The default is
+        (100_000, 1_000_000).
+    seed : int, optional
+        The seed of the random generator. The default is 0.
+
+    """
+    daemon_threads: bool = True
+    _links: tuple[str] = ("ACTIVITIES_LINK", "ATHLETE_URL", "TOKEN_LINK",
+                          "NOMINATIM_LINK")
+
+    def __init__(self,
+                 activities: list[dict],
+                 latency: float = 0.05,
+                 jitter: float = 0.,
+                 error_rate: float = 0.,
+                 rate_limits: tuple[int] = (100_000, 1_000_000),
+                 seed: int = 0) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.error_rate: float = error_rate
+        self.rate_limits: tuple[int] = rate_limits
+        self.random: random.Random = random.Random(seed)
+        self.requests: int = 0
+        # the moment and User-Agent of every reverse lookup
+        self.reverse_requests: list[tuple] = []
+        self._usage: list[int] = [0, 0]
+        # the window of every usage, counted like Strava from the quarter
+        # hour and from midnight UTC
+        self._windows: list[int] = [-1, -1]
+        self._lock: threading.Lock = threading.Lock()
+        self._thread: threading.Thread = None
+        self._original: dict = {}
+        self.activities: list[dict] = sorted(
+            activities, key=lambda activity: activity.get("start_date", ""))
+        # the epoch start of every activity for the before and after filters
+        self._moments: list[float] = [
+            dt.datetime.strptime(activity.get("start_date"), backend.DT_FORMAT
+                                 ).replace(tzinfo=dt.timezone.utc).timestamp()
+            for activity in self.activities]
+        created: str = self.activities[0].get("start_date")\
+            if self.activities else "2015-01-01T00:00:00Z"
+        self.athlete: dict = {"id": 1, "firstname": "Stand", "lastname": "In",
+                              "created_at": created}
+
+    @property
+    def url(self) -> str:
+        """
+        The base url of the server.
+        """
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count_request(self) -> bool:
+        """
+        Count the request in both rate limit windows, starting a window from
+        zero when it has passed.
+
+        Returns
+        -------
+        bool
+            Whether the request is within the rate limits.
+
+        """
+        with self._lock:
+            self.requests += 1
+            now: float = time.time()
+            windows: list[int] = [int(now // 900), int(now // 86400)]
+            self._usage = [(usage if window == current else 0) + 1
+                           for usage, window, current in zip(
+                               self._usage, windows, self._windows)]
+            self._windows = windows
+            return all(usage <= limit
+                       for usage, limit in zip(self._usage, self.rate_limits))
+
+    def rate_limit_headers(self) -> dict:
+        """
+        The rate limit headers as sent by the Strava API.
+
+        Returns
+        -------
+        dict
+            The X-RateLimit-Limit and X-RateLimit-Usage headers.
+
+        """
+        return {"X-RateLimit-Limit": ",".join(map(str, self.rate_limits)),
+                "X-RateLimit-Usage": ",".join(map(str, self._usage))}
+
+    def activities_page(self, query: dict) -> list[dict]:
+        """
+        Select a page of activities, newest first unless after is given.
+
+        Parameters
+        ----------
+        query : dict
+            The query string elements page, per_page, before and after.
+
+        Returns
+        -------
+        list[dict]
+            The activities on the page.
+
+        """
+        after: float = float(query.get("after", -math.inf))
+        before: float = float(query.get("before", math.inf))
+        page: int = int(query.get("page", 1))
+        per_page: int = min(int(query.get("per_page", 30)), 200)
+        selected: list[dict] = [activity for activity, moment
+                                in zip(self.activities, self._moments)
+                                if after < moment < before]
+        if "after" not in query:
+            selected.reverse()
+        return selected[(page - 1) * per_page:page * per_page]
+
+    def reverse(self, query: dict) -> dict:
+        """
+        Answer a reverse lookup at country level like Nominatim.
+
+        Parameters
+        ----------
+        query : dict
+            The query string elements lat and lon.
+
+        Returns
+        -------
+        dict
+            The address with the country code, or an error outside every
+            country.
+
+        """
+        country: str = backend.locate_countries(
+            [float(query.get("lat", "nan"))],
+            [float(query.get("lon", "nan"))]
+                                                )[0]
+        codes: dict = {name: code
+                       for code, name in backend.strava.COUNTRIES.items()}
+        if country not in codes:
+            return {"error": "Unable to geocode"}
+        return {"address": {"country": country,
+                            "country_code": codes[country].lower()}}
+
+    def __enter__(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        # point the links of the app to the stand-in
+        self._original = {link: getattr(backend, link)
+                          for link in self._links}
+        backend.ACTIVITIES_LINK = f"{self.url}/api/v3/athlete/activities"
+        backend.ATHLETE_URL = f"{self.url}/api/v3/athlete"
+        backend.TOKEN_LINK = f"{self.url}/oauth/token"
+        backend.NOMINATIM_LINK = f"{self.url}/reverse"
+        return self
+
+    def __exit__(self, *args) -> None:
+        for link, value in self._original.items():
+            setattr(backend, link, value)
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    pass
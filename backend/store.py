@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+The local store of parsed activities per athlete and the incremental sync that
+keeps it up to date. The activities are kept as Arrow IPC (Feather) files,
+which are also the format to export and import a parsed history. A history
+that was not synced for STORE_RETENTION_DAYS is deleted, and an athlete can
+delete theirs at once, together with the decoded routes of the athlete.
+"""
+# Standard library
+import concurrent.futures as c_futures
+import contextlib
+import datetime as dt
+import functools
+import json
+import logging
+import os
+import threading
+import time
+# Third party
+import pandas as pd
+from pyarrow import feather
+# Local imports
+import backend
+
+# a small process wide pool so background syncs never block a session
+_SYNC_POOL: c_futures.ThreadPoolExecutor = c_futures.ThreadPoolExecutor(
+    max_workers=2,
+    thread_name_prefix="sync"
+                                                                         )
+LOGGER: logging.Logger = logging.getLogger(__name__)
+_SYNCS: dict = {}
+# the athletes that deleted their activities while a sync was running
+_DELETED: set = set()
+_SYNCS_LOCK: threading.Lock = threading.Lock()
+# the moment the expired snapshots were last removed
+_PURGED_AT: float = 0.
+_PURGE_INTERVAL: float = 3600.
+
+
+def write_activities(data: pd.DataFrame,
+                     path: str) -> None:
+    """
+    Export parsed activities, with the encoded routes, to an Arrow IPC
+    (Feather) file that keeps the compact dtypes of the columns.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The parsed activities.
+    path : str
+        The file path.
+
+    Returns
+    -------
+    None.
+
+    """
+    feather.write_feather(data.reset_index(drop=True),
+                          path,
+                          compression=backend.SNAPSHOT_COMPRESSION)
+
+
+def read_activities(path: str,
+                    columns: list[str] = None) -> pd.DataFrame:
+    """
+    Import parsed activities from an Arrow IPC (Feather) file. Only the
+    requested columns are read from the file.
+
+    Parameters
+    ----------
+    path : str
+        The file path.
+    columns : list[str], optional
+        The columns to read. The default is None which reads all columns.
+
+    Returns
+    -------
+    pd.DataFrame
+        The parsed activities.
+
+    """
+    return backend.apply_schema(feather.read_table(path,
+                                                   columns=columns
+                                                   ).to_pandas())
+
+
+def _paths(athlete_id: int) -> tuple[str]:
+    """
+    The file paths of the stored activities and their metadata.
+
+    Parameters
+    ----------
+    athlete_id : int
+        The id of the athlete.
+
+    Returns
+    -------
+    tuple[str]
+        The path of the activities and the path of the metadata.
+
+    """
+    base: str = os.path.join(backend.PATH_STORE, str(athlete_id))
+    return f"{base}.arrow", f"{base}.json"
+
+
+def load_snapshot(athlete_id: int,
+                  columns: list[str] = None) -> tuple[pd.DataFrame | None,
+                                                      dict]:
+    """
+    Load the stored activities of the athlete.
+
+    Parameters
+    ----------
+    athlete_id : int
+        The id of the athlete.
+    columns : list[str], optional
+        The columns to load. The default is None which loads all columns.
+
+    Returns
+    -------
+    data : pd.DataFrame | None
+        The stored activities or None if nothing is stored.
+    meta : dict
+        The epoch timestamps of the last sync and reconciliation.
+
+    """
+    data_path, meta_path = _paths(athlete_id)
+    if athlete_id is None or not os.path.exists(meta_path) or\
+            not os.path.exists(data_path):
+        return None, {}
+    data: pd.DataFrame = read_activities(data_path, columns)
+    with open(meta_path, mode="r") as file:
+        meta: dict = json.load(file)
+    return data, meta
+
+
+def save_snapshot(athlete_id: int,
+                  data: pd.DataFrame,
+                  meta: dict) -> None:
+    """
+    Store the activities of the athlete, replacing the files at once so a
+    reader never sees a partially written snapshot. Nothing is stored for an
+    athlete who deleted their activities while a sync was running.
+
+    Parameters
+    ----------
+    athlete_id : int
+        The id of the athlete.
+    data : pd.DataFrame
+        The parsed activities.
+    meta : dict
+        The epoch timestamps of the last sync and reconciliation.
+
+    Returns
+    -------
+    None.
+
+    """
+    with _SYNCS_LOCK:
+        if athlete_id in _DELETED:
+            return
+    os.makedirs(backend.PATH_STORE, exist_ok=True)
+    data_path, meta_path = _paths(athlete_id)
+    write_activities(data, f"{data_path}.tmp")
+    with open(f"{meta_path}.tmp", mode="w") as file:
+        json.dump(meta, file)
+    os.replace(f"{data_path}.tmp", data_path)
+    os.replace(f"{meta_path}.tmp", meta_path)
+    if time.time() - _PURGED_AT > _PURGE_INTERVAL:
+        purge_snapshots()
+
+
+def replace_snapshot(athlete_id: int,
+                     data: pd.DataFrame,
+                     partial: bool = False) -> None:
+    """
+    Store an entire history that was just retrieved as a reconciled snapshot.
+
+    Parameters
+    ----------
+    athlete_id : int
+        The id of the athlete.
+    data : pd.DataFrame
+        The parsed activities.
+    partial : bool, optional
+        Whether the retrieval was interrupted, storing only the most recent
+        activities for the next sync to resume with the older ones. A partial
+        history does not replace a complete snapshot with as many activities,
+        such as the one stored by another session meanwhile. The default is
+        False.
+
+    Returns
+    -------
+    None.
+
+    """
+    if athlete_id is None:
+        return
+    if partial:
+        stored, stored_meta = load_snapshot(athlete_id, ["id"])
+        if stored is not None and not stored_meta.get("partial") and\
+                len(stored) >= len(data):
+            return
+    now: float = time.time()
+    meta: dict = {"reconciled_at": now,
+                  "synced_at": now}
+    if partial:
+        meta.update({"partial": True})
+    save_snapshot(athlete_id, data, meta)
+
+
+def _remove(athlete_id: int | str) -> None:
+    """
+    Remove the files of the stored activities of the athlete and the decoded
+    routes of the athlete.
+    """
+    for path in _paths(athlete_id):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+    if athlete_id is not None:
+        backend.ROUTES.delete(athlete_id)
+
+
+def _deleted(athlete_id: int,
+             future: c_futures.Future) -> None:
+    """
+    Remove the files again once the sync running during the deletion ended,
+    in case it stored them, and allow storing the athlete again.
+    """
+    _ = future
+    _remove(athlete_id)
+    with _SYNCS_LOCK:
+        _DELETED.discard(athlete_id)
+
+
+def delete_snapshot(athlete_id: int) -> None:
+    """
+    Delete the stored activities of the athlete without waiting for a
+    background sync of the athlete that is still running. That sync does not
+    store them again and its files are removed once more when it ends.
+
+    Parameters
+    ----------
+    athlete_id : int
+        The id of the athlete.
+
+    Returns
+    -------
+    None.
+
+    """
+    if athlete_id is None:
+        return
+    with _SYNCS_LOCK:
+        future: c_futures.Future = _SYNCS.pop(athlete_id, None)
+        if future is not None and not future.done():
+            _DELETED.add(athlete_id)
+    _remove(athlete_id)
+    if future is not None:
+        future.add_done_callback(functools.partial(_deleted, athlete_id))
+
+
+def purge_snapshots(retention_days: float = None) -> list[str]:
+    """
+    Delete the stored activities of the athletes that were not synced within
+    the retention period, with their routes, and the decoded routes and the
+    Nominatim lookups older than it.
+
+    Parameters
+    ----------
+    retention_days : float, optional
+        The days a history is kept after its last sync. The default is None
+        which uses STORE_RETENTION_DAYS.
+
+    Returns
+    -------
+    purged : list[str]
+        The athlete ids whose activities were deleted.
+
+    """
+    global _PURGED_AT
+    retention_days = retention_days or backend.STORE_RETENTION_DAYS
+    _PURGED_AT = now = time.time()
+    purged: list[str] = []
+    backend.purge_lookups(retention_days)
+    backend.ROUTES.expire(retention_days)
+    if not os.path.isdir(backend.PATH_STORE):
+        return purged
+    for name in os.listdir(backend.PATH_STORE):
+        athlete_id, extension = os.path.splitext(name)
+        if extension != ".json":
+            continue
+        meta_path: str = os.path.join(backend.PATH_STORE, name)
+        try:
+            with open(meta_path, mode="r") as file:
+                synced_at: float = json.load(file).get("synced_at", 0)
+        except (OSError, ValueError):
+            # a snapshot without readable metadata can not be loaded anyway
+            synced_at = 0
+        if now - synced_at > retention_days * 86400:
+            _remove(athlete_id)
+            purged.append(athlete_id)
+    return purged
+
+
+def _merge(stored: pd.DataFrame,
+           new: pd.DataFrame) -> pd.DataFrame:
+    """
+    Combine the stored activities with the retrieved ones, keeping the
+    retrieved version of an activity that is in both.
+
+    Parameters
+    ----------
+    stored : pd.DataFrame
+        The stored activities.
+    new : pd.DataFrame
+        The retrieved activities.
+
+    Returns
+    -------
+    data : pd.DataFrame
+        The activities sorted by the timestamp.
+
+    """
+    data: pd.DataFrame = stored if new.empty else\
+        backend.apply_schema(pd.concat([stored, new], ignore_index=True
+                                       ).drop_duplicates("id", keep="last"))
+    data.sort_values("timestamp", inplace=True)
+    return data
+
+
+def _epoch(timestamp: pd.Timestamp) -> int:
+    """
+    The epoch seconds of a timestamp in local time read as UTC.
+
+    Parameters
+    ----------
+    timestamp : pd.Timestamp
+        The timestamp of an activity.
+
+    Returns
+    -------
+    int
+        The epoch seconds.
+
+    """
+    return int(timestamp.replace(tzinfo=dt.timezone.utc).timestamp())
+
+
+def sync_activities(token: str,
+                    athlete_id: int,
+                    created_at: str = None) -> pd.DataFrame:
+    """
+    Bring the stored activities up to date. Only the activities newer than
+    the latest stored timestamp are requested, unless nothing is stored yet
+    or the last reconciliation is older than RECONCILE_DAYS, in which case the
+    entire history is retrieved to catch edited and deleted activities. A
+    snapshot of an interrupted retrieval is first completed with the
+    activities older than the earliest stored timestamp.
+
+    Parameters
+    ----------
+    token : str
+        Strava access token.
+    athlete_id : int
+        The id of the athlete.
+    created_at : str, optional
+        The Strava profile creation date. The default is None.
+
+    Returns
+    -------
+    data : pd.DataFrame
+        Table of all the activities.
+
+    """
+    stored, meta = load_snapshot(athlete_id)
+    now: float = time.time()
+    reconcile: bool = stored is None or stored.empty or\
+        now - meta.get("reconciled_at", 0) > backend.RECONCILE_DAYS * 86400
+    if reconcile:
+        data: pd.DataFrame = backend.fetch_activities(token, created_at)
+        replace_snapshot(athlete_id, data)
+        return data
+    # the timestamps are in local time so look a day beyond them and let the
+    # deduplication by id remove the overlap
+    if meta.pop("partial", False):
+        before: int = _epoch(stored["timestamp"].min()) + 86400
+        older: pd.DataFrame = backend.thread_get_and_parse(
+            token,
+            params={"before": before}
+                                                           )
+        stored = _merge(stored, older)
+    after: int = _epoch(stored["timestamp"].max()) - 86400
+    # a window of one page as the delta is expected to fit on it
+    new: pd.DataFrame = backend.thread_get_and_parse(token,
+                                                     window=1,
+                                                     params={"after": after})
+    data: pd.DataFrame = _merge(stored, new)
+    meta.update({"synced_at": now})
+    save_snapshot(athlete_id, data, meta)
+    return data
+
+
+def start_sync(token: str,
+               athlete_id: int,
+               created_at: str = None) -> c_futures.Future:
+    """
+    Run sync_activities in the background, reusing a sync of the same athlete
+    that is still running.
+
+    Parameters
+    ----------
+    token : str
+        Strava access token.
+    athlete_id : int
+        The id of the athlete.
+    created_at : str, optional
+        The Strava profile creation date. The default is None.
+
+    Returns
+    -------
+    future : c_futures.Future
+        The future of the sync which returns all the activities.
+
+    """
+    with _SYNCS_LOCK:
+        future: c_futures.Future = _SYNCS.get(athlete_id)
+        if future is None or future.done():
+            future = _SYNC_POOL.submit(sync_activities,
+                                       token,
+                                       athlete_id,
+                                       created_at)
+            _SYNCS[athlete_id] = future
+    return future
+
+
+def sync_done(athlete_id: int) -> bool:
+    """
+    Whether no sync of the athlete is running, without collecting its result.
+
+    Parameters
+    ----------
+    athlete_id : int
+        The id of the athlete.
+
+    Returns
+    -------
+    bool
+        Whether the sync finished or there is none.
+
+    """
+    with _SYNCS_LOCK:
+        future: c_futures.Future = _SYNCS.get(athlete_id)
+    return future is None or future.done()
+
+
+def sync_result(athlete_id: int) -> tuple[bool,
+                                          pd.DataFrame | None,
+                                          Exception | None]:
+    """
+    Collect the result of a finished background sync, logging its failure.
+
+    Parameters
+    ----------
+    athlete_id : int
+        The id of the athlete.
+
+    Returns
+    -------
+    done : bool
+        Whether no sync of the athlete is running anymore.
+    data : pd.DataFrame | None
+        The synced activities or None if there is no result or it failed.
+    error : Exception | None
+        The failure of the sync or None.
+
+    """
+    with _SYNCS_LOCK:
+        future: c_futures.Future = _SYNCS.get(athlete_id)
+        if future is None:
+            return True, None, None
+        if not future.done():
+            return False, None, None
+        _SYNCS.pop(athlete_id)
+    if (error := future.exception()) is not None:
+        LOGGER.warning("Sync of athlete %s failed: %s", athlete_id, error)
+        return True, None, error
+    return True, future.result(), None
+
+
+if __name__ == "__main__":
+    pass
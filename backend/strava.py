@@ -6,16 +6,15 @@ All the functions and variables related to using the Strava API and it's data.
 """
 
 # Third party
+import numpy as np
 import pandas as pd
-import polyline
-import streamlit as st
 # Local imports
 import backend
 
 COUNTRIES = backend.load_country_code_mapper(backend.PATH_CODES)
 
 
-def get_access(authorization_code: str) -> tuple[str]:
+def get_access(authorization_code: str) -> tuple[str | int]:
     """
     Given the authorization code in the redirect link get the tokens and the
     details of the athlete who logs in.
@@ -35,6 +34,8 @@ def get_access(authorization_code: str) -> tuple[str]:
         The combined first and last name of the athlete.
     created_at : str
         The Strava profile creation date.
+    athlete_id : int
+        The id of the athlete.
     """
     response: dict = backend.post_request(backend.TOKEN_LINK,
                                           data={
@@ -57,10 +58,11 @@ def get_access(authorization_code: str) -> tuple[str]:
                                  )
     created_at: str = response.get("athlete",
                                    {}).get("created_at", "Not found")
-    return access_token, refresh_token, athlete_name, created_at
+    athlete_id: int = response.get("athlete", {}).get("id")
+    return access_token, refresh_token, athlete_name, created_at, athlete_id
 
 
-def refresh_access(refresh_token: str) -> tuple[str]:
+def refresh_access(refresh_token: str) -> tuple[str | int]:
     """
     Based on the refresh token retrieve the same attributes as the get_access
     function.
@@ -80,6 +82,8 @@ def refresh_access(refresh_token: str) -> tuple[str]:
         The Strava refresh token.
     created_at : str
         The Strava profile creation date.
+    athlete_id : int
+        The id of the athlete.
     """
     response: dict = backend.post_request(backend.TOKEN_LINK,
                                           data={
@@ -101,13 +105,15 @@ def refresh_access(refresh_token: str) -> tuple[str]:
                                   )
                                  )
     created_at: str = athlete.get("created_at", "Not found")
-    return access_token, refresh_token, athlete_name, created_at
+    athlete_id: int = athlete.get("id")
+    return access_token, refresh_token, athlete_name, created_at, athlete_id
 
 
-@st.cache_data()
 def nomatim_lookup(lat: str, lon: str) -> dict:
     """
-    Request a reverse location lookup on the Nominatim API.
+    Request a reverse location lookup on the Nominatim API. The results are
+    kept in the persistent cache of the Nominatim worker which also keeps the
+    requests within the usage policy.
 
     Parameters
     ----------
@@ -127,9 +133,11 @@ def nomatim_lookup(lat: str, lon: str) -> dict:
                                                  "lon": lon,
                                                  "zoom": 3,  # country level
                                                  "format": "json"},
-                                         headers={} # TODO: ...
+                                         # identify the app as required by
+                                         # the usage policy
+                                         headers={"User-Agent":
+                                                  backend.NOMINATIM_USER_AGENT}
                                          )
-    print(lat, lon, response)
     return response
 
 
@@ -166,8 +174,13 @@ def parse(activities: list[dict]) -> pd.DataFrame:
     """
     Parse the Strava activities for use in the dashboard.
 
-    Decode the polyline to coordinates.
-    Reverse lookup the country from start coordinates of the activity.
+    The raw fields of the whole batch are extracted at once and every time
+    column is derived from a single conversion of the local start dates. The
+    columns get the compact dtypes of apply_schema.
+    The routes stay encoded as polylines and are decoded by ROUTES when the
+    map needs them.
+    Locate the country of the start coordinates of all activities at once
+    with the offline country index.
 
     Parameters
     ----------
@@ -183,80 +196,75 @@ def parse(activities: list[dict]) -> pd.DataFrame:
     # if no activities are provided return an empty dataframe.
     if activities == [{}]:
         return pd.DataFrame()
-    parsed_activities: list = []
-    # for each activity
-    for activity in activities:
-        # create timestamp from the local start date
-        timestamp = pd.to_datetime(activity.get("start_date_local"))
-        elements: dict = {"id": activity.get("id"),
-                          "name": activity.get("name"),
-                          "sport_type": activity.get("sport_type"),
-                          "polyline": activity.get("map", {}
-                                                   ).get("summary_polyline"),
-                          "timestamp": timestamp,
-                          "year": timestamp.year,
-                          "week": timestamp.week,
-                          "calender-week":
-                              f"{timestamp.year}-{timestamp.week}",
-                          "date": timestamp.date(),
-                          "weekday": timestamp.weekday(),
-                          "time": timestamp.time(),
-                          "hour": timestamp.hour,
-                          "minutes": timestamp.minute,
-                          }
-        # unpack the starting coordinates to lat and lon
-        elements.update(dict(zip(
-            # keys
-            ["lat", "lon"],
-            # values
-            activity.get("start_latlng",
-                         [None, None]
-                         )
-                                 )
-                             )
-                        )
-        # if there is a polyline for the activity add the individual
-        # coordinates to the activity and lookup the country name
-        if elements.get("polyline"):
-            elements.update({"coords":
-                             polyline.decode(
-                                 # make a raw string from the polyline
-                                 expression=fr"{elements.get('polyline')}",
-                                 # precision which is 5 for Google Maps
-                                 precision=5
-                                             ),
-                             "country":
-                             # provide the function with the coordinates of the
-                             # activity as an unpacked tuple of the coordinates
-                             # after mapping a rounding to 1 decimal and
-                             # filling the strings to the length
-                             # locate_country(*tuple(map(lambda x:
-                             #                           # round the string to 1
-                             #                           # decimal and store it
-                             #                           (s := str(round(x, 1))
-                             #                            ).ljust(
-                             #                            # fill out the string
-                             #                            # to the length of the
-                             #                            # rounded string plus 2
-                             #                            # characters
-                             #                            len(s.split(".")[0])+2,
-                             #                            # fill character
-                             #                            "0"
-                             #                                     ),
-                             #                            [elements.get("lat"),
-                             #                             elements.get("lon")]
-                             #                            )
-                             #                    )
-                             #                 )
-                             "Poland"
-                             }
-                            )
-        parsed_activities.append(elements)
-    # create a dataframe from the dictionary
-    dataframe: pd.DataFrame = pd.DataFrame(parsed_activities)
-    # add the label Strava to each activity
-    dataframe["app"]: pd.Series = "Strava"
-    return dataframe
+    # extract the raw fields column by column
+    polylines: list = [(activity.get("map") or {}).get("summary_polyline")
+                       for activity in activities]
+    # unpack the starting coordinates to lat and lon
+    start: np.ndarray = np.array(
+        [latlng if latlng and len(latlng) == 2 else (np.nan, np.nan)
+         for activity in activities
+         for latlng in [activity.get("start_latlng")]],
+        dtype=float
+                                 ).reshape(-1, 2)
+    # create the timestamps from the local start dates at once
+    timestamp: pd.Series = pd.Series(pd.to_datetime(
+        [activity.get("start_date_local") for activity in activities],
+        format="ISO8601",
+        utc=True
+                                                    ))
+    year: pd.Series = timestamp.dt.year
+    week: pd.Series = timestamp.dt.isocalendar().week.astype("int32")
+    dataframe: pd.DataFrame = pd.DataFrame({
+        "id": [activity.get("id") for activity in activities],
+        "name": [activity.get("name") for activity in activities],
+        "sport_type": [activity.get("sport_type") for activity in activities],
+        "polyline": polylines,
+        "timestamp": timestamp,
+        "year": year,
+        "week": week,
+        "calender-week": year.astype(str) + "-" + week.astype(str),
+        "date": timestamp.dt.tz_localize(None).dt.normalize(),
+        "weekday": timestamp.dt.weekday,
+        "time": pd.Timestamp(0) + (timestamp - timestamp.dt.normalize()),
+        "hour": timestamp.dt.hour,
+        "minutes": timestamp.dt.minute,
+        "lat": start[:, 0],
+        "lon": start[:, 1],
+        "country": backend.locate_countries(start[:, 0], start[:, 1]),
+        # add the label Strava to each activity
+        "app": "Strava"
+                                            })
+    return apply_schema(dataframe)
+
+
+def apply_schema(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast the columns of the activities to the compact dtypes of STRAVA_DTYPES,
+    categories for the repeated strings, small integers and datetimes for the
+    date and the time of day. The categories of combined tables are merged
+    again.
+
+    Parameters
+    ----------
+    dataframe : pd.DataFrame
+        The activities.
+
+    Returns
+    -------
+    pd.DataFrame
+        The activities with the compact dtypes, the input is not changed.
+
+    """
+    columns: dict[str, pd.Series] = {}
+    for column, dtype in backend.STRAVA_DTYPES.items():
+        if column not in dataframe or dataframe[column].dtype == dtype:
+            continue
+        series: pd.Series = dataframe[column]
+        if column == "timestamp":
+            columns[column] = pd.to_datetime(series, utc=True)
+        else:
+            columns[column] = series.astype(dtype)
+    return dataframe.assign(**columns)
 
 
 if __name__ == "__main__":
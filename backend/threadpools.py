@@ -7,6 +7,11 @@ The two threadpools used in the app and the worker functions.
 
 # Standard library
 import concurrent.futures as c_futures
+import contextlib
+import datetime as dt
+import functools
+import logging
+import math
 import queue
 import threading
 import time
@@ -18,102 +23,662 @@ import streamlit as st
 # Local imports
 import backend
 
+LOGGER: logging.Logger = logging.getLogger(__name__)
 
-def get_activities_page(queue_in: queue.Queue,
-                        queue_out: queue.Queue,
-                        barrier: threading.Barrier,
-                        access_token: str) -> None:
+
+class FetchError(Exception):
     """
-    Function for worker group 1 to retreive one page at a time until the
-    response length is zero or the input is None.
+    The retrieval of the activities failed. The activities parsed before the
+    failure are kept in partial.
 
     Parameters
     ----------
+    message : str
+        The description of the failure.
+    partial : pd.DataFrame, optional
+        The activities parsed before the failure. The default is None.
+
+    """
+
+    def __init__(self,
+                 message: str,
+                 partial: pd.DataFrame = None) -> None:
+        super().__init__(message)
+        self.partial: pd.DataFrame = partial
+
+
+class Stage:
+    """
+    The bookkeeping of a group of workers: the queue feeding it, the amount of
+    workers still running and the time spent working, to report the queue
+    depth and utilisation of the stage.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage.
+    workers : int
+        The amount of workers in the stage.
     queue_in : queue.Queue
-        The queue providing the request_page_num.
+        The queue feeding the stage.
+
+    """
+
+    def __init__(self,
+                 name: str,
+                 workers: int,
+                 queue_in: queue.Queue) -> None:
+        self.name: str = name
+        self.workers: int = workers
+        self.running: int = workers
+        self.queue_in: queue.Queue = queue_in
+        self.items: int = 0
+        self.busy: float = 0.
+        self.max_depth: int = 0
+        self.cancelled: int = 0
+        self.last_page: float = math.inf
+        self.started: float = time.perf_counter()
+        self._lock: threading.Lock = threading.Lock()
+
+    def get(self, stop: threading.Event) -> typing.Any:
+        """
+        Read the next item from the queue feeding the stage.
+
+        Parameters
+        ----------
+        stop : threading.Event
+            The signal to stop the pipeline.
+
+        Returns
+        -------
+        typing.Any
+            The item or None when the stage has to shut down.
+
+        """
+        return _get(self.queue_in, stop)
+
+    def record(self, seconds: float) -> None:
+        """
+        Record the time spent on one item.
+
+        Parameters
+        ----------
+        seconds : float
+            The time spent working.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            self.items += 1
+            self.busy += seconds
+            self.max_depth = max(self.max_depth, self.queue_in.qsize())
+
+    def finish(self) -> bool:
+        """
+        Sign off a worker of the stage.
+
+        Returns
+        -------
+        bool
+            Whether it was the last worker running.
+
+        """
+        with self._lock:
+            self.running -= 1
+            return self.running == 0
+
+    def report(self) -> dict:
+        """
+        Report the load of the stage.
+
+        Returns
+        -------
+        dict
+            The amount of workers, items and cancelled items, the current and
+            maximum queue depth and the fraction of time the workers were
+            busy.
+
+        """
+        elapsed: float = time.perf_counter() - self.started
+        return {"workers": self.workers,
+                "items": self.items,
+                "cancelled": self.cancelled,
+                "queue depth": self.queue_in.qsize(),
+                "max queue depth": self.max_depth,
+                "utilisation": self.busy / (self.workers * elapsed)
+                if elapsed > 0 else 0.}
+
+
+def _get(queue_in: queue.Queue,
+         stop: threading.Event,
+         cancel: threading.Event = None) -> typing.Any:
+    """
+    Read the next item from a queue, waiting until the pipeline stops.
+
+    Parameters
+    ----------
+    queue_in : queue.Queue
+        The queue.
+    stop : threading.Event
+        The signal to stop the pipeline.
+    cancel : threading.Event, optional
+        The signal of the caller to cancel the pipeline. The default is None.
+
+    Returns
+    -------
+    typing.Any
+        The item or None when the pipeline stops.
+
+    """
+    while not stop.is_set() and not (cancel is not None and cancel.is_set()):
+        try:
+            return queue_in.get(timeout=.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _put(queue_out: queue.Queue,
+         item: typing.Any,
+         stop: threading.Event) -> bool:
+    """
+    Put an item on a bounded queue, waiting for room until the pipeline stops.
+
+    Parameters
+    ----------
     queue_out : queue.Queue
-        The queue receiving the retrieved page.
-    barrier : threading.Barrier
-        Barrier object to make all workers wait to complete execution.
+        The bounded queue.
+    item : typing.Any
+        The item.
+    stop : threading.Event
+        The signal to stop the pipeline.
+
+    Returns
+    -------
+    bool
+        Whether the item was put on the queue.
+
+    """
+    while not stop.is_set():
+        try:
+            queue_out.put(item, timeout=.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _end_pages(stage: Stage,
+               exhausted: threading.Event,
+               page_num: int) -> None:
+    """
+    Mark a page as the last page, no pages after it are requested.
+
+    Parameters
+    ----------
+    stage : Stage
+        The bookkeeping of group 1.
+    exhausted : threading.Event
+        The signal that the last page has been seen.
+    page_num : int
+        The page number of the short or empty page.
+
+    Returns
+    -------
+    None.
+
+    """
+    stage.last_page = min(stage.last_page, page_num)
+    exhausted.set()
+
+
+def get_page(access_token: str,
+             page: int,
+             per_page: int = 200,
+             params: dict = None,
+             cancel: threading.Event = None,
+             raw: bool = False) -> list[dict] | bytes | None:
+    """
+    Retrieve one page of activities within the rate limits.
+
+    Parameters
+    ----------
+    access_token : str
+        The Strava access token.
+    page : int
+        The page number.
+    per_page : int, optional
+        The amount of activities per page. The default is 200.
+    params : dict, optional
+        Additional query string elements such as after. The default is None.
+    cancel : threading.Event, optional
+        Stop waiting for the rate limit when it is set. The default is None.
+    raw : bool, optional
+        Return the json of the page without decoding it. The default is
+        False.
+
+    Raises
+    ------
+    FetchError
+        When the Strava API answers with an error.
+
+    Returns
+    -------
+    list[dict] | bytes | None
+        The activities on the page or the json when raw, None if the wait was
+        cancelled.
+
+    """
+    # wait for the turn of this session within the rate limits
+    if not backend.LIMITER.acquire(access_token, cancel=cancel):
+        return None
+    response: typing.Union[list[dict] | bytes | dict] = backend.get_request(
+        url=backend.ACTIVITIES_LINK,
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={**(params or {}),
+                "per_page": per_page,
+                "page": page},
+        raw=raw
+                                                                            )
+    if isinstance(response, dict):
+        raise FetchError(f"Page {page} could not be retrieved: {response}")
+    return response
+
+
+def get_activities_page(stage: Stage,
+                        queue_out: queue.Queue,
+                        access_token: str,
+                        in_flight: threading.Semaphore,
+                        exhausted: threading.Event,
+                        stop: threading.Event,
+                        errors: list,
+                        parse_workers: int,
+                        per_page: int = 200,
+                        params: dict = None,
+                        raw: bool = False) -> None:
+    """
+    Function for worker group 1 to retreive one page at a time until the input
+    is None. A page shorter than per_page marks the end of the activities.
+    The last worker to finish signals every worker of group 2 to stop.
+    The length of a raw page is only known once it is parsed, here only an
+    empty raw page marks the end.
+
+    The pages are passed on with their page number so the consumer can put
+    them back in order. The place of a page in the window is released here
+    only when it is not passed on.
+
+    Parameters
+    ----------
+    stage : Stage
+        The bookkeeping of group 1 with the queue providing the
+        request_page_num.
+    queue_out : queue.Queue
+        The bounded queue receiving the page number and the retrieved page.
     access_token : str
         The Strava access token.
+    in_flight : threading.Semaphore
+        The window of pages in flight.
+    exhausted : threading.Event
+        The signal that the last page has been seen.
+    stop : threading.Event
+        The signal to stop the pipeline.
+    errors : list
+        The list receiving the exception of a failed worker.
+    parse_workers : int
+        The amount of workers in group 2.
+    per_page : int, optional
+        The amount of activities per page. The default is 200.
+    params : dict, optional
+        Additional query string elements such as after. The default is None.
+    raw : bool, optional
+        Pass on the json of the pages without decoding it. The default is
+        False.
 
     Returns
     -------
     None.
 
     """
-    # loop forever until shutdown signal is given
-    while True:
-        # read item from queue
-        request_page_num: typing.Union[int | None] = queue_in.get()
-        # prepare header and param
-        header: dict = {"Authorization": f"Bearer {access_token}"}
-        param: dict = {"per_page": 50,
-                       "page": request_page_num}
-        # send get request for the desired page
-        response: typing.Union[list[dict] | dict] = backend.get_request(
-            url=backend.ACTIVITIES_LINK,
-            headers=header,
-            params=param
-                                                                        )
-        # check for shutdown
-        if request_page_num is None or len(response) == 0:
-            # put signal back on queue
-            queue_in.put(None)
-            # wait on the barrier for all other workers
-            barrier.wait()
-            # send signal on output queue
-            queue_out.put(None)
-            # stop processing
-            break
-        # push result onto queue
-        queue_out.put(response)
+    try:
+        # loop until shutdown signal is given
+        while (request_page_num := stage.get(stop)) is not None:
+            # drop the pages that were queued after the last page
+            if request_page_num > stage.last_page:
+                in_flight.release()
+                continue
+            start: float = time.perf_counter()
+            response: list[dict] | bytes = backend.get_page(access_token,
+                                                            request_page_num,
+                                                            per_page,
+                                                            params,
+                                                            stop,
+                                                            raw)
+            # the pipeline was stopped while waiting for the rate limit
+            if response is None:
+                stage.cancelled += 1
+                in_flight.release()
+                continue
+            stage.record(time.perf_counter() - start)
+            length: int = len(response) if not raw else\
+                0 if response.strip() in (b"", b"[]") else per_page
+            # a short or empty page ends the dispatch
+            if length < per_page:
+                _end_pages(stage, exhausted, request_page_num)
+            # push result onto queue and discard the empty overshoot pages
+            if length > 0:
+                _put(queue_out, (request_page_num, response), stop)
+            else:
+                in_flight.release()
+    except Exception as error:
+        # stop the pipeline and hand the error to the consumer
+        errors.append(error)
+        stop.set()
+    finally:
+        if stage.finish():
+            for _ in range(parse_workers):
+                _put(queue_out, None, stop)
 
 
-def parse_page(queue_in: queue.Queue,
+def parse_page(stage: Stage,
                queue_out: queue.Queue,
-               barrier: threading.Barrier) -> None:
+               stop: threading.Event,
+               errors: list,
+               parser: typing.Callable = None,
+               end: typing.Callable[[int], None] = None,
+               per_page: int = 200) -> None:
     """
     Function for worker group 2 to parse one page at a time until the input is
-    None or a dict which signals a propagated error message.
+    None. The last worker to finish signals the consumer.
 
     Parameters
     ----------
-    queue_in : queue.Queue
-        The queue providing the retrieved data.
+    stage : Stage
+        The bookkeeping of group 2 with the queue providing the page number
+        and the retrieved data.
     queue_out : queue.Queue
-        The queue receiving the parsed data.
-    barrier : threading.Barrier
-        Barrier object to make all workers wait to complete execution.
+        The bounded queue receiving the page number and the parsed data.
+    stop : threading.Event
+        The signal to stop the pipeline.
+    errors : list
+        The list receiving the exception of a failed worker.
+    parser : typing.Callable, optional
+        The function parsing a page. The default is None which uses parse.
+    end : typing.Callable[[int], None], optional
+        Called with the page number of a page shorter than per_page, for the
+        raw pages of which the length is only known here. The default is None.
+    per_page : int, optional
+        The amount of activities per page. The default is 200.
 
     Returns
     -------
     None
-        DESCRIPTION.
-
-    """
-    # loop forever until shutdown signal is given
-    while True:
-        # read item from queue
-        data: typing.Union[list[dict] | dict | None] = queue_in.get()
-        # check for shutdown
-        if data is None or isinstance(data, dict):
-            # put signal back on queue
-            queue_in.put(None)
-            # wait on the barrier for all other workers
-            barrier.wait()
-            # send signal on output queue
-            queue_out.put(data if isinstance(data, dict) else None)
-            # stop processing
+
+    """
+    parser = parser or backend.parse
+    try:
+        # loop until shutdown signal is given
+        while (item := stage.get(stop)) is not None:
+            page_num, data = item
+            start: float = time.perf_counter()
+            # parse the retrieved data
+            parsed_data: pd.DataFrame = parser(data)
+            stage.record(time.perf_counter() - start)
+            if end is not None and len(parsed_data) < per_page:
+                end(page_num)
+            # push result onto queue
+            _put(queue_out, (page_num, parsed_data), stop)
+    except Exception as error:
+        # stop the pipeline and hand the error to the consumer
+        errors.append(error)
+        stop.set()
+    finally:
+        if stage.finish():
+            _put(queue_out, None, stop)
+
+
+def dispatch_pages(queue_out: queue.Queue,
+                   in_flight: threading.Semaphore,
+                   exhausted: threading.Event,
+                   stop: threading.Event,
+                   fetch_workers: int,
+                   page_num: int = 1) -> None:
+    """
+    Push the page numbers to worker group 1 while there is room in the window
+    until the last page has been seen, then signal every worker to stop.
+
+    Parameters
+    ----------
+    queue_out : queue.Queue
+        The queue providing the request_page_num to worker group 1.
+    in_flight : threading.Semaphore
+        The window of pages in flight.
+    exhausted : threading.Event
+        The signal that the last page has been seen.
+    stop : threading.Event
+        The signal to stop the pipeline.
+    fetch_workers : int
+        The amount of workers in group 1.
+    page_num : int, optional
+        The first page to dispatch. The default is 1.
+
+    Returns
+    -------
+    None.
+
+    """
+    while not stop.is_set():
+        # wait for a place in the window
+        if not in_flight.acquire(timeout=.1):
+            continue
+        if exhausted.is_set():
             break
-        # parse the retrieved data
-        parsed_data: pd.DataFrame = backend.parse(data)
-        # push result onto queue
-        queue_out.put(parsed_data)
+        # get result from selected page number
+        _put(queue_out, page_num, stop)
+        page_num += 1
+    # signal that there is no more work
+    for _ in range(fetch_workers):
+        _put(queue_out, None, stop)
+
+
+def iter_get_and_parse(token: str,
+                       window: int = None,
+                       per_page: int = None,
+                       params: dict = None,
+                       stats: dict = None,
+                       cancel: threading.Event = None,
+                       processes: int = None
+                       ) -> typing.Iterator[pd.DataFrame]:
+    """
+    Use threading to speed up sending get requests and parse the responses,
+    yielding every parsed page as soon as it is ready. Without after in the
+    params the pages arrive with the most recent activities first.
+
+    The first page is retrieved and parsed directly to measure the fetch
+    latency and the parse cost, which size the worker groups: one fetch
+    worker per page in the window up to FETCH_WORKERS, and as many parse
+    workers as keep up with them up to PARSE_WORKERS. A short first page needs
+    no threads at all. The queues between the groups are bounded so a slow
+    consumer holds back the workers. With processes the fetch workers pass on
+    the raw json and every parse worker hands its pages to the process pool,
+    which parses them in parallel outside of the GIL.
+
+    The pages are yielded in the order of their page numbers. A window of
+    pages is kept between the page yielded last and the page requested last,
+    which bounds the pages held to put them in order. No new pages are
+    requested as soon as a worker receives a short or empty page, the consumer
+    stops or cancel is set. Cancelling drops the pages that were not requested
+    yet, ends the workers and ends the iteration without an error, so the
+    pages yielded so far can be kept to resume later. The amount of cancelled
+    requests is reported in the stats and logged.
+
+    Parameters
+    ----------
+    token : str
+        Strava access token.
+    window : int, optional
+        The amount of pages requested at the same time. The default is None
+        which uses PAGE_WINDOW.
+    per_page : int, optional
+        The amount of activities per page. The default is None which uses
+        PER_PAGE.
+    params : dict, optional
+        Additional query string elements such as after. The default is None.
+    stats : dict, optional
+        A dictionary receiving the measurements of the first page and the
+        report of each stage. The default is None.
+    cancel : threading.Event, optional
+        The signal to cancel the retrieval, such as the event of
+        session_cancel. The default is None.
+    processes : int, optional
+        The amount of processes parsing the pages, 0 parses them in threads.
+        The default is None which uses PARSE_PROCESSES.
+
+    Raises
+    ------
+    FetchError
+        When a worker fails, after the pages before the failure that were
+        parsed are yielded.
 
+    Yields
+    ------
+    pd.DataFrame
+        The parsed activities of a page.
 
-def thread_get_and_parse(token: str) -> pd.DataFrame:
+    """
+    window: int = window or backend.PAGE_WINDOW
+    per_page: int = per_page or backend.PER_PAGE
+    processes: int = backend.PARSE_PROCESSES if processes is None\
+        else processes
+    stats: dict = {} if stats is None else stats
+    # measure the fetch latency and parse cost on the first page
+    start: float = time.perf_counter()
+    first: list[dict] = backend.get_page(token, 1, per_page, params, cancel)
+    fetch_time: float = time.perf_counter() - start
+    if first is None:
+        return
+    parsed: pd.DataFrame = backend.parse(first) if first else None
+    parse_time: float = time.perf_counter() - start - fetch_time
+    stats.update({"probe": {"fetch seconds": fetch_time,
+                            "parse seconds": parse_time}})
+    if parsed is not None:
+        yield parsed
+    if len(first) < per_page:
+        return
+    # size the worker groups
+    worker_group_1: int = min(window, backend.FETCH_WORKERS)
+    worker_group_2: int = max(1, min(backend.PARSE_WORKERS,
+                                     math.ceil(worker_group_1 * parse_time /
+                                               max(fetch_time, 1e-3))))
+    if processes:
+        # a parse worker per process waits for the pool
+        worker_group_2 = processes
+        backend.get_process_pool(processes)
+    # one extra thread for the dispatch of the page numbers
+    total: int = worker_group_1 + worker_group_2 + 1
+    # create the shared bounded queues
+    task1_queue_in: queue.Queue = queue.Queue(maxsize=window)
+    task1_queue_out: queue.Queue = queue.Queue(maxsize=worker_group_2)
+    task2_queue_out: queue.Queue = queue.Queue(maxsize=worker_group_2)
+    stages: list[Stage] = [Stage("fetch", worker_group_1, task1_queue_in),
+                           Stage("parse", worker_group_2, task1_queue_out)]
+    # create the dispatch window, the end of pages and the stop signals
+    in_flight: threading.Semaphore = threading.Semaphore(window)
+    exhausted: threading.Event = threading.Event()
+    stop: threading.Event = threading.Event()
+    errors: list = []
+    try:
+        # create the thread pool
+        with c_futures.ThreadPoolExecutor(max_workers=total) as threadpool:
+            # issue get_activities_page to first group of workers
+            _ = [threadpool.submit(backend.get_activities_page,
+                                   stages[0],
+                                   task1_queue_out,
+                                   token,
+                                   in_flight,
+                                   exhausted,
+                                   stop,
+                                   errors,
+                                   worker_group_2,
+                                   per_page,
+                                   params,
+                                   bool(processes))
+                 for _ in range(worker_group_1)]
+            # issue parse_page to second group of workers
+            _ = [threadpool.submit(backend.parse_page,
+                                   stages[1],
+                                   task2_queue_out,
+                                   stop,
+                                   errors,
+                                   backend.parse_shared if processes
+                                   else backend.parse,
+                                   functools.partial(_end_pages,
+                                                     stages[0],
+                                                     exhausted)
+                                   if processes else None,
+                                   per_page)
+                 for _ in range(worker_group_2)]
+            # push work into first group while there is room in the window
+            _ = threadpool.submit(backend.dispatch_pages,
+                                  task1_queue_in,
+                                  in_flight,
+                                  exhausted,
+                                  stop,
+                                  worker_group_1,
+                                  2)
+            # add ScriptRunContext to threads
+            for thread in threadpool._threads:
+                st.runtime.scriptrunner.add_script_run_ctx(thread)
+            # the parsed pages that arrived before the pages preceding them
+            pending: dict[int, pd.DataFrame] = {}
+            next_page: int = 2
+            try:
+                # consume results
+                while (item := _get(task2_queue_out, stop, cancel)
+                       ) is not None:
+                    pending.update([item])
+                    while next_page in pending:
+                        yield pending.pop(next_page)
+                        next_page += 1
+                        # free a place in the window for the next page
+                        in_flight.release()
+                if errors:
+                    # hand over the pages that were parsed before the failure
+                    while not task2_queue_out.empty():
+                        if (item := task2_queue_out.get()) is not None:
+                            pending.update([item])
+                    while next_page in pending:
+                        yield pending.pop(next_page)
+                        next_page += 1
+                    raise FetchError(str(errors[0])) from errors[0]
+                if not stop.is_set() and not (cancel is not None and
+                                              cancel.is_set()):
+                    # pages after a gap, only when a page emptied meanwhile
+                    for page_num in sorted(pending):
+                        yield pending.pop(page_num)
+            finally:
+                # stop every worker when the consumer stops early, on a
+                # failure or when cancelled
+                stop.set()
+    finally:
+        # the pages that were dispatched but never requested
+        while not task1_queue_in.empty():
+            if task1_queue_in.get() is not None:
+                stages[0].cancelled += 1
+        stats.update({stage.name: stage.report() for stage in stages})
+        if stages[0].cancelled:
+            LOGGER.info("Cancelled %d page requests", stages[0].cancelled)
+
+
+def thread_get_and_parse(token: str,
+                         window: int = None,
+                         per_page: int = None,
+                         params: dict = None,
+                         stats: dict = None,
+                         cancel: threading.Event = None,
+                         processes: int = None) -> pd.DataFrame:
     """
     Use threading to speed up sending get requests and parse the responses.
 
@@ -121,6 +686,27 @@ def thread_get_and_parse(token: str) -> pd.DataFrame:
     ----------
     token : str
         Strava access token.
+    window : int, optional
+        The amount of pages requested at the same time. The default is None
+        which uses PAGE_WINDOW.
+    per_page : int, optional
+        The amount of activities per page. The default is None which uses
+        PER_PAGE.
+    params : dict, optional
+        Additional query string elements such as after. The default is None.
+    stats : dict, optional
+        A dictionary receiving the report of each stage. The default is None.
+    cancel : threading.Event, optional
+        The signal to cancel the retrieval, returning the activities retrieved
+        so far. The default is None.
+    processes : int, optional
+        The amount of processes parsing the pages, 0 parses them in threads.
+        The default is None which uses PARSE_PROCESSES.
+
+    Raises
+    ------
+    FetchError
+        When a worker fails, with the activities parsed before as partial.
 
     Returns
     -------
@@ -128,71 +714,293 @@ def thread_get_and_parse(token: str) -> pd.DataFrame:
         Table of all the retrieved activities.
 
     """
-    #
     results: list = []
-    page_num: int = 1
-    worker_group_1: int = 5
-    worker_group_2: int = 10
-    total: int = worker_group_1 + worker_group_2
-    # create the shared queues
-    task1_queue_in: queue.Queue = queue.Queue()
-    task1_queue_out: queue.Queue = queue.Queue()
-    task2_queue_out: queue.Queue = queue.Queue()
-    # create the barriers
-    barrier1: threading.Barrier = threading.Barrier(worker_group_1)
-    barrier2: threading.Barrier = threading.Barrier(worker_group_2)
-    # create the thread pool
-    with c_futures.ThreadPoolExecutor(max_workers=total) as threadpool:
-        # issue get_activities_page to first group of workers
-        _ = [threadpool.submit(backend.get_activities_page,
-                               task1_queue_in,
-                               task1_queue_out,
-                               barrier1,
-                               token)
-             for _ in range(worker_group_1)]
-        # issue parse_page to second group of workers
-        _ = [threadpool.submit(backend.parse_page,
-                               task1_queue_out,
-                               task2_queue_out,
-                               barrier2)
-             for _ in range(worker_group_2)]
-        # add ScriptRunContext to threads
-        for thread in threadpool._threads:
-            st.runtime.scriptrunner.add_script_run_ctx(thread)
-        # push work into first group
-        while True:
-            # get result from selected page number
-            task1_queue_in.put(page_num)
-            page_num += 1
-            # wait to give other workers time to provide response
-            time.sleep(1)
-            if None in task1_queue_in.queue:
-                # signal that there is no more work
-                task1_queue_in.put(None)
-                break
-        # consume results
-        while True:
-            # retrieve data
-            data: typing.Union[None | dict | pd.DataFrame] =\
-                task2_queue_out.get()
-            # check for the end of work
-            if data is None:
-                # stop processing
-                break
-            # <>
-            results.append(pd.DataFrame.from_dict(data,
-                                                  orient="index")
-                           if isinstance(data, dict) else data)
+    try:
+        for data in backend.iter_get_and_parse(token,
+                                               window,
+                                               per_page,
+                                               params,
+                                               stats,
+                                               cancel,
+                                               processes):
+            results.append(data)
+    except FetchError as error:
+        error.partial = combine_pages(results)
+        raise
+    total: pd.DataFrame = combine_pages(results)
+    return total
+
+
+def combine_pages(results: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Combine the parsed pages into one table sorted by the timestamp, with the
+    categories of the pages merged.
+
+    Parameters
+    ----------
+    results : list[pd.DataFrame]
+        The parsed pages.
+
+    Returns
+    -------
+    total : pd.DataFrame
+        Table of all the activities.
+
+    """
     total: pd.DataFrame = pd.DataFrame(columns=backend.STRAVA_COLS)\
         if not results else pd.concat(results,
                                       ignore_index=True)
+    total = backend.apply_schema(total)
     total.sort_values("timestamp",
                       inplace=True)
     return total
 
 
+def get_activities_window(access_token: str,
+                          after: int,
+                          before: int,
+                          page: int = 1,
+                          per_page: int = 200) -> tuple[list[dict], bool]:
+    """
+    Retrieve a page of activities started between after and before.
+
+    Parameters
+    ----------
+    access_token : str
+        The Strava access token.
+    after : int
+        The epoch timestamp after which the activities started.
+    before : int
+        The epoch timestamp before which the activities started.
+    page : int, optional
+        The page within the window. The default is 1.
+    per_page : int, optional
+        The amount of activities per page. The default is 200.
+
+    Raises
+    ------
+    FetchError
+        When the Strava API answers with an error, so the window is not taken
+        for an empty one.
+
+    Returns
+    -------
+    activities : list[dict]
+        The retrieved activities.
+    dense : bool
+        Whether the page was full so the window holds more activities.
+
+    """
+    # wait for the turn of this session within the rate limits
+    backend.LIMITER.acquire(access_token)
+    response: typing.Union[list[dict] | dict] = backend.get_request(
+        url=backend.ACTIVITIES_LINK,
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={"per_page": per_page,
+                "page": page,
+                "after": after,
+                "before": before}
+                                                                    )
+    if isinstance(response, dict):
+        raise FetchError(f"Page {page} of the window from {after} to {before} "
+                         f"could not be retrieved: {response}")
+    activities: list[dict] = response
+    dense: bool = len(activities) >= per_page
+    return activities, dense
+
+
+def thread_get_and_parse_windows(token: str,
+                                 created_at: str,
+                                 windows: int = None,
+                                 per_page: int = None,
+                                 min_span: int = 3600) -> pd.DataFrame:
+    """
+    Use threading to retrieve the activities in parallel time windows between
+    the profile creation date and now, and parse the responses.
+
+    A window that returns a full page is split in halves which are retrieved
+    again, so dense periods are divided until every window fits on one page.
+    A window shorter than min_span is paged through instead. The activities
+    are deduplicated by their id.
+
+    Parameters
+    ----------
+    token : str
+        Strava access token.
+    created_at : str
+        The Strava profile creation date.
+    windows : int, optional
+        The amount of windows the span is split into at the start. The default
+        is None which uses PAGE_WINDOW.
+    per_page : int, optional
+        The amount of activities per page. The default is None which uses
+        PER_PAGE.
+    min_span : int, optional
+        The smallest window in seconds that is still split. The default is
+        3600.
+
+    Raises
+    ------
+    FetchError
+        When a window could not be retrieved, the windows not started yet are
+        cancelled.
+
+    Returns
+    -------
+    total : pd.DataFrame
+        Table of all the retrieved activities.
+
+    """
+    windows: int = windows or backend.PAGE_WINDOW
+    per_page: int = per_page or backend.PER_PAGE
+    # span the windows from one day before the creation to one day from now
+    # as the timestamps of the activities are in local time
+    start: int = int(dt.datetime.strptime(created_at, backend.DT_FORMAT
+                                          ).replace(tzinfo=dt.timezone.utc
+                                                    ).timestamp()) - 86400
+    end: int = int(time.time()) + 86400
+    step: int = math.ceil((end - start) / windows)
+    activities: dict = {}
+    with c_futures.ThreadPoolExecutor(max_workers=backend.FETCH_WORKERS
+                                      ) as threadpool:
+        # issue the initial windows and remember the bounds of each future
+        pending: dict = {threadpool.submit(backend.get_activities_window,
+                                           token,
+                                           *bound,
+                                           per_page): bound
+                         # overlap the windows by a second like the halves
+                         for bound in [(after, min(after + step, end) + 1, 1)
+                                       for after in range(start, end, step)]
+                         }
+        while pending:
+            done, _ = c_futures.wait(pending,
+                                     return_when=c_futures.FIRST_COMPLETED)
+            for future in done:
+                after, before, page = pending.pop(future)
+                try:
+                    retrieved, dense = future.result()
+                except FetchError:
+                    # a missing window would leave a gap in the history
+                    threadpool.shutdown(wait=False, cancel_futures=True)
+                    raise
+                # merge and deduplicate the activities by id
+                activities.update({activity.get("id"): activity
+                                   for activity in retrieved})
+                if not dense:
+                    continue
+                if page == 1 and before - after > min_span:
+                    # split a dense window in halves, both bounds exclude
+                    # their second so the first half overlaps the second by
+                    # one to keep an activity that starts at the middle
+                    middle: int = (after + before) // 2
+                    bounds: list = [(after, middle + 1, 1),
+                                    (middle, before, 1)]
+                else:
+                    # page through a window that can not be split further
+                    bounds: list = [(after, before, page + 1)]
+                for bound in bounds:
+                    pending[threadpool.submit(backend.get_activities_window,
+                                              token,
+                                              *bound,
+                                              per_page)] = bound
+    total: pd.DataFrame = backend.apply_schema(
+        pd.DataFrame(columns=backend.STRAVA_COLS)
+                                               )\
+        if not activities else backend.parse(list(activities.values()))
+    total.sort_values("timestamp",
+                      inplace=True)
+    return total
+
+
+def fetch_activities(token: str,
+                     created_at: str = None,
+                     strategy: str = None,
+                     engine: str = None) -> pd.DataFrame:
+    """
+    Retrieve and parse all the activities with the selected strategy.
+
+    Parameters
+    ----------
+    token : str
+        Strava access token.
+    created_at : str, optional
+        The Strava profile creation date which is required for the "windows"
+        strategy. The default is None.
+    strategy : str, optional
+        Either "pages" to walk the pages or "windows" to split the history in
+        time windows. The default is None which uses FETCH_STRATEGY.
+    engine : str, optional
+        Either "threads" or "asyncio" which walks the pages in an event loop
+        when aiohttp is installed. The default is None which uses
+        FETCH_ENGINE.
+
+    Returns
+    -------
+    pd.DataFrame
+        Table of all the retrieved activities.
+
+    """
+    strategy: str = strategy or backend.FETCH_STRATEGY
+    engine: str = engine or backend.FETCH_ENGINE
+    if engine == "asyncio" and backend.AIOHTTP_AVAILABLE:
+        return backend.async_get_and_parse(token)
+    try:
+        dt.datetime.strptime(created_at or "", backend.DT_FORMAT)
+    except ValueError:
+        # the windows need a valid creation date to start from
+        strategy = "pages"
+    if strategy == "windows":
+        return thread_get_and_parse_windows(token, created_at)
+    return thread_get_and_parse(token)
+
+
+def iter_activities(token: str,
+                    created_at: str = None,
+                    cancel: threading.Event = None,
+                    strategy: str = None,
+                    engine: str = None) -> typing.Iterator[pd.DataFrame]:
+    """
+    Retrieve and parse all the activities with the selected strategy, as an
+    iterator of parsed pages. Only the pages strategy on threads yields the
+    pages as they arrive, the others retrieve the whole history before they
+    yield it as a single page and do not stop on cancel.
+
+    Parameters
+    ----------
+    token : str
+        Strava access token.
+    created_at : str, optional
+        The Strava profile creation date which is required for the "windows"
+        strategy. The default is None.
+    cancel : threading.Event, optional
+        The signal to cancel the retrieval of the pages. The default is None.
+    strategy : str, optional
+        Either "pages" or "windows". The default is None which uses
+        FETCH_STRATEGY.
+    engine : str, optional
+        Either "threads" or "asyncio". The default is None which uses
+        FETCH_ENGINE.
+
+    Yields
+    ------
+    pd.DataFrame
+        The parsed activities of a page.
+
+    """
+    strategy: str = strategy or backend.FETCH_STRATEGY
+    engine: str = engine or backend.FETCH_ENGINE
+    if strategy == "pages" and\
+            (engine != "asyncio" or not backend.AIOHTTP_AVAILABLE):
+        yield from iter_get_and_parse(token, cancel=cancel)
+    else:
+        yield fetch_activities(token, created_at, strategy, engine)
+
+
 def thread_create_figures(df: pd.DataFrame,
-                          creation: str) -> list[go.Figure]:
+                          creation: str,
+                          cancel: threading.Event = None,
+                          heatmap: bool = False,
+                          owner: int | str = None) -> list[go.Figure]:
     """
     Use threading to speed up creating the figures.
 
@@ -202,6 +1010,22 @@ def thread_create_figures(df: pd.DataFrame,
         Table of all the retrieved activities.
     creation : str
         Input for the vertical line in the days plot.
+    cancel : threading.Event, optional
+        The signal to stop waiting within a tenth of a second and drop the
+        figures that were not started yet. The figures being built can not be
+        interrupted, they finish in the background and are discarded. The
+        default is None.
+    heatmap : bool, optional
+        Show the density of the routes on the world map instead of a line per
+        activity. The default is False.
+    owner : int | str, optional
+        The athlete whose routes are decoded for the world map, who owns them
+        in the route store. The default is None.
+
+    Raises
+    ------
+    c_futures.CancelledError
+        When cancel is set before all figures are created.
 
     Returns
     -------
@@ -209,7 +1033,9 @@ def thread_create_figures(df: pd.DataFrame,
         List of all the plotly figures.
 
     """
-    with c_futures.ThreadPoolExecutor() as threadpool:
+    # not a context manager, which would wait for the running figures
+    threadpool: c_futures.ThreadPoolExecutor = c_futures.ThreadPoolExecutor()
+    try:
         figures: list = []
         futures: list = [threadpool.submit(backend.timeline,
                                            **{"original": df,
@@ -220,7 +1046,9 @@ def thread_create_figures(df: pd.DataFrame,
                                            )
                          ]
         for func, height in zip([backend.days,
-                                 backend.locations,
+                                 functools.partial(backend.locations,
+                                                   heatmap=heatmap,
+                                                   owner=owner),
                                  backend.types,
                                  backend.hours
                                  ],
@@ -236,10 +1064,64 @@ def thread_create_figures(df: pd.DataFrame,
                                                 }
                                              )
                            )
+        pending: set = set(futures)
+        while pending:
+            if cancel is not None and cancel.is_set():
+                raise c_futures.CancelledError("The figures were cancelled")
+            _, pending = c_futures.wait(pending, timeout=.1)
         for future in futures:
             figures.append(future.result())
+    finally:
+        threadpool.shutdown(wait=False, cancel_futures=True)
     return figures
 
 
+@contextlib.contextmanager
+def session_cancel(interval: float = .5) -> typing.Iterator[threading.Event]:
+    """
+    Provide an event that is set as soon as the Streamlit session running the
+    script disconnects, to cancel the work started for it. A rerun or stop of
+    the script interrupts the script itself, so the work is cancelled by
+    leaving the context.
+
+    Parameters
+    ----------
+    interval : float, optional
+        The seconds between the checks of the session. The default is .5.
+
+    Yields
+    ------
+    cancel : threading.Event
+        The signal to cancel the work of the session.
+
+    """
+    cancel: threading.Event = threading.Event()
+    ctx = st.runtime.scriptrunner.get_script_run_ctx(suppress_warning=True)
+    if ctx is None or not st.runtime.exists():
+        yield cancel
+        return
+    runtime = st.runtime.get_instance()
+    done: threading.Event = threading.Event()
+
+    def watch() -> None:
+        """
+        Set cancel once the session is no longer active.
+        """
+        while not done.wait(interval):
+            if not runtime.is_active_session(ctx.session_id):
+                cancel.set()
+                return
+
+    threading.Thread(target=watch,
+                     name="session-watch",
+                     daemon=True).start()
+    try:
+        yield cancel
+    finally:
+        # cancel whatever is still running when the script is interrupted
+        cancel.set()
+        done.set()
+
+
 if __name__ == "__main__":
     pass
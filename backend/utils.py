@@ -7,10 +7,231 @@ Helper functions for the activity mapper app.
 # Standard library
 import base64
 import collections
+import threading
+import typing
 # Third party
 import json
+import numpy as np
 import requests
 import urllib3
+try:
+    # optional faster json decoding of the responses
+    import orjson
+except ImportError:
+    orjson = None
+# Local imports
+import backend
+
+
+def json_loads(content: bytes) -> typing.Any:
+    """
+    Decode a json body, with orjson when it is installed.
+
+    Parameters
+    ----------
+    content : bytes
+        The body of the response.
+
+    Returns
+    -------
+    typing.Any
+        The decoded json.
+
+    """
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+
+class HTTPClient:
+    """
+    A long-lived, thread-safe HTTP client that keeps one connection pool per
+    host alive for the lifetime of the process, so the workers fetching pages,
+    the token exchange and the Nominatim lookups reuse their TCP and TLS
+    connections instead of performing a new handshake for every request.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        The maximum number of connections kept alive per host. The default is
+        10.
+    hosts : int, optional
+        The maximum number of hosts whose pools are kept. The default is 10.
+    retries : int, optional
+        The total number of retries per request. The default is 4.
+    backoff_factor : float, optional
+        The backoff factor between retries. The default is 1.
+
+    """
+
+    def __init__(self,
+                 pool_size: int = 10,
+                 hosts: int = 10,
+                 retries: int = 4,
+                 backoff_factor: float = 1) -> None:
+        # a single retry policy shared by all requests which waits for the
+        # amount of seconds given in the Retry-After header of a 429 or 503,
+        # only for the idempotent methods since a POST such as the exchange
+        # of the single-use authorization code must not be sent twice
+        self.retry: urllib3.Retry = urllib3.Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            allowed_methods=urllib3.Retry.DEFAULT_ALLOWED_METHODS,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+            # return the last response instead of raising when out of retries
+            raise_on_status=False
+                                                  )
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=hosts,
+                                                     pool_maxsize=pool_size,
+                                                     max_retries=self.retry)
+        self.session: requests.Session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    @staticmethod
+    def _to_dict(response: requests.Response,
+                 raw: bool = False) -> dict | bytes:
+        """
+        Decode the json body of the response or describe the error.
+
+        Parameters
+        ----------
+        response : requests.Response
+            The response of the request.
+        raw : bool, optional
+            Return the body without decoding it. The default is False.
+
+        Returns
+        -------
+        result : dict | bytes
+            The json response as a dictionary, or the body when raw, or a
+            dictionary with the status code and the reason.
+
+        """
+        result: dict = {}
+        if response.ok:
+            result = response.content if raw else json_loads(response.content)
+        else:
+            result.update({str(response.status_code): response.reason})
+        return result
+
+    def get(self,
+            url: str,
+            params: dict = None,
+            headers: dict = None,
+            timeout: int = 60,
+            raw: bool = False) -> dict | bytes:
+        """
+        Send a get request over the pooled connections.
+
+        Parameters
+        ----------
+        url : str
+            The requested url.
+        params : dict, optional
+            The query string elements. The default is None.
+        headers : dict, optional
+            The HTTP headers. The default is None.
+        timeout : int, optional
+            The amount of seconds before closing the connection. The default
+            is 60.
+        raw : bool, optional
+            Return the body of a successful response without decoding it. The
+            default is False.
+
+        Returns
+        -------
+        dict | bytes
+            The json response as a dictionary or an empty dictionary, the
+            body when raw.
+
+        """
+        response: requests.Response = self.session.get(url=url,
+                                                       params=params,
+                                                       headers=headers,
+                                                       timeout=timeout)
+        return self._to_dict(response, raw)
+
+    def post(self,
+             url: str,
+             data: dict = None,
+             timeout: int = 60) -> dict:
+        """
+        Send a post request over the pooled connections.
+
+        Parameters
+        ----------
+        url : str
+            The requested url.
+        data : dict, optional
+            The payload. The default is None.
+        timeout : int, optional
+            The amount of seconds before closing the connection. The default
+            is 60.
+
+        Returns
+        -------
+        dict
+            The json response as a dictionary or an empty dictionary.
+
+        """
+        response: requests.Response = self.session.post(url=url,
+                                                        data=data,
+                                                        timeout=timeout)
+        return self._to_dict(response)
+
+    def stats(self) -> dict:
+        """
+        Count the connections that were opened and the requests that reused an
+        already open connection, summed over all hosts.
+
+        Returns
+        -------
+        counters : dict
+            The number of requests, opened connections and reused connections.
+
+        """
+        pools = self.adapter.poolmanager.pools
+        requests_sent: int = 0
+        opened: int = 0
+        for key in pools.keys():
+            # a pool can be evicted between listing the keys and reading it
+            if (pool := pools.get(key)) is None:
+                continue
+            requests_sent += pool.num_requests
+            opened += pool.num_connections
+        counters: dict = {"requests": requests_sent,
+                          "opened": opened,
+                          "reused": requests_sent - opened}
+        return counters
+
+
+_CLIENT: HTTPClient = None
+_CLIENT_LOCK: threading.Lock = threading.Lock()
+
+
+def get_client() -> HTTPClient:
+    """
+    Get the process wide HTTP client, creating it on first use with a pool
+    sized to the number of requests in flight, the workers fetching pages or
+    the window of pages or time windows requested at the same time.
+
+    Returns
+    -------
+    HTTPClient
+        The shared HTTP client.
+
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = HTTPClient(pool_size=max(backend.FETCH_WORKERS,
+                                               backend.PAGE_WINDOW))
+            # feed the rate limit headers of every response to the scheduler
+            _CLIENT.session.hooks["response"].append(
+                lambda response, *args, **kwargs:
+                    backend.LIMITER.update(response.headers)
+                                                     )
+    return _CLIENT
 
 
 def post_request(url: str,
@@ -34,21 +255,17 @@ def post_request(url: str,
         The json response as a dictionary or an empty dictionary.
 
     """
-    result: dict = {}
-    response: requests.Response = requests.post(url=url,
-                                                data=data,
-                                                timeout=timeout)
-    if response.ok:
-        result: dict = response.json()
-    else:
-        result.update({str(response.status_code): response.reason})
+    result: dict = get_client().post(url=url,
+                                     data=data,
+                                     timeout=timeout)
     return result
 
 
 def get_request(url: str,
                 params: dict = None,
                 headers: dict = None,
-                timeout: int = 60) -> dict:
+                timeout: int = 60,
+                raw: bool = False) -> dict | bytes:
     """
     Wrapper for the get request that always returns a dictionary.
 
@@ -62,30 +279,22 @@ def get_request(url: str,
         The HTTP headers. The default is None.
     timeout : int, optional
         The amount of seconds before closing the connection. The default is 60.
+    raw : bool, optional
+        Return the body of a successful response without decoding it. The
+        default is False.
 
     Returns
     -------
-    dict
-        The json response as a dictionary or an empty dictionary.
+    dict | bytes
+        The json response as a dictionary or an empty dictionary, the body
+        when raw.
 
     """
-    result: dict = {}
-    session = requests.Session()
-    retry = urllib3.Retry(total=4,
-                          backoff_factor=1,
-                          allowed_methods=None,
-                          status_forcelist=[429, 500, 502, 503, 504]
-                          )
-    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
-    session.mount("https://", adapter)
-    response: requests.Response = session.get(url=url,
-                                              params=params,
-                                              headers=headers,
-                                              timeout=timeout)
-    if response.ok:
-        result: dict = response.json()
-    else:
-        result.update({str(response.status_code): response.reason})
+    result: dict | bytes = get_client().get(url=url,
+                                            params=params,
+                                            headers=headers,
+                                            timeout=timeout,
+                                            raw=raw)
     return result
 
 
@@ -206,7 +415,9 @@ def load_geojson(path: str) -> dict:
         # allow three retries to load geojson file
         for _ in range(3):
             try:
+                file.seek(0)
                 json_file: dict = json.load(file)
+                break
             # catch JSONDecodeError as it inherets from ValueError
             except ValueError:
                 json_file: dict = {}
@@ -214,42 +425,44 @@ def load_geojson(path: str) -> dict:
     return json_file
 
 
-def min2ang(time: int) -> float:
+def min2ang(time: int | np.ndarray) -> float | np.ndarray:
     """
-    Calculate the angle of the time in minutes for the polar plot.
+    Calculate the angle of the time in minutes for the polar plot, also for
+    an array of times at once.
 
     Parameters
     ----------
-    time : int
+    time : int | np.ndarray
         The time of the activity.
 
     Returns
     -------
-    angle: float
+    angle: float | np.ndarray
         The angle.
 
     """
     hour, minute = time//60, time % 60
-    angle: float = (hour * 15) % 360 + minute * 2.5
+    angle: float | np.ndarray = (hour * 15) % 360 + minute * 2.5
     return angle
 
 
-def hr2ang(hour: int) -> int:
+def hr2ang(hour: int | np.ndarray) -> int | np.ndarray:
     """
-    Calculate the angle of the time in hours for the polar plot.
+    Calculate the angle of the time in hours for the polar plot, also for an
+    array of hours at once.
 
     Parameters
     ----------
-    hour : int
+    hour : int | np.ndarray
         The hour of the activity.
 
     Returns
     -------
-    angle: float
+    angle: int | np.ndarray
         The angle.
 
     """
-    angle: int = (hour * 15) % 360
+    angle: int | np.ndarray = (hour * 15) % 360
     return angle
 
 
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+Tests of the charts that share the frame of the activities.
+"""
+# Third party
+import pandas as pd
+# Local imports
+import backend
+
+
+def _activities() -> pd.DataFrame:
+    """
+    Three activities, two of them in the same bin of 10 minutes.
+    """
+    return backend.apply_schema(pd.DataFrame({
+        "app": ["Strava"] * 3,
+        "name": ["Morning", "Morning again", "Evening"],
+        "time": pd.to_datetime(["1970-01-01 07:01", "1970-01-01 07:09",
+                                "1970-01-01 19:30"]),
+        "hour": [7, 7, 19],
+        "minutes": [1, 9, 30],
+        }))
+
+
+def test_hours_leaves_frame_unchanged() -> None:
+    data: pd.DataFrame = _activities()
+    expected: pd.DataFrame = data.copy()
+    backend.hours(data, backend.BOTTOM_ROW_HEIGHT)
+    pd.testing.assert_frame_equal(data, expected)
+
+
+def test_hours_stacks_a_bin() -> None:
+    clock = backend.hours(_activities(), backend.BOTTOM_ROW_HEIGHT)
+    points: list[tuple] = sorted(zip(clock.data[0].theta, clock.data[0].r))
+    assert [position for _, position in points] == [1, 2, 1]
+    assert points[0][0] == points[1][0] != points[2][0]
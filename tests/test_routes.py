@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+@author: QtyPython2020
+
+Tests of the bulk decoding of the encoded polylines against the polyline
+package, and of the route store keeping the decoded routes per athlete.
+"""
+# Third party
+import numpy as np
+import polyline
+import pytest
+# Local imports
+import backend
+
+ROUTE: list[tuple] = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+
+
+def _decoded(polylines: list) -> list[np.ndarray]:
+    """
+    Decode the polylines in bulk and split them per route.
+    """
+    coords, offsets = backend.decode_polylines(polylines)
+    assert len(offsets) == len(polylines) + 1
+    return backend.split_routes(coords, offsets)
+
+
+def _reference(line: str) -> np.ndarray:
+    """
+    Decode a polyline with the polyline package.
+    """
+    return np.array(polyline.decode(line, 5)).reshape(-1, 2)
+
+
+def test_matches_polyline() -> None:
+    lines: list[str] = [polyline.encode(ROUTE, 5),
+                        polyline.encode(ROUTE[::-1], 5)]
+    for route, line in zip(_decoded(lines), lines):
+        np.testing.assert_array_equal(route, _reference(line))
+
+
+def test_no_polylines() -> None:
+    coords, offsets = backend.decode_polylines([])
+    assert coords.shape == (0, 2)
+    np.testing.assert_array_equal(offsets, [0])
+
+
+@pytest.mark.parametrize("missing", ["", None])
+def test_missing_is_empty(missing: str | None) -> None:
+    line: str = polyline.encode(ROUTE, 5)
+    empty, route = _decoded([missing, line])
+    assert empty.shape == (0, 2)
+    np.testing.assert_array_equal(route, _reference(line))
+
+
+def test_single_point() -> None:
+    line: str = polyline.encode(ROUTE[:1], 5)
+    (route,) = _decoded([line])
+    np.testing.assert_array_equal(route, _reference(line))
+    assert route.shape == (1, 2)
+
+
+@pytest.mark.parametrize("malformed", [
+    # truncated in the middle of a value
+    polyline.encode(ROUTE, 5)[:-1],
+    # an odd amount of values, a latitude without longitude
+    polyline.encode(ROUTE, 5)[:5],
+    # characters outside of the alphabet
+    "_p~iF ~ps|U",
+    "_p~iF~ps|Ué",
+    ])
+def test_malformed_is_empty(malformed: str) -> None:
+    before: str = polyline.encode(ROUTE, 5)
+    after: str = polyline.encode(ROUTE[::-1], 5)
+    first, skipped, last = _decoded([before, malformed, after])
+    assert skipped.shape == (0, 2)
+    np.testing.assert_array_equal(first, _reference(before))
+    np.testing.assert_array_equal(last, _reference(after))
+
+
+def test_store_compacts_segments(tmp_path) -> None:
+    lines: list[str] = [polyline.encode([(index, index), (index, -index)], 5)
+                        for index in range(1, 41)]
+    store = backend.RouteStore(str(tmp_path), segments=3, points=1_000)
+    for start in range(0, len(lines), 5):
+        coords, offsets = backend.decode_polylines(lines[start:start + 5])
+        store.put_many(lines[start:start + 5], coords, offsets)
+    assert store.info()["segments"] <= 3
+    assert len(list(tmp_path.glob("*.index.npy"))) <= 3
+    # another process finds every route once
+    found: dict = backend.RouteStore(str(tmp_path)).get_many(lines)
+    for line in lines:
+        np.testing.assert_array_equal(found[line], _reference(line))
+
+
+def test_store_keeps_newest_points(tmp_path) -> None:
+    lines: list[str] = [polyline.encode([(index, index), (index, -index)], 5)
+                        for index in range(1, 41)]
+    store = backend.RouteStore(str(tmp_path), segments=1, points=20)
+    for start in range(0, len(lines), 10):
+        coords, offsets = backend.decode_polylines(lines[start:start + 10])
+        store.put_many(lines[start:start + 10], coords, offsets)
+    assert store.info()["points"] <= 20
+    assert set(store.get_many(lines)) == set(lines[-10:])
+
+
+def test_store_deletes_routes_of_owner(tmp_path) -> None:
+    lines: list[str] = [polyline.encode([(index, index), (index, -index)], 5)
+                        for index in range(1, 21)]
+    cache = backend.RouteCache(store=backend.RouteStore(str(tmp_path)))
+    cache.get_many(lines[:10], owner=1)
+    cache.get_many(lines[10:], owner=2)
+    cache.delete(1)
+    assert cache.info()["routes"] == 10
+    # another process only finds the routes of the other athlete
+    assert set(backend.RouteStore(str(tmp_path)).get_many(lines)) ==\
+        set(lines[10:])
+
+
+def test_store_expires_segments(tmp_path) -> None:
+    lines: list[str] = [polyline.encode([(index, index), (index, -index)], 5)
+                        for index in range(1, 11)]
+    store = backend.RouteStore(str(tmp_path))
+    coords, offsets = backend.decode_polylines(lines)
+    store.put_many(lines, coords, offsets, owner=1)
+    assert store.expire(1) == 0
+    assert store.expire(0) == 1
+    assert not list(tmp_path.glob("*.npy"))
+    assert not store.get_many(lines)